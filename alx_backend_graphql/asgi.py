@@ -14,3 +14,7 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_backend_graphql.settings')
 
 application = get_asgi_application()
+
+from crm.startup import preload_if_enabled  # noqa: E402
+
+preload_if_enabled()
@@ -1,9 +1,9 @@
 from django.contrib import admin
 from django.urls import path
-from graphene_django.views import GraphQLView
+from crm.views import CRMGraphQLView
 from django.views.decorators.csrf import csrf_exempt
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('graphql', csrf_exempt(GraphQLView.as_view(graphiql=True))),
+    path('graphql', csrf_exempt(CRMGraphQLView.as_view(graphiql=True))),
 ]
@@ -1,5 +1,5 @@
 import django_filters
-from .models import Customer, Product, Order
+from .models import Customer, Product, Order, LOW_STOCK_THRESHOLD
 
 
 class CustomerFilter(django_filters.FilterSet):
@@ -24,14 +24,17 @@ class ProductFilter(django_filters.FilterSet):
     price__lte = django_filters.NumberFilter(field_name="price", lookup_expr="lte")
     stock__gte = django_filters.NumberFilter(field_name="stock", lookup_expr="gte")
     stock__lte = django_filters.NumberFilter(field_name="stock", lookup_expr="lte")
+    low_stock = django_filters.BooleanFilter(method="filter_low_stock")
 
     class Meta:
         model = Product
-        fields = ["name", "price__gte", "price__lte", "stock__gte", "stock__lte"]
+        fields = ["name", "price__gte", "price__lte", "stock__gte", "stock__lte", "low_stock"]
 
-    @property
-    def low_stock(self):
-        return self.filter(stock__lt=10)
+    def filter_low_stock(self, queryset, name, value):
+        """Custom filter: stock below LOW_STOCK_THRESHOLD (true) or at least that (false)"""
+        if value:
+            return queryset.filter(stock__lt=LOW_STOCK_THRESHOLD).order_by("stock", "id")
+        return queryset.exclude(stock__lt=LOW_STOCK_THRESHOLD)
 
 
 class OrderFilter(django_filters.FilterSet):
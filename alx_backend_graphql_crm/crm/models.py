@@ -21,6 +21,9 @@ class Customer(models.Model):
     def __str__(self):
         return self.name
 
+# Products below this stock level are "low stock"
+LOW_STOCK_THRESHOLD = 10
+
 class Product(models.Model):
     name = models.CharField(max_length=255)
     price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0.01)])
@@ -48,7 +48,81 @@ INSTALLED_APPS = [
 
 # GraphQL schema path
 GRAPHENE = {
-    "SCHEMA": "alx_backend_graphql_crm.schema.schema"
+    "SCHEMA": "alx_backend_graphql.schema.schema",
+    "MIDDLEWARE": [
+        "crm.routers.DatabaseRoutingMiddleware",
+        "crm.slowlog.ResolverTimingMiddleware",
+        "crm.tracing.TracingMiddleware",
+    ],
+    # Largest page for connection fields (first/last) and for the limit of the
+    # plain list fields (crm/pagination.py)
+    "RELAY_CONNECTION_MAX_LIMIT": 100,
+}
+
+# Build the schema when the WSGI/ASGI app is loaded rather than on the first
+# request; workers forked after that (gunicorn --preload) share it. See crm/startup.py
+GRAPHQL_PRELOAD_SCHEMA = True
+
+# Per-client token buckets weighted by operation cost, plus a cap on concurrent
+# expensive operations per worker (crm/admission.py). None turns both off.
+GRAPHQL_ADMISSION = {
+    'RATE': 100,
+    'BURST': 1000,
+    'EXPENSIVE_COST': 300,
+    'MAX_CONCURRENT_EXPENSIVE': 4,
+    'MAX_QUEUED': 8,
+    'QUEUE_TIMEOUT': 1.0,
+    # X-Api-Key values that get a bucket of their own (comma-separated in the
+    # environment); requests with any other key are accounted to their address
+    'API_KEYS': [key for key in os.environ.get('GRAPHQL_API_KEYS', '').split(',') if key],
+}
+
+# Threads per process running background jobs (bulkCreateCustomers(async: true)).
+# 0 leaves jobs queued in the database for `manage.py run_jobs` workers.
+CRM_JOB_WORKERS = 2
+
+# Seconds a mutation's idempotencyKey and stored result are kept
+CRM_IDEMPOTENCY_TTL = 24 * 60 * 60
+
+# Dotted path to the GraphQL response encoder (crm/encoders.py); None uses
+# orjson when it is installed and the standard library otherwise
+GRAPHQL_JSON_ENCODER = None
+
+# GET queries, persisted query hashes, ETags and gzip/brotli compression for the
+# GraphQL endpoint (crm/http_cache.py). None turns them off.
+GRAPHQL_HTTP_CACHE = {
+    'MAX_AGE': 30,
+    'COMPRESS_MIN_SIZE': 1024,
+    'PERSISTED_QUERIES': 1000,
+}
+
+# Orders older than this many days are moved to the archive tables by
+# `manage.py archive_orders` (crm/archive.py)
+CRM_ORDER_ARCHIVE_AFTER_DAYS = 365
+
+# Requests sending `X-GraphQL-Profile: <TOKEN>` are profiled (cProfile, SQL
+# timings, tracemalloc) into DIRECTORY (crm/profiling.py). No token, no profiling.
+GRAPHQL_PROFILING = {
+    'TOKEN': os.environ.get('GRAPHQL_PROFILING_TOKEN'),
+    'DIRECTORY': os.path.join(BASE_DIR, 'profiles'),
+}
+
+# Operations slower than THRESHOLD_MS are written as JSON lines, with their
+# SQL, resolver timings and query plans, to a rotating file. None turns the
+# log off. See crm/slowlog.py
+GRAPHQL_SLOW_LOG = {
+    'THRESHOLD_MS': 500,
+    'FILE': os.path.join(BASE_DIR, 'logs', 'slow_operations.jsonl'),
+}
+
+# Span tracing of requests, phases, resolvers, identity map batches and SQL.
+# EXPORTER is 'file' (one OTLP/JSON line per trace in FILE) or 'otlp' (POST
+# to an OTLP/HTTP collector at ENDPOINT); unset, tracing is off. See crm/tracing.py
+GRAPHQL_TRACING = {
+    'EXPORTER': os.environ.get('GRAPHQL_TRACING_EXPORTER'),
+    'FILE': os.path.join(BASE_DIR, 'logs', 'traces.jsonl'),
+    'ENDPOINT': os.environ.get('OTEL_EXPORTER_OTLP_TRACES_ENDPOINT', 'http://localhost:4318/v1/traces'),
+    'SAMPLE_RATE': float(os.environ.get('GRAPHQL_TRACING_SAMPLE_RATE', '1.0')),
 }
 
 MIDDLEWARE = [
@@ -94,6 +168,35 @@ DATABASES = {
 }
 
 
+# SQLite connection tuning, applied to every new connection by crm.sqlite.
+# WAL lets readers run alongside a writer; busy_timeout (ms) makes writers
+# wait for the lock instead of failing with "database is locked".
+SQLITE_PRAGMAS = {
+    'busy_timeout': 5000,
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'cache_size': -64000,  # negative = KiB, i.e. 64 MB
+    'mmap_size': 268435456,
+    'temp_store': 'memory',
+}
+
+# Atomic blocks take the write lock up front (BEGIN IMMEDIATE) so concurrent
+# writers wait on busy_timeout instead of failing on a lock upgrade.
+SQLITE_TRANSACTION_MODE = 'IMMEDIATE'
+
+# Optional read replica: set CRM_REPLICA_DB to a second SQLite file to try
+# the read/write routing locally. Query operations read from "replica",
+# mutations (and the rest of their request) use "default"; see crm/routers.py.
+if os.environ.get('CRM_REPLICA_DB'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['CRM_REPLICA_DB'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['crm.routers.ReadWriteRouter']
+
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
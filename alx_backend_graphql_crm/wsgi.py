@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_backend_graphql_crm.settings')
 
 application = get_wsgi_application()
+
+from crm.startup import preload_if_enabled  # noqa: E402
+
+preload_if_enabled()
@@ -0,0 +1,310 @@
+"""
+Admission control for the GraphQL endpoint.
+
+Each request is given a static cost from its document: every object a
+query can return counts one, multiplied through list fields by their page
+size (``first``/``last``/``n``) or by an assumed size for unbounded lists.
+Mutation fields cost a fixed amount on top, and each ``__schema`` or
+``__type`` field costs ``INTROSPECTION_COST``.
+
+Two limits apply, both per worker process:
+
+* a token bucket per client (the authenticated user, else an ``X-Api-Key``
+  listed in ``API_KEYS``, else the remote address) that refills at ``RATE`` cost units per second up to ``BURST``;
+* operations costing ``EXPENSIVE_COST`` or more share
+  ``MAX_CONCURRENT_EXPENSIVE`` slots, with at most ``MAX_QUEUED`` requests
+  waiting up to ``QUEUE_TIMEOUT`` seconds for one.
+
+Either limit answers straight away with a 429 and a ``Retry-After`` hint
+instead of letting requests pile up behind each other.
+"""
+import hmac
+import math
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+from django.conf import settings
+from django.http import JsonResponse
+from graphene_django.views import HttpError
+from graphql import (
+    FieldNode, FragmentDefinitionNode, FragmentSpreadNode, GraphQLError, GraphQLList, InlineFragmentNode,
+    OperationDefinitionNode, VariableNode, get_named_type, get_nullable_type, is_leaf_type, parse,
+)
+
+from .pagination import max_limit
+
+DEFAULTS = {
+    'RATE': 100,                  # cost units refilled per second, per client
+    'BURST': 1000,                # bucket size
+    'LIST_SIZE': 20,              # assumed length of lists without a size argument
+    'MUTATION_COST': 10,          # added per mutation field
+    'INTROSPECTION_COST': 100,    # per __schema/__type field executed (cache misses; hits cost MIN_COST)
+    'EXPENSIVE_COST': 300,        # operations at or above this need a concurrency slot
+    'MAX_CONCURRENT_EXPENSIVE': 4,
+    'MAX_QUEUED': 8,
+    'QUEUE_TIMEOUT': 1.0,         # seconds a queued request waits for a slot
+    'API_KEYS': (),               # X-Api-Key values given their own bucket; other keys are ignored
+}
+
+# Charged for requests answered without executing anything (cached introspection)
+MIN_COST = 1
+
+SIZE_ARGUMENTS = ('first', 'last', 'n', 'limit')
+
+# Root fields whose result is sized by the schema, not the data
+INTROSPECTION_FIELDS = ('__schema', '__type')
+
+# Buckets kept before idle (full) ones are dropped
+MAX_CLIENTS = 10000
+
+
+def get_config():
+    """The GRAPHQL_ADMISSION setting over DEFAULTS, or None when admission control is off."""
+    configured = getattr(settings, 'GRAPHQL_ADMISSION', {})
+    if configured is None:
+        return None
+    return {**DEFAULTS, **configured}
+
+
+@lru_cache(maxsize=256)
+def _parse(query):
+    return parse(query)
+
+
+def operation_cost(schema, query, variables=None, operation_name=None, list_size=DEFAULTS['LIST_SIZE'],
+                   mutation_cost=DEFAULTS['MUTATION_COST'], introspection_cost=DEFAULTS['INTROSPECTION_COST']):
+    """Static cost of the selected operation; raises GraphQLError for unparsable documents."""
+    document = _parse(query)
+    fragments = {d.name.value: d for d in document.definitions if isinstance(d, FragmentDefinitionNode)}
+    operations = [d for d in document.definitions if isinstance(d, OperationDefinitionNode)]
+    if operation_name:
+        operations = [op for op in operations if op.name and op.name.value == operation_name]
+    if not operations:
+        return 1
+    operation = operations[0]
+    root = schema.get_root_type(operation.operation)
+    if root is None:
+        return 1
+    variables = variables or {}
+
+    def size_of(field, type_):
+        for argument in field.arguments:
+            if argument.name.value in SIZE_ARGUMENTS:
+                value = argument.value
+                if isinstance(value, VariableNode):
+                    value = variables.get(value.name.value)
+                else:
+                    value = getattr(value, 'value', None)
+                try:
+                    return max(int(value), 0)
+                except (TypeError, ValueError):
+                    break
+        if get_named_type(type_).name.endswith('Connection'):
+            return max_limit()
+        if isinstance(get_nullable_type(type_), GraphQLList):
+            return list_size
+        return 1
+
+    # (fragment, at the root, type) -> cost; a fragment spread many times is costed once
+    fragment_costs = {}
+
+    def selection_cost(parent, selection_set, depth, expanding=frozenset()):
+        total = 0
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                if depth == 0 and selection.name.value in INTROSPECTION_FIELDS:
+                    total += introspection_cost
+                    continue
+                field = parent.fields.get(selection.name.value) if hasattr(parent, 'fields') else None
+                if field is None or is_leaf_type(get_named_type(field.type)):
+                    continue
+                children = selection_cost(get_named_type(field.type), selection.selection_set, depth + 1, expanding)
+                # Connection edges are already counted by the connection's page size
+                multiplier = 1 if selection.name.value == 'edges' else size_of(selection, field.type)
+                total += multiplier * (1 + children)
+                if depth == 0 and operation.operation.value == 'mutation':
+                    total += mutation_cost
+            elif isinstance(selection, InlineFragmentNode):
+                type_condition = selection.type_condition
+                target = schema.get_type(type_condition.name.value) if type_condition else parent
+                total += selection_cost(target or parent, selection.selection_set, depth, expanding)
+            elif isinstance(selection, FragmentSpreadNode):
+                name = selection.name.value
+                fragment = fragments.get(name)
+                # A fragment spread within itself costs nothing here; validation rejects the cycle
+                if fragment is not None and name not in expanding:
+                    target = schema.get_type(fragment.type_condition.name.value) or parent
+                    key = (name, depth == 0, target.name)
+                    if key not in fragment_costs:
+                        fragment_costs[key] = selection_cost(target, fragment.selection_set, depth, expanding | {name})
+                    total += fragment_costs[key]
+        return total
+
+    return max(1, selection_cost(root, operation.selection_set, 0))
+
+
+class TokenBuckets:
+    """Per-client token buckets, refilled lazily when a client is next seen."""
+
+    def __init__(self):
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def take(self, client, cost, rate, burst):
+        """Spend ``cost`` tokens. Returns (admitted, tokens left, seconds until admissible)."""
+        # An operation bigger than the bucket is admitted whenever the bucket is full
+        cost = min(cost, burst)
+        now = time.monotonic()
+        with self.lock:
+            if client not in self.buckets and len(self.buckets) >= MAX_CLIENTS:
+                self._prune(now, rate, burst)
+            tokens, last = self.buckets.get(client, (burst, now))
+            tokens = min(burst, tokens + (now - last) * rate)
+            if tokens >= cost:
+                self.buckets[client] = (tokens - cost, now)
+                return True, tokens - cost, 0
+            self.buckets[client] = (tokens, now)
+        return False, tokens, (cost - tokens) / rate
+
+    def _prune(self, now, rate, burst):
+        # Clients whose bucket has refilled completely are indistinguishable from new ones
+        self.buckets = {
+            client: (tokens, last) for client, (tokens, last) in self.buckets.items()
+            if tokens + (now - last) * rate < burst
+        }
+
+    def clear(self):
+        with self.lock:
+            self.buckets.clear()
+
+
+class ConcurrencyGate:
+    """At most ``limit`` holders at once and at most ``max_queued`` waiters; the rest are turned away."""
+
+    def __init__(self):
+        self.active = 0
+        self.waiting = 0
+        self.condition = threading.Condition()
+
+    def acquire(self, limit, max_queued, timeout):
+        with self.condition:
+            if self.active >= limit:
+                if self.waiting >= max_queued:
+                    return False
+                self.waiting += 1
+                try:
+                    if not self.condition.wait_for(lambda: self.active < limit, timeout):
+                        return False
+                finally:
+                    self.waiting -= 1
+            self.active += 1
+            return True
+
+    def release(self):
+        with self.condition:
+            self.active -= 1
+            self.condition.notify()
+
+    @contextmanager
+    def slot(self, limit, max_queued, timeout):
+        """Yields True with a slot held, or False if the queue was full or the wait timed out."""
+        acquired = self.acquire(limit, max_queued, timeout)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                self.release()
+
+
+buckets = TokenBuckets()
+gate = ConcurrencyGate()
+
+
+def valid_api_key(api_key):
+    """True if ``api_key`` is one of the configured ``API_KEYS``."""
+    keys = (getattr(settings, 'GRAPHQL_ADMISSION', None) or {}).get('API_KEYS', DEFAULTS['API_KEYS'])
+    # Compare every key in constant time rather than stopping at the first match
+    return bool(api_key) and sum(hmac.compare_digest(api_key.encode(), str(key).encode()) for key in keys) > 0
+
+
+def client_key(request):
+    """
+    The identity a request is accounted to: the authenticated user, else a
+    known API key, else the remote address. Unknown API keys are ignored, so
+    a client cannot get a fresh bucket by sending a new key.
+    """
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}"
+    api_key = request.headers.get('X-Api-Key')
+    if valid_api_key(api_key):
+        return f"key:{api_key}"
+    return f"ip:{request.META.get('REMOTE_ADDR', '')}"
+
+
+def too_many_requests(message, retry_after, **extensions):
+    retry_after = max(1, math.ceil(retry_after))
+    response = JsonResponse(
+        {'errors': [{'message': message, 'extensions': {'code': 'RATE_LIMITED', 'retryAfter': retry_after, **extensions}}]},
+        status=429,
+    )
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+def request_cost(view, request, config):
+    """Cost of the request's operation(s), or None for requests that execute nothing (e.g. GraphiQL pages)."""
+    data = view.parse_body(request)
+    if view.graphiql and view.can_display_graphiql(request, data):
+        return None
+    schema = view.schema.graphql_schema
+    total = 0
+    for entry in (data if view.batch else [data]):
+        query, variables, operation_name, _ = view.get_graphql_params(request, entry)
+        if not query:
+            continue
+        try:
+            total += operation_cost(
+                schema, query, variables, operation_name, config['LIST_SIZE'], config['MUTATION_COST'],
+                config['INTROSPECTION_COST'],
+            )
+        except GraphQLError:
+            # Rejected by the normal path without touching the database
+            total += 1
+    return total
+
+
+def admit(view, request, handler, cost=None):
+    """
+    Run ``handler()`` if the request is within its client's limits, else return a 429.
+
+    ``cost`` defaults to the cost of the request's operations.
+    """
+    config = get_config()
+    if config is None or request.method not in ('GET', 'POST'):
+        return handler()
+    if cost is None:
+        try:
+            cost = request_cost(view, request, config)
+        except HttpError:
+            # Malformed request: let GraphQLView produce its usual error
+            return handler()
+        if cost is None:
+            return handler()
+
+    admitted, remaining, retry_after = buckets.take(client_key(request), cost, config['RATE'], config['BURST'])
+    if not admitted:
+        return too_many_requests("Rate limit exceeded", retry_after, cost=cost)
+
+    if cost < config['EXPENSIVE_COST']:
+        response = handler()
+    else:
+        with gate.slot(config['MAX_CONCURRENT_EXPENSIVE'], config['MAX_QUEUED'], config['QUEUE_TIMEOUT']) as ok:
+            if not ok:
+                return too_many_requests("Too many expensive operations in progress", config['QUEUE_TIMEOUT'], cost=cost)
+            response = handler()
+    response['X-GraphQL-Cost'] = str(cost)
+    response['X-RateLimit-Remaining'] = str(int(remaining))
+    return response
@@ -1,6 +1,11 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class CrmConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'crm'
+
+    def ready(self):
+        from .sqlite import apply_pragmas
+        connection_created.connect(apply_pragmas, dispatch_uid='crm.sqlite.apply_pragmas')
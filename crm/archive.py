@@ -0,0 +1,107 @@
+"""
+Time-based archiving of old orders.
+
+``archive_orders()`` moves orders placed before a cutoff, with their
+product links, from ``crm_order`` into the ``crm_archivedorder`` tables,
+one chunk per transaction, so the hot tables (and their indexes) only
+hold recent orders and a large backlog never holds a long write lock.
+
+Readers use ``order_querysets()``: by default it only returns the hot
+table; when a date range overlaps the dates of archived orders, the
+archive's queryset comes too, and ``merge_by_id()`` streams the
+results of both in id order.
+"""
+import heapq
+from datetime import timedelta
+from operator import attrgetter
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ArchivedOrder, Order
+
+DEFAULT_ARCHIVE_AFTER_DAYS = 365
+
+
+def default_cutoff(now=None):
+    """Orders placed before this moment are due for the archive (``CRM_ORDER_ARCHIVE_AFTER_DAYS``)."""
+    days = getattr(settings, 'CRM_ORDER_ARCHIVE_AFTER_DAYS', DEFAULT_ARCHIVE_AFTER_DAYS)
+    return (now or timezone.now()) - timedelta(days=days)
+
+
+def archive_orders(before, chunk_size=1000, progress=None):
+    """
+    Move orders placed before ``before`` into the archive tables.
+
+    Each chunk of ``chunk_size`` orders is copied and deleted in its own
+    transaction, oldest ids first. ``progress(moved)`` is called after
+    every chunk. Returns the number of orders moved.
+    """
+    through = Order.products.through
+    archived_through = ArchivedOrder.products.through
+    moved = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                Order.objects.filter(order_date__lt=before)
+                .order_by('id')
+                .values('id', 'customer_id', 'total_amount', 'order_date')[:chunk_size]
+            )
+            if not rows:
+                break
+            ids = [row['id'] for row in rows]
+            ArchivedOrder.objects.bulk_create([ArchivedOrder(**row) for row in rows])
+            links = through.objects.filter(order_id__in=ids)
+            archived_through.objects.bulk_create([
+                archived_through(archivedorder_id=order_id, product_id=product_id)
+                for order_id, product_id in links.values_list('order_id', 'product_id')
+            ])
+            links.delete()
+            Order.objects.filter(id__in=ids).delete()
+        moved += len(rows)
+        if progress:
+            progress(moved)
+    return moved
+
+
+def reaches_archive(date_from=None, date_to=None):
+    """True if the archive holds orders placed between ``date_from`` and ``date_to`` (either may be open)."""
+    if date_from is None and date_to is None:
+        return False
+    archived = ArchivedOrder.objects.all()
+    if date_from is not None:
+        archived = archived.filter(order_date__gte=date_from)
+    if date_to is not None:
+        archived = archived.filter(order_date__lte=date_to)
+    return archived.exists()
+
+
+def order_querysets(date_from=None, date_to=None):
+    """
+    Querysets for the orders placed between ``date_from`` and ``date_to``.
+
+    Always the hot table; the archive only when the range overlaps it (no
+    range at all means recent orders, so only the hot table).
+    """
+    querysets = [Order.objects.all()]
+    if reaches_archive(date_from, date_to):
+        querysets.insert(0, ArchivedOrder.objects.all())
+    if date_from is not None:
+        querysets = [qs.filter(order_date__gte=date_from) for qs in querysets]
+    if date_to is not None:
+        querysets = [qs.filter(order_date__lte=date_to) for qs in querysets]
+    return querysets
+
+
+def merge_by_id(querysets, chunk_size=500):
+    """
+    Iterate over the rows of several querysets, each already in id order, in id order.
+
+    Ids are unique across the hot and archive tables. Rows are fetched
+    ``chunk_size`` at a time from each queryset.
+    """
+    iterators = [qs.iterator(chunk_size=chunk_size) for qs in querysets]
+    if len(iterators) == 1:
+        return iterators[0]
+    return heapq.merge(*iterators, key=attrgetter('id'))
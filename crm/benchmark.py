@@ -0,0 +1,333 @@
+"""
+Benchmark harness for the GraphQL API.
+
+Runs a fixed corpus of representative operations against the schema
+directly, the /graphql view through the Django test client, or a real HTTP
+server, at several concurrency levels. Reports latency percentiles,
+throughput and SQL statements per operation as JSON-friendly dicts.
+"""
+import json
+import os
+import random
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.db import connection, connections
+from django.conf import settings
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .models import Customer, Product, Order
+
+# name -> (document, variables factory). Factories get the benchmark fixture ids.
+CORPUS = {
+    'list_orders_with_products': (
+        """
+        query ListOrders {
+          orders { id totalAmount orderDate customer { name } products { name price } }
+        }
+        """,
+        None,
+    ),
+    'filtered_customers_page': (
+        """
+        query CustomerPage($name: String) {
+          allCustomers(first: 20, name: $name) {
+            edges { node { id name email ordersCount totalSpent } }
+          }
+        }
+        """,
+        lambda ids, rng: {'name': rng.choice('aeiou')},
+    ),
+    'products_page': (
+        """
+        query ProductPage {
+          allProducts(first: 50, priceGte: 10) { edges { node { id name price stock } } }
+        }
+        """,
+        None,
+    ),
+    'sales_dashboard': (
+        """
+        query Dashboard {
+          salesByDay { day ordersCount revenue }
+          topProducts(n: 10) { product { name } unitsSold revenue }
+          topCustomers(n: 10) { customer { name } revenue }
+        }
+        """,
+        None,
+    ),
+    'create_order': (
+        """
+        mutation CreateOrder($customerId: ID!, $productIds: [ID]!) {
+          createOrder(input: { customerId: $customerId, productIds: $productIds }) {
+            order { id totalAmount products { name } }
+          }
+        }
+        """,
+        lambda ids, rng: {
+            'customerId': str(rng.choice(ids['customers'])),
+            'productIds': [str(pk) for pk in rng.sample(ids['products'], 3)],
+        },
+    ),
+}
+
+
+@contextmanager
+def scratch_database(path=None):
+    """
+    Point the default database at a freshly migrated scratch SQLite file.
+
+    Reuses Django's test-database machinery, so the configured database is
+    restored (and the scratch file removed) on exit.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        connection.close()
+        connection.settings_dict['TEST'] = {
+            **connection.settings_dict.get('TEST', {}),
+            'NAME': path or os.path.join(tmp, 'scratch.sqlite3'),
+        }
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            yield
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def seed_fixture(customers=200, products=50, orders=1000, seed=0):
+    """Small deterministic dataset for benchmarks run on a scratch database."""
+    from .datagen import generate
+    from .rollups import rebuild_rollups
+    generate(customers, products, orders, seed=seed)
+    rebuild_rollups()
+
+
+def fixture_ids():
+    return {
+        'customers': list(Customer.objects.values_list('id', flat=True)),
+        'products': list(Product.objects.values_list('id', flat=True)),
+    }
+
+
+class SchemaTarget:
+    """Executes operations directly against the graphene schema."""
+    name = 'schema'
+
+    def __init__(self):
+        from alx_backend_graphql.schema import schema
+        self.schema = schema
+
+    def __call__(self, document, variables):
+        result = self.schema.execute(document, variables=variables)
+        return not result.errors
+
+
+class ViewTarget:
+    """Posts operations to the /graphql view through the Django test client (no sockets)."""
+    name = 'view'
+
+    def __init__(self, path='/graphql'):
+        self.path = path
+        self.local = threading.local()
+
+    def __call__(self, document, variables):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = Client(HTTP_HOST='localhost')
+        response = client.post(self.path, {'query': document, 'variables': variables}, content_type='application/json')
+        return response.status_code == 200 and 'errors' not in response.json()
+
+
+class HTTPTarget:
+    """Posts operations to a running server over HTTP."""
+    name = 'server'
+
+    def __init__(self, url):
+        self.url = url
+
+    def __call__(self, document, variables):
+        body = json.dumps({'query': document, 'variables': variables}).encode()
+        request = urllib.request.Request(self.url, data=body, headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request) as response:
+            return response.status == 200 and 'errors' not in json.loads(response.read())
+
+
+@contextmanager
+def local_server():
+    """Serve the project's WSGI application on an ephemeral localhost port; yields the /graphql URL."""
+    from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+    from django.core.wsgi import get_wsgi_application
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    server = ThreadedWSGIServer(('127.0.0.1', 0), QuietHandler, allow_reuse_address=False)
+    server.set_app(get_wsgi_application())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}/graphql"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def count_queries(document, variables):
+    from alx_backend_graphql.schema import schema
+    with CaptureQueriesContext(connection) as ctx:
+        schema.execute(document, variables=variables)
+    return len(ctx.captured_queries)
+
+
+def run_operation(target, name, concurrency, iterations, ids, seed=0):
+    """Run one corpus operation ``iterations`` times spread over ``concurrency`` threads."""
+    document, make_variables = CORPUS[name]
+    rng = random.Random(seed)
+    variables = [make_variables(ids, rng) if make_variables else None for _ in range(iterations)]
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def call(vars_):
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            ok = target(document, vars_)
+        except Exception:
+            ok = False
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            if not ok:
+                errors += 1
+
+    def worker(chunk):
+        try:
+            for vars_ in chunk:
+                call(vars_)
+        finally:
+            connections.close_all()
+
+    chunks = [variables[i::concurrency] for i in range(concurrency)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, chunks))
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'operation': name,
+        'concurrency': concurrency,
+        'iterations': iterations,
+        'errors': errors,
+        'throughput_per_sec': round(iterations / wall, 2),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 3),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(target, concurrency_levels, iterations, operations=None, seed=0):
+    ids = fixture_ids()
+    operations = operations or list(CORPUS)
+    rng = random.Random(seed)
+    sql_counts = {}
+    for name in operations:
+        document, make_variables = CORPUS[name]
+        sql_counts[name] = count_queries(document, make_variables(ids, rng) if make_variables else None)
+
+    results = []
+    for concurrency in concurrency_levels:
+        for name in operations:
+            row = run_operation(target, name, concurrency, iterations, ids, seed=seed)
+            row['sql_queries'] = sql_counts[name]
+            results.append(row)
+
+    return {
+        'revision': git_revision(),
+        'timestamp': timezone.now().isoformat(),
+        'target': target.name,
+        'rows': {
+            'customers': Customer.objects.count(),
+            'products': Product.objects.count(),
+            'orders': Order.objects.count(),
+        },
+        'results': results,
+    }
+
+
+def compare(baseline, current):
+    """Yield (current row, baseline row) pairs matched on operation and concurrency."""
+    before = {(r['operation'], r['concurrency']): r for r in baseline['results']}
+    for row in current['results']:
+        old = before.get((row['operation'], row['concurrency']))
+        if old:
+            yield row, old
+
+
+def serialization_benchmark(orders=10000, repeat=5, seed=0):
+    """
+    Time building and encoding the list_orders_with_products response for ``orders`` orders.
+
+    Runs on a scratch database. Reports the best of ``repeat`` runs for
+    schema execution and for each available JSON encoder, plus the size
+    of the encoded response. The list limit is raised to ``orders`` so the
+    whole table comes back in one response.
+    """
+    from alx_backend_graphql.schema import schema
+    from . import encoders
+    from .datagen import generate
+
+    document, _ = CORPUS['list_orders_with_products']
+    candidates = {'stdlib': encoders.stdlib_encode}
+    if encoders.orjson is not None:
+        candidates['orjson'] = encoders.orjson_encode
+
+    def best(fn):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - started)
+        return round(min(timings) * 1000, 2)
+
+    graphene = {**getattr(settings, 'GRAPHENE', {}), 'RELAY_CONNECTION_MAX_LIMIT': max(orders, 100)}
+    with scratch_database(), override_settings(GRAPHENE=graphene):
+        generate(customers=max(orders // 10, 1), products=200, orders=orders, seed=seed)
+        result = schema.execute(document)
+        assert not result.errors, result.errors
+        payload = {'data': result.data}
+        report = {
+            'revision': git_revision(),
+            'orders': orders,
+            'execute_ms': best(lambda: schema.execute(document)),
+            'encode_ms': {name: best(lambda encode=encode: encode(payload)) for name, encode in candidates.items()},
+            'bytes': len(encoders.encode(payload)),
+        }
+    return report
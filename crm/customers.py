@@ -0,0 +1,51 @@
+import re
+
+from django.db import IntegrityError, transaction
+
+from .models import Customer
+
+PHONE_RE = re.compile(r'^(\+\d{10,15}|\d{3}-\d{3}-\d{4})$')
+
+
+def create_customers(rows, chunk_size=500, progress=None):
+    """
+    Validate and insert customers, skipping the invalid ones.
+
+    ``rows`` are mappings with name, email and optional phone. Each chunk
+    costs one query for existing emails and one bulk insert. Returns
+    (created customers, error messages); ``progress(processed, created,
+    errors)`` is called after every chunk.
+    """
+    created = []
+    errors = []
+    seen = set()
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        existing = set(
+            Customer.objects.filter(email__in=[row['email'] for row in chunk]).values_list('email', flat=True)
+        )
+        batch = []
+        for i, row in enumerate(chunk, start=start + 1):
+            email, phone = row['email'], row.get('phone')
+            if email in existing or email in seen:
+                errors.append(f"Customer {i}: Email already exists: {email}")
+            elif phone and not PHONE_RE.match(phone):
+                errors.append(f"Customer {i}: Invalid phone format: {phone}")
+            else:
+                seen.add(email)
+                batch.append(Customer(name=row['name'], email=email, phone=phone))
+        try:
+            with transaction.atomic():
+                created.extend(Customer.objects.bulk_create(batch))
+        except IntegrityError:
+            # Someone else inserted one of these emails meanwhile; fall back to row by row
+            for customer in batch:
+                try:
+                    with transaction.atomic():
+                        customer.save()
+                    created.append(customer)
+                except IntegrityError as e:
+                    errors.append(f"Customer {customer.email}: {e}")
+        if progress:
+            progress(start + len(chunk), len(created), errors)
+    return created, errors
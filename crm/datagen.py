@@ -0,0 +1,204 @@
+"""
+Deterministic synthetic CRM data.
+
+Generates customers, products and orders with production-like skew: a few
+hot products take most of the sales (Zipf), a few heavy customers place
+most of the orders (Pareto), order sizes fall off quickly and order dates
+lean towards the recent end of the window. The same seed on an empty
+database always produces the same rows.
+
+Rows get explicit primary keys, so no ids need to be read back. Products
+go in with chunked bulk_create. Customers, orders and order/product links
+are far more numerous, so they use raw multi-row inserts; building the ORM
+insert SQL cost more than SQLite spent writing the rows.
+"""
+import itertools
+import math
+import random
+import time
+from datetime import timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import Customer, Product, Order
+
+FIRST_NAMES = [
+    "James", "Mary", "Robert", "Patricia", "John", "Jennifer", "Michael", "Linda", "David", "Elizabeth",
+    "William", "Barbara", "Richard", "Susan", "Joseph", "Jessica", "Thomas", "Sarah", "Amina", "Kwame",
+    "Wei", "Yuki", "Carlos", "Fatima", "Ivan", "Priya", "Olu", "Chloe", "Mateo", "Aisha",
+]
+LAST_NAMES = [
+    "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez", "Martinez",
+    "Okafor", "Mensah", "Chen", "Tanaka", "Kowalski", "Singh", "Haddad", "Nguyen", "Silva", "Mutua",
+]
+PRODUCT_ADJECTIVES = ["Basic", "Pro", "Ultra", "Mini", "Max", "Smart", "Eco", "Classic", "Portable", "Wireless"]
+PRODUCT_NOUNS = [
+    "Phone", "Laptop", "Tablet", "Monitor", "Keyboard", "Mouse", "Headset", "Speaker", "Camera", "Charger",
+    "Router", "Drive", "Watch", "Printer", "Cable", "Dock", "Lamp", "Chair", "Desk", "Backpack",
+]
+
+# Items per order: mostly one or two
+ORDER_SIZES = [1, 2, 3, 4, 5]
+ORDER_SIZE_WEIGHTS = [50, 25, 13, 8, 4]
+
+
+def _next_id(model):
+    return (model.objects.aggregate(m=Max('id'))['m'] or 0) + 1
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+class _Inserter:
+    """
+    Multi-row INSERTs for one table, straight through the DB-API cursor.
+
+    One statement carries as many rows as the backend allows parameters,
+    which cuts SQLite's per-statement overhead well below executemany's.
+    Skipping Django's cursor wrapper skips query logging under DEBUG and
+    the per-statement placeholder rewrite, both costly on statements this
+    long.
+    """
+
+    def __init__(self, cursor, model, columns):
+        qn = connection.ops.quote_name
+        param = '?' if connection.vendor == 'sqlite' else '%s'
+        self.cursor = cursor
+        self.prefix = f"INSERT INTO {qn(model._meta.db_table)} ({', '.join(qn(c) for c in columns)}) VALUES "
+        self.placeholder = f"({', '.join([param] * len(columns))})"
+        self.batch = (connection.features.max_query_params or 2000) // len(columns)
+        self.full_sql = self.sql(self.batch)
+
+    def sql(self, rows):
+        return self.prefix + ', '.join([self.placeholder] * rows)
+
+    def __call__(self, rows):
+        for start in range(0, len(rows), self.batch):
+            batch = rows[start:start + self.batch]
+            sql = self.full_sql if len(batch) == self.batch else self.sql(len(batch))
+            self.cursor.execute(sql, list(itertools.chain.from_iterable(batch)))
+
+
+def _datetime_adapter():
+    # SQLite's adapter boils down to str() for naive datetimes; skip its per-row checks
+    return str if connection.vendor == 'sqlite' else connection.ops.adapt_datetimefield_value
+
+
+def _order_chunks(rng, first_id, orders, batch_size, customer_ids, product_rows, latest, window):
+    """Yield (order rows, order/product link rows) for each chunk of new orders."""
+    # Popularity: Zipf over a shuffled product order, Pareto per customer
+    rng.shuffle(product_rows)
+    product_cum = list(itertools.accumulate(1 / rank ** 1.1 for rank in range(1, len(product_rows) + 1)))
+    customer_cum = list(itertools.accumulate(rng.paretovariate(1.2) for _ in customer_ids))
+    # Prices in cents, so order totals are plain int sums
+    cents = {product_id: int(price * 100) for product_id, price in product_rows}
+    product_ids = [product_id for product_id, _ in product_rows]
+    adapt_datetime = _datetime_adapter()
+    random_ = rng.random
+
+    for chunk in _chunks(range(first_id, first_id + orders), batch_size):
+        # Draw each chunk's random choices in bulk, then slice them per order
+        sizes = rng.choices(ORDER_SIZES, ORDER_SIZE_WEIGHTS, k=len(chunk))
+        buyers = rng.choices(customer_ids, cum_weights=customer_cum, k=len(chunk))
+        items = rng.choices(product_ids, cum_weights=product_cum, k=sum(sizes))
+        order_rows = []
+        links = []
+        offset = 0
+        for order_id, size, customer_id in zip(chunk, sizes, buyers):
+            picked = set(items[offset:offset + size])
+            offset += size
+            # Triangular with the mode at "now": recent days are busier than old ones
+            order_date = latest - timedelta(seconds=int(window * (1 - math.sqrt(random_()))))
+            total = Decimal(sum(cents[product_id] for product_id in picked)).scaleb(-2)
+            order_rows.append((order_id, customer_id, total, adapt_datetime(order_date)))
+            links.extend((order_id, product_id) for product_id in picked)
+        yield order_rows, links
+
+
+def generate(customers, products, orders, seed=0, days=730, batch_size=10000, progress=None):
+    """
+    Insert the requested number of customers, products and orders.
+
+    Orders go to existing customers/products as well as new ones, so the
+    command can also top up a database. ``progress(label, done, total)`` is
+    called after every chunk. Returns a dict of inserted row counts plus the
+    elapsed seconds.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    # Dates are generated as naive UTC so they skip per-row timezone conversion
+    latest = timezone.make_naive(now, dt_timezone.utc) if timezone.is_aware(now) else now
+    window = days * 86400
+    started = time.perf_counter()
+    counts = {'customers': 0, 'products': 0, 'orders': 0, 'order_products': 0}
+    progress = progress or (lambda label, done, total: None)
+    adapt_datetime = _datetime_adapter()
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        raw_cursor = connection.connection.cursor()
+        insert_customers = _Inserter(raw_cursor, Customer, ['id', 'name', 'email', 'phone', 'created_at'])
+        first_id = _next_id(Customer)
+        for chunk in _chunks(range(first_id, first_id + customers), batch_size):
+            insert_customers([
+                (
+                    i,
+                    f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                    f"customer{i}@example.com",
+                    f"+1{rng.randrange(10**9, 10**10)}" if rng.random() < 0.7 else None,
+                    # customers sign up a little before the order window opens, at the latest
+                    adapt_datetime(latest - timedelta(seconds=rng.randrange(window + 30 * 86400))),
+                )
+                for i in chunk
+            ])
+            counts['customers'] += len(chunk)
+            progress('customers', counts['customers'], customers)
+
+        first_id = _next_id(Product)
+        for chunk in _chunks(range(first_id, first_id + products), batch_size):
+            Product.objects.bulk_create(
+                [
+                    Product(
+                        id=i,
+                        name=f"{rng.choice(PRODUCT_ADJECTIVES)} {rng.choice(PRODUCT_NOUNS)} {i}",
+                        price=Decimal(str(round(min(max(rng.lognormvariate(3.5, 1.1), 1), 5000), 2))),
+                        # about one product in twenty is low on stock
+                        stock=rng.randrange(0, 10) if rng.random() < 0.05 else rng.randrange(10, 1000),
+                    )
+                    for i in chunk
+                ],
+                batch_size=batch_size,
+            )
+            counts['products'] += len(chunk)
+            progress('products', counts['products'], products)
+
+        if orders:
+            customer_ids = list(Customer.objects.order_by('id').values_list('id', flat=True))
+            product_rows = list(Product.objects.order_by('id').values_list('id', 'price'))
+            if not customer_ids or not product_rows:
+                raise ValueError("Orders need at least one customer and one product")
+
+            insert_orders = _Inserter(raw_cursor, Order, ['id', 'customer_id', 'total_amount', 'order_date'])
+            insert_links = _Inserter(raw_cursor, Order.products.through, ['order_id', 'product_id'])
+            chunks = _order_chunks(rng, _next_id(Order), orders, batch_size, customer_ids, product_rows, latest, window)
+            for order_rows, links in chunks:
+                insert_orders(order_rows)
+                insert_links(links)
+                counts['orders'] += len(order_rows)
+                counts['order_products'] += len(links)
+                progress('orders', counts['orders'], orders)
+
+        raw_cursor.close()
+
+        # Explicit ids bypass sequences on PostgreSQL & co.; move them past the new rows
+        for sql in connection.ops.sequence_reset_sql(no_style(), [Customer, Product, Order]):
+            cursor.execute(sql)
+
+    counts['seconds'] = round(time.perf_counter() - started, 3)
+    return counts
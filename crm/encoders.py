@@ -0,0 +1,59 @@
+"""
+JSON encoders for GraphQL responses.
+
+``GRAPHQL_JSON_ENCODER`` names a callable ``encode(data, pretty=False) ->
+str``. The default uses orjson when it is installed, falling back to the
+standard library. Both understand Decimal, datetime/date/time and UUID
+values, so resolvers may hand them over as they come from the models.
+"""
+import datetime
+import decimal
+import json
+import uuid
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def stdlib_encode(data, pretty=False):
+    if pretty:
+        return json.dumps(data, sort_keys=True, indent=2, separators=(',', ': '), default=_default)
+    return json.dumps(data, separators=(',', ':'), default=_default)
+
+
+def orjson_encode(data, pretty=False):
+    # orjson handles datetime and UUID natively; Decimal goes through _default
+    options = orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS if pretty else 0
+    return orjson.dumps(data, default=_default, option=options).decode()
+
+
+@lru_cache(maxsize=None)
+def _load(path):
+    return import_string(path)
+
+
+def get_encoder():
+    path = getattr(settings, 'GRAPHQL_JSON_ENCODER', None)
+    if path:
+        return _load(path)
+    return orjson_encode if orjson is not None else stdlib_encode
+
+
+def encode(data, pretty=False):
+    return get_encoder()(data, pretty=pretty)
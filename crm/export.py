@@ -0,0 +1,179 @@
+"""
+Bulk export of CRM data to compressed CSV and Parquet files.
+
+Each table is read with ``QuerySet.iterator(chunk_size)`` (a server-side
+cursor on PostgreSQL, chunked fetches on SQLite) and written one chunk at
+a time, so memory stays bounded by the chunk size whatever the table
+size. Tables are exported in parallel, one worker thread and database
+connection each.
+
+Orders and their line items include archived orders (see crm/archive.py).
+Parquet needs the optional ``pyarrow`` package; CSV is written with
+``gzip`` from the standard library.
+"""
+import csv
+import gzip
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from pathlib import Path
+
+from django.db import connection
+from django.db.models import Value
+
+from .models import ArchivedOrder, Customer, Order, Product
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover - optional dependency
+    pyarrow = None
+
+DEFAULT_CHUNK_SIZE = 10000
+
+# table -> (columns as (name, kind), function returning the querysets to read, in order)
+TABLES = {
+    'customers': (
+        [('id', 'int'), ('name', 'str'), ('email', 'str'), ('phone', 'str'), ('created_at', 'datetime')],
+        lambda: [Customer.objects.order_by('id').values_list('id', 'name', 'email', 'phone', 'created_at')],
+    ),
+    'products': (
+        [('id', 'int'), ('name', 'str'), ('price', 'decimal'), ('stock', 'int')],
+        lambda: [Product.objects.order_by('id').values_list('id', 'name', 'price', 'stock')],
+    ),
+    'orders': (
+        [('id', 'int'), ('customer_id', 'int'), ('total_amount', 'decimal'), ('order_date', 'datetime'),
+         ('archived', 'bool')],
+        lambda: [
+            model.objects.annotate(archived=Value(archived)).order_by('id')
+            .values_list('id', 'customer_id', 'total_amount', 'order_date', 'archived')
+            for model, archived in ((ArchivedOrder, True), (Order, False))
+        ],
+    ),
+    'order_items': (
+        [('order_id', 'int'), ('product_id', 'int'), ('unit_price', 'decimal')],
+        lambda: [
+            ArchivedOrder.products.through.objects.order_by('id')
+            .values_list('archivedorder_id', 'product_id', 'product__price'),
+            Order.products.through.objects.order_by('id').values_list('order_id', 'product_id', 'product__price'),
+        ],
+    ),
+}
+
+
+class CSVWriter:
+    extension = '.csv.gz'
+
+    def __init__(self, path, columns):
+        self.file = gzip.open(path, 'wt', newline='', encoding='utf-8', compresslevel=6)
+        self.writer = csv.writer(self.file)
+        self.writer.writerow([name for name, _ in columns])
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter:
+    extension = '.parquet'
+
+    def __init__(self, path, columns):
+        types = {
+            'int': pyarrow.int64(),
+            'str': pyarrow.string(),
+            'decimal': pyarrow.decimal128(14, 2),
+            'datetime': pyarrow.timestamp('us', tz='UTC'),
+            'bool': pyarrow.bool_(),
+        }
+        self.schema = pyarrow.schema([(name, types[kind]) for name, kind in columns])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema, compression='zstd')
+
+    def write(self, rows):
+        columns = list(zip(*rows))
+        self.writer.write_batch(pyarrow.record_batch(
+            [pyarrow.array(values, type=field.type) for values, field in zip(columns, self.schema)],
+            schema=self.schema,
+        ))
+
+    def close(self):
+        self.writer.close()
+
+
+WRITERS = {'csv': CSVWriter, 'parquet': ParquetWriter}
+
+
+def available_formats():
+    return [name for name in WRITERS if name != 'parquet' or pyarrow is not None]
+
+
+def export_table(table, directory, formats=('csv',), chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """
+    Write one table to ``directory`` in each of ``formats``.
+
+    Returns {'rows', 'seconds', 'files'}. ``progress(table, rows)`` is
+    called after every chunk.
+    """
+    columns, querysets = TABLES[table]
+    directory = Path(directory)
+    writers = [WRITERS[fmt](directory / f"{table}{WRITERS[fmt].extension}", columns) for fmt in formats]
+    started = time.perf_counter()
+    rows = 0
+    try:
+        for queryset in querysets():
+            iterator = queryset.iterator(chunk_size=chunk_size)
+            while chunk := list(islice(iterator, chunk_size)):
+                for writer in writers:
+                    writer.write(chunk)
+                rows += len(chunk)
+                if progress:
+                    progress(table, rows)
+    finally:
+        for writer in writers:
+            writer.close()
+    return {
+        'rows': rows,
+        'seconds': time.perf_counter() - started,
+        'files': [str(directory / f"{table}{WRITERS[fmt].extension}") for fmt in formats],
+    }
+
+
+def _export_in_thread(*args, **kwargs):
+    try:
+        return export_table(*args, **kwargs)
+    finally:
+        # Each worker thread opened its own connection
+        connection.close()
+
+
+def export(directory, tables=None, formats=('csv',), chunk_size=DEFAULT_CHUNK_SIZE, workers=4, progress=None):
+    """
+    Export ``tables`` (default: all) to ``directory``, ``workers`` tables at a time.
+
+    Returns {table: export_table() result}. With ``workers=1`` everything
+    runs in the calling thread (and inside its transaction, if any).
+    """
+    unknown = set(formats) - set(available_formats())
+    if unknown:
+        raise ValueError(f"Unavailable export format(s): {', '.join(sorted(unknown))} (Parquet needs pyarrow)")
+    tables = list(tables or TABLES)
+    Path(directory).mkdir(parents=True, exist_ok=True)
+    if progress:
+        # Chunks from several threads report through the same callback
+        lock = threading.Lock()
+        report = progress
+
+        def progress(table, rows):
+            with lock:
+                report(table, rows)
+
+    if workers <= 1:
+        return {table: export_table(table, directory, formats, chunk_size, progress) for table in tables}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='crm-export') as executor:
+        futures = {
+            table: executor.submit(_export_in_thread, table, directory, formats, chunk_size, progress)
+            for table in tables
+        }
+        return {table: future.result() for table, future in futures.items()}
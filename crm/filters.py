@@ -1,5 +1,98 @@
 import django_filters
-from .models import Customer, Product, Order
+from django import forms
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections
+from django.db.models import Exists, OuterRef, Q
+from django.db.models.constants import LOOKUP_SEP
+from django_filters.constants import EMPTY_VALUES
+
+from .models import Customer, Product, Order, LOW_STOCK_THRESHOLD
+from .nodes import database_ids
+
+
+def split_many_valued(model, field_name):
+    """
+    (path to the owner, many-valued relation field, rest) for a lookup path crossing one, else None.
+
+    ``products__name`` on Order gives ``('', <products>, 'name')``.
+    """
+    parts = field_name.split(LOOKUP_SEP)
+    opts = model._meta
+    for i, part in enumerate(parts):
+        try:
+            field = opts.get_field(part)
+        except FieldDoesNotExist:
+            return None
+        if not field.is_relation:
+            return None
+        if field.many_to_many or field.one_to_many:
+            return LOOKUP_SEP.join(parts[:i]), field, LOOKUP_SEP.join(parts[i + 1:])
+        opts = field.related_model._meta
+    return None
+
+
+def semi_join(model, field_name, lookup_expr, value, vendor):
+    """
+    Condition matching rows of ``model`` with a related row where ``<field_name>__<lookup_expr>=value``.
+
+    A join across a many-valued relation repeats the row once per matching
+    related row, which ``distinct()`` then has to undo; a semi-join matches
+    each row at most once. The subquery reads the M2M through table (or
+    the table holding the foreign key) directly. It is a correlated
+    ``EXISTS``, except on SQLite, which runs ``EXISTS`` once per outer row
+    but turns ``IN (SELECT ...)`` into a lookup set.
+    """
+    owner_path, field, rest = split_many_valued(model, field_name)
+    if field.many_to_many:
+        m2m = field if field.concrete else field.remote_field
+        related = m2m.remote_field.through._default_manager
+        if field.concrete:
+            back, target = m2m.m2m_field_name(), m2m.m2m_reverse_field_name()
+        else:
+            back, target = m2m.m2m_reverse_field_name(), m2m.m2m_field_name()
+        lookup = LOOKUP_SEP.join([target, rest or 'pk', lookup_expr])
+    else:
+        related = field.related_model._default_manager
+        back = field.field.name
+        lookup = LOOKUP_SEP.join([rest or 'pk', lookup_expr])
+    related = related.filter(**{lookup: value})
+    owner = owner_path or 'pk'
+    if vendor == 'sqlite':
+        return Q(**{f"{owner}{LOOKUP_SEP}in": related.filter(**{f"{back}{LOOKUP_SEP}isnull": False}).values(back)})
+    return Exists(related.filter(**{back: OuterRef(owner)}))
+
+
+class RelationFilterSet(django_filters.FilterSet):
+    """
+    FilterSet that filters across many-valued relations (M2M and reverse
+    foreign keys) with semi-joins instead of joins, so no row comes back
+    twice and counts stay right without DISTINCT.
+    """
+
+    def filter_queryset(self, queryset):
+        for name, value in self.form.cleaned_data.items():
+            f = self.filters[name]
+            if value in EMPTY_VALUES or f.method is not None \
+                    or split_many_valued(queryset.model, f.field_name) is None:
+                queryset = f.filter(queryset, value)
+                continue
+            condition = semi_join(queryset.model, f.field_name, f.lookup_expr, value, connections[queryset.db].vendor)
+            queryset = queryset.filter(~condition if f.exclude else condition)
+        return queryset
+
+
+class IDField(forms.CharField):
+    def to_python(self, value):
+        value = super().to_python(value)
+        if value in self.empty_values:
+            return None
+        return database_ids([value])[0]
+
+
+class IDFilter(django_filters.Filter):
+    """Matches a global ID or a database id."""
+    field_class = IDField
+
 
 class CustomerFilter(django_filters.FilterSet):
     name = django_filters.CharFilter(field_name="name", lookup_expr="icontains")
@@ -12,24 +105,43 @@ class CustomerFilter(django_filters.FilterSet):
         model = Customer
         fields = ['name', 'email', 'createdAtGte', 'createdAtLte', 'phonePattern']
 
+class TiebreakOrderingFilter(django_filters.OrderingFilter):
+    """OrderingFilter that ends every ordering with the primary key, so pages never overlap."""
+
+    def filter(self, qs, value):
+        qs = super().filter(qs, value)
+        if value in EMPTY_VALUES:
+            return qs
+        return qs.order_by(*qs.query.order_by, 'id')
+
+
 class ProductFilter(django_filters.FilterSet):
     price_gte = django_filters.NumberFilter(field_name="price", lookup_expr='gte')
     price_lte = django_filters.NumberFilter(field_name="price", lookup_expr='lte')
     stock_gte = django_filters.NumberFilter(field_name="stock", lookup_expr='gte')
     stock_lte = django_filters.NumberFilter(field_name="stock", lookup_expr='lte')
+    low_stock = django_filters.BooleanFilter(method='filter_low_stock')
+    # e.g. orderBy: "-unitsSold"; most sold and top revenue are served from indexes
+    order_by = TiebreakOrderingFilter(fields=('units_sold', 'revenue', 'price', 'stock', 'name'))
 
     class Meta:
         model = Product
-        fields = ['name', 'price_gte', 'price_lte', 'stock_gte', 'stock_lte']
+        fields = ['name', 'price_gte', 'price_lte', 'stock_gte', 'stock_lte', 'low_stock']
+
+    def filter_low_stock(self, queryset, name, value):
+        if value:
+            return queryset.low_stock()
+        return queryset.exclude(stock__lt=LOW_STOCK_THRESHOLD)
 
-class OrderFilter(django_filters.FilterSet):
+class OrderFilter(RelationFilterSet):
     total_amount_gte = django_filters.NumberFilter(field_name="total_amount", lookup_expr='gte')
     total_amount_lte = django_filters.NumberFilter(field_name="total_amount", lookup_expr='lte')
     order_date_gte = django_filters.DateFilter(field_name="order_date", lookup_expr='gte')
     order_date_lte = django_filters.DateFilter(field_name="order_date", lookup_expr='lte')
     customer_name = django_filters.CharFilter(field_name="customer__name", lookup_expr='icontains')
     product_name = django_filters.CharFilter(field_name="products__name", lookup_expr='icontains')
+    product_id = IDFilter(field_name="products__id")
 
     class Meta:
         model = Order
-        fields = ['total_amount_gte', 'total_amount_lte', 'order_date_gte', 'order_date_lte', 'customer_name', 'product_name']
+        fields = ['total_amount_gte', 'total_amount_lte', 'order_date_gte', 'order_date_lte', 'customer_name', 'product_name', 'product_id']
@@ -0,0 +1,215 @@
+"""
+HTTP caching for the GraphQL endpoint.
+
+Query operations can be sent with GET, so a reverse proxy in front of the
+server can cache them. To keep those URLs short, clients may use
+automatic persisted queries: a request carrying only
+``extensions={"persistedQuery": {"version": 1, "sha256Hash": ...}}``
+runs the query registered under that hash. An unknown hash answers
+``PersistedQueryNotFound`` and the client retries once with the full
+text, which registers it. Registered queries are kept per process.
+
+Every response then goes through ``finalize()``:
+
+* successful GET responses get a strong ETag (a hash of the body, per
+  content encoding) and ``Cache-Control: private, max-age=MAX_AGE``,
+  varying on the headers that identify the client: responses carry the
+  client's rate-limit headers and may depend on who asked, so only the
+  client's own cache may reuse them. Operations that poll for changes
+  (``job``) call ``no_store()`` instead. A matching ``If-None-Match``
+  gets a 304 without a body;
+* bodies of ``COMPRESS_MIN_SIZE`` bytes or more are compressed with
+  brotli (when the ``brotli`` package is installed) or gzip, whichever
+  the client accepts.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseNotModified
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
+from django.utils.text import compress_string
+from graphene_django.views import HttpError
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+DEFAULTS = {
+    'MAX_AGE': 0,                 # Cache-Control max-age of successful GET responses, in seconds
+    'COMPRESS_MIN_SIZE': 1024,    # smaller bodies are sent as they are
+    'PERSISTED_QUERIES': 1000,    # registered queries kept per process
+}
+
+# Set on the request by the view when an operation produced errors
+ERRORS_ATTRIBUTE = 'graphql_errors'
+# Set on the request by resolvers whose result must never be reused
+NO_STORE_ATTRIBUTE = 'graphql_no_store'
+
+# Request headers a response may depend on, besides the query itself
+CLIENT_HEADERS = ('Authorization', 'Cookie', 'X-Api-Key')
+
+
+def get_config():
+    """The GRAPHQL_HTTP_CACHE setting over DEFAULTS, or None when HTTP caching is off."""
+    configured = getattr(settings, 'GRAPHQL_HTTP_CACHE', {})
+    if configured is None:
+        return None
+    return {**DEFAULTS, **configured}
+
+
+class PersistedQueryError(HttpError):
+    def __init__(self, code, message, status=200):
+        self.code = code
+        response = HttpResponse(status=status) if status == 200 else HttpResponseBadRequest()
+        super().__init__(response, message)
+
+
+class PersistedQueries:
+    """Thread-safe LRU of sha256 hash -> query text."""
+
+    def __init__(self, max_entries=DEFAULTS['PERSISTED_QUERIES']):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, sha256_hash):
+        with self.lock:
+            query = self.entries.get(sha256_hash)
+            if query is not None:
+                self.entries.move_to_end(sha256_hash)
+            return query
+
+    def register(self, sha256_hash, query):
+        if hashlib.sha256(query.encode()).hexdigest() != sha256_hash:
+            raise PersistedQueryError('PERSISTED_QUERY_HASH_MISMATCH', "provided sha does not match query", status=400)
+        with self.lock:
+            self.entries[sha256_hash] = query
+            self.entries.move_to_end(sha256_hash)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+persisted_queries = PersistedQueries()
+
+
+def _persisted_hash(request, data):
+    extensions = request.GET.get('extensions') or (data.get('extensions') if isinstance(data, dict) else None)
+    if not extensions:
+        return None
+    if isinstance(extensions, str):
+        try:
+            extensions = json.loads(extensions)
+        except ValueError:
+            raise HttpError(HttpResponseBadRequest("Extensions are invalid JSON."))
+    persisted = extensions.get('persistedQuery') if isinstance(extensions, dict) else None
+    if not isinstance(persisted, dict):
+        return None
+    if persisted.get('version') != 1 or not isinstance(persisted.get('sha256Hash'), str):
+        raise PersistedQueryError('PERSISTED_QUERY_NOT_SUPPORTED', "Unsupported persisted query", status=400)
+    return persisted['sha256Hash']
+
+
+def resolve_query(request, data, query):
+    """The query text for the request: ``query`` itself, or the persisted query its hash names."""
+    config = get_config()
+    if config is None:
+        return query
+    sha256_hash = _persisted_hash(request, data)
+    if sha256_hash is None:
+        return query
+    persisted_queries.max_entries = config['PERSISTED_QUERIES']
+    if query:
+        persisted_queries.register(sha256_hash, query)
+        return query
+    query = persisted_queries.get(sha256_hash)
+    if query is None:
+        raise PersistedQueryError('PERSISTED_QUERY_NOT_FOUND', "PersistedQueryNotFound")
+    return query
+
+
+def _accepted_encodings(request):
+    accepted = set()
+    for item in request.headers.get('Accept-Encoding', '').split(','):
+        coding, _, params = item.strip().partition(';')
+        q = params.strip()
+        if q.startswith('q='):
+            try:
+                if float(q[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        if coding:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def _choose_encoding(request, response, config):
+    if response.streaming or response.has_header('Content-Encoding'):
+        return None
+    if len(response.content) < config['COMPRESS_MIN_SIZE']:
+        return None
+    accepted = _accepted_encodings(request)
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted or '*' in accepted:
+        return 'gzip'
+    return None
+
+
+def _compress(body, encoding):
+    if encoding == 'br':
+        # Quality 5 compresses JSON nearly as well as 11 at a fraction of the cost
+        return brotli.compress(body, quality=5)
+    return compress_string(body)
+
+
+def no_store(request):
+    """Keep the response to ``request`` out of every cache, e.g. for a field clients poll."""
+    if request is not None:
+        setattr(request, NO_STORE_ATTRIBUTE, True)
+
+
+def finalize(request, response):
+    """Add validators, cache headers and compression to a GraphQL response."""
+    config = get_config()
+    if config is None or response.status_code not in (200, 304) or response.streaming:
+        return response
+    patch_vary_headers(response, ('Accept-Encoding',))
+    if response.status_code == 304:
+        return response
+
+    encoding = _choose_encoding(request, response, config)
+    if request.method == 'GET':
+        # The ETag identifies the representation, so it differs per encoding
+        etag = response.get('ETag') or quote_etag(hashlib.sha256(response.content).hexdigest()[:32])
+        if encoding:
+            etag = quote_etag(etag.strip('"') + '-' + encoding)
+        if getattr(request, ERRORS_ATTRIBUTE, False) or getattr(request, NO_STORE_ATTRIBUTE, False):
+            patch_cache_control(response, no_store=True)
+        else:
+            patch_cache_control(response, private=True, max_age=config['MAX_AGE'])
+            patch_vary_headers(response, CLIENT_HEADERS)
+        if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+        if etag in if_none_match or '*' in if_none_match:
+            not_modified = HttpResponseNotModified()
+            for header in ('ETag', 'Cache-Control', 'Vary'):
+                if response.has_header(header):
+                    not_modified[header] = response[header]
+            not_modified['ETag'] = etag
+            return not_modified
+        response['ETag'] = etag
+
+    if encoding:
+        response.content = _compress(response.content, encoding)
+        response['Content-Encoding'] = encoding
+        response['Content-Length'] = str(len(response.content))
+    return response
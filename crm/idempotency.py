@@ -0,0 +1,134 @@
+"""
+Idempotency keys for mutations.
+
+A mutation decorated with ``@idempotent`` takes an optional
+``idempotencyKey`` argument. The first call with a key runs the mutation
+and, in the same transaction, stores its output fields: model instances
+as references, everything else as JSON. Calls repeating the key within
+``CRM_IDEMPOTENCY_TTL`` seconds get that stored output back, with the
+referenced rows re-read, and nothing is executed again. A repeated key
+with different arguments is an error, as is one whose stored rows have
+since been deleted.
+
+Keys belong to the client that sent them (``admission.client_key``), so
+one client can neither read nor block another's results. The (client,
+key, operation) triple is unique, so when two retries race, the loser
+rolls back its writes and also returns the winner's result.
+"""
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import IntegrityError, models
+from django.utils import timezone
+from graphql import GraphQLError
+
+from . import admission, identity
+from .models import IdempotencyKey
+
+DEFAULT_TTL = 24 * 60 * 60
+
+
+def client(info):
+    """The client an idempotency key belongs to; empty outside a request."""
+    return admission.client_key(info.context) if info.context is not None else ''
+
+
+def fingerprint(arguments):
+    return hashlib.sha256(json.dumps(arguments, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def dump(value):
+    if isinstance(value, models.Model):
+        return {'model': value._meta.label, 'pk': value.pk}
+    if isinstance(value, (list, tuple)):
+        return [dump(item) for item in value]
+    return value
+
+
+def load(value):
+    if isinstance(value, dict) and set(value) == {'model', 'pk'}:
+        model = apps.get_model(value['model'])
+        rows = identity.load(model, [value['pk']], queryset=model._default_manager.using('default'))
+        if value['pk'] not in rows:
+            raise model.DoesNotExist(f"{value['model']} {value['pk']} no longer exists")
+        return rows[value['pk']]
+    if isinstance(value, list):
+        refs = [item for item in value if isinstance(item, dict) and set(item) == {'model', 'pk'}]
+        if refs and len(refs) == len(value) and len({ref['model'] for ref in refs}) == 1:
+            # One query for a list of rows of the same model
+            model = apps.get_model(refs[0]['model'])
+            rows = identity.load(model, [ref['pk'] for ref in refs], queryset=model._default_manager.using('default'))
+            return [rows[ref['pk']] for ref in refs if ref['pk'] in rows]
+        return [load(item) for item in value]
+    return value
+
+
+def stored_result(output, owner, key, operation, arguments_fingerprint):
+    record = (
+        IdempotencyKey.objects.using('default')
+        .filter(client=owner, key=key, operation=operation, expires_at__gt=timezone.now())
+        .first()
+    )
+    if record is None:
+        return None
+    if record.fingerprint != arguments_fingerprint:
+        raise GraphQLError(f"Idempotency key {key!r} was already used with different arguments")
+    try:
+        return output(**{name: load(value) for name, value in record.response.items()})
+    except ObjectDoesNotExist:
+        raise GraphQLError(
+            f"The result stored for idempotency key {key!r} refers to rows that have since been deleted"
+        ) from None
+
+
+def idempotent(mutate):
+    """Decorator for a graphene Mutation's ``mutate`` (add ``idempotency_key = graphene.String()`` to its Arguments)."""
+
+    @wraps(mutate)
+    def wrapper(root, info, idempotency_key=None, **kwargs):
+        if not idempotency_key:
+            return mutate(root, info, **kwargs)
+
+        output = info.return_type.graphene_type
+        operation = output.__name__
+        owner = client(info)
+        arguments_fingerprint = fingerprint(kwargs)
+        result = stored_result(output, owner, idempotency_key, operation, arguments_fingerprint)
+        if result is not None:
+            return result
+
+        ttl = getattr(settings, 'CRM_IDEMPOTENCY_TTL', DEFAULT_TTL)
+        try:
+            with identity.atomic():
+                # An expired record with this key would block the new one
+                IdempotencyKey.objects.filter(
+                    client=owner, key=idempotency_key, operation=operation, expires_at__lte=timezone.now(),
+                ).delete()
+                result = mutate(root, info, **kwargs)
+                IdempotencyKey.objects.create(
+                    client=owner,
+                    key=idempotency_key,
+                    operation=operation,
+                    fingerprint=arguments_fingerprint,
+                    response={name: dump(getattr(result, name, None)) for name in output._meta.fields},
+                    expires_at=timezone.now() + timedelta(seconds=ttl),
+                )
+        except IntegrityError:
+            # A concurrent retry with the same key committed first; our writes were rolled back
+            result = stored_result(output, owner, idempotency_key, operation, arguments_fingerprint)
+            if result is None:
+                raise
+        return result
+
+    return wrapper
+
+
+def purge_expired():
+    """Delete expired keys; returns how many were removed."""
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
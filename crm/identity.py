@@ -0,0 +1,147 @@
+"""
+Request-scoped identity map for model instances.
+
+Inside ``scope()`` (opened by CRMGraphQLView for every request) each row
+is represented by at most one instance, keyed by (model, pk). Loaders
+look rows up here before querying and fetch only the missing ones, with
+one ``IN`` query per call; mutations ``add()`` the rows they write and
+``discard()`` rows they change behind the ORM's back, so later resolvers
+in the same request see them. Mutations run in ``identity.atomic()``
+rather than ``transaction.atomic()``, so that whatever they did to the
+map is undone when their transaction rolls back.
+
+Outside a scope (management commands, the admin, ``schema.execute`` in
+tests) the functions fall back to plain queries and keep nothing.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import transaction
+
+from . import tracing
+
+_identity_map = ContextVar('crm_identity_map', default=None)
+
+
+@contextmanager
+def scope():
+    """Give the current request an empty identity map, dropped again afterwards."""
+    token = _identity_map.set({})
+    try:
+        yield
+    finally:
+        _identity_map.reset(token)
+
+
+@contextmanager
+def atomic(using=None):
+    """``transaction.atomic()`` that also restores the identity map if the block rolls back; usable as a decorator."""
+    identity_map = _identity_map.get()
+    snapshot = dict(identity_map) if identity_map is not None else None
+    try:
+        with transaction.atomic(using=using):
+            yield
+    except BaseException:
+        # Rows added in the block may not exist any more, and discarded ones are unchanged again
+        if snapshot is not None:
+            identity_map.clear()
+            identity_map.update(snapshot)
+        raise
+
+
+def _key(model, pk):
+    # Proxy models share their concrete model's rows
+    return model._meta.concrete_model, pk
+
+
+def get(model, pk):
+    """The instance for (model, pk) if this request has already loaded it, else None."""
+    identity_map = _identity_map.get()
+    if identity_map is None:
+        return None
+    return identity_map.get(_key(model, pk))
+
+
+def add(instance):
+    """Register ``instance`` and return the request's instance for its row (the first one registered)."""
+    identity_map = _identity_map.get()
+    if identity_map is None or instance is None or instance.pk is None:
+        return instance
+    return identity_map.setdefault(_key(type(instance), instance.pk), instance)
+
+
+def replace(instance):
+    """Make ``instance`` the request's instance for its row, e.g. after a mutation changed it."""
+    identity_map = _identity_map.get()
+    if identity_map is not None and instance.pk is not None:
+        identity_map[_key(type(instance), instance.pk)] = instance
+    return instance
+
+
+def instances(model):
+    """The instances of ``model`` this request has loaded so far."""
+    identity_map = _identity_map.get()
+    if identity_map is None:
+        return []
+    model = model._meta.concrete_model
+    return [instance for (key_model, _), instance in identity_map.items() if key_model is model]
+
+
+def discard(model, pk):
+    identity_map = _identity_map.get()
+    if identity_map is not None:
+        identity_map.pop(_key(model, pk), None)
+
+
+def load(model, pks, queryset=None):
+    """
+    {pk: instance} for the given primary keys; rows that do not exist are left out.
+
+    Rows already in the identity map are taken from it; the rest come
+    from ``queryset`` (default: the model's manager) in one query.
+    """
+    found = {}
+    missing = []
+    for pk in dict.fromkeys(pks):
+        instance = get(model, pk)
+        if instance is None:
+            missing.append(pk)
+        else:
+            found[pk] = instance
+    if missing:
+        if queryset is None:
+            queryset = model._default_manager.all()
+        with tracing.span(f"load {model.__name__}", **{'crm.keys': len(missing)}):
+            rows = queryset.in_bulk(missing)
+        for pk, instance in rows.items():
+            found[pk] = add(instance)
+    return found
+
+
+def attach(instances, field_name):
+    """
+    Set the foreign key ``field_name`` on every instance from the identity map.
+
+    Replaces ``select_related`` for relations whose rows repeat across
+    instances (a customer with many orders): each related row is fetched
+    and built once, and only if the request has not loaded it yet.
+    """
+    if not instances:
+        return instances
+    field = type(instances[0])._meta.get_field(field_name)
+    pending = [i for i in instances if not field.is_cached(i) and getattr(i, field.attname) is not None]
+    if pending:
+        related = load(field.related_model, {getattr(i, field.attname) for i in pending})
+        for instance in pending:
+            row = related.get(getattr(instance, field.attname))
+            if row is not None:
+                field.set_cached_value(instance, row)
+    return instances
+
+
+def related(instance, field_name):
+    """``instance.<field_name>`` for a foreign key, going through the identity map when it is not loaded yet."""
+    field = instance._meta.get_field(field_name)
+    if not field.is_cached(instance):
+        attach([instance], field_name)
+    return getattr(instance, field_name)
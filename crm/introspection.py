@@ -0,0 +1,150 @@
+"""
+In-memory cache for introspection responses.
+
+Introspection (``__schema`` / ``__type``) is expensive to execute, but its
+result only changes when the schema does. Responses to introspection-only
+operations are therefore kept per schema version, keyed on the normalised
+document, and served with an ETag; a matching ``If-None-Match`` gets a 304.
+
+Both paths go through the caller's admission check: a miss is charged the
+operation's full cost before it executes, a hit ``admission.MIN_COST``.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from functools import lru_cache, partial
+
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags, quote_etag
+from graphene_django.views import HttpError
+from graphql import FieldNode, GraphQLError, OperationDefinitionNode, parse, print_ast, print_schema
+
+from . import admission
+
+INTROSPECTION_FIELDS = {'__schema', '__type', '__typename'}
+
+# Entries kept per process: the raw and normalised text of each introspection
+# document in use (GraphiQL, codegen, IDE plugins, ...)
+MAX_ENTRIES = 64
+
+
+@lru_cache(maxsize=8)
+def schema_version(schema):
+    """Short hash of the schema's SDL; changes whenever the schema does."""
+    return hashlib.sha256(print_schema(schema.graphql_schema).encode()).hexdigest()[:16]
+
+
+def is_introspection(document, operation_name=None):
+    """True if the selected operation is a query that only asks for introspection fields."""
+    operations = [d for d in document.definitions if isinstance(d, OperationDefinitionNode)]
+    if operation_name:
+        operations = [op for op in operations if op.name and op.name.value == operation_name]
+    if len(operations) != 1 or operations[0].operation.value != 'query':
+        return False
+    return all(
+        isinstance(selection, FieldNode) and selection.name.value in INTROSPECTION_FIELDS
+        for selection in operations[0].selection_set.selections
+    )
+
+
+class IntrospectionCache:
+    """Thread-safe LRU of key -> (body, etag); a raw and a normalised key may share an entry."""
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key, body):
+        entry = (body, quote_etag(hashlib.sha256(body.encode()).hexdigest()[:32]))
+        self.put(key, entry)
+        return entry
+
+    def put(self, key, entry):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+cache = IntrospectionCache()
+
+
+def cached_response(view, request, admit=lambda handler, cost=None: handler()):
+    """
+    Serve an introspection-only request from the cache, or return None.
+
+    ``admit(handler, cost=None)`` runs ``handler()`` if the client may: with
+    the default (full) cost on a miss, with ``cost=admission.MIN_COST`` on a
+    hit. Anything else (GraphiQL pages, batches, other operations, malformed
+    requests) is left to the normal GraphQLView path.
+    """
+    if request.method not in ('GET', 'POST') or view.batch:
+        return None
+    try:
+        data = view.parse_body(request)
+        if view.graphiql and view.can_display_graphiql(request, data):
+            return None
+        query, variables, operation_name, _ = view.get_graphql_params(request, data)
+    except HttpError:
+        return None
+    # Cheap pre-check before parsing
+    if not query or '__' not in query:
+        return None
+
+    variant = (
+        schema_version(view.schema),
+        json.dumps(variables, sort_keys=True),
+        operation_name,
+        bool(view.pretty or request.GET.get('pretty')),
+    )
+    # Clients resend the exact same text, so try it before parsing
+    entry = cache.get((query, *variant))
+    if entry is None:
+        try:
+            document = parse(query)
+        except GraphQLError:
+            return None
+        if not is_introspection(document, operation_name):
+            return None
+        normalised = (print_ast(document), *variant)
+        entry = cache.get(normalised)
+        if entry is None:
+            return admit(partial(execute, view, request, data, normalised, (query, *variant)))
+        cache.put((query, *variant), entry)
+    return admit(partial(respond, request, entry), cost=admission.MIN_COST)
+
+
+def execute(view, request, data, *keys):
+    """Run the introspection operation and cache its response under ``keys``."""
+    body, status_code = view.get_response(request, data)
+    if status_code != 200:
+        return HttpResponse(body, status=status_code, content_type='application/json')
+    entry = cache.set(keys[0], body)
+    for key in keys[1:]:
+        cache.put(key, entry)
+    return respond(request, entry)
+
+
+def respond(request, entry):
+    body, etag = entry
+    if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+    if etag in if_none_match or '*' in if_none_match:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    return response
@@ -0,0 +1,134 @@
+"""
+Background jobs for heavy mutations.
+
+``enqueue()`` stores a Job row and, once the surrounding transaction has
+committed, hands it to an in-process thread pool of ``CRM_JOB_WORKERS``
+threads. With ``CRM_JOB_WORKERS = 0`` jobs stay queued in the database
+for ``manage.py run_jobs`` workers instead, so no broker is needed either
+way. A job is claimed with a conditional UPDATE on its status, so it runs
+once even when both kinds of worker are active.
+
+A running job records a heartbeat each time it reports progress. Jobs
+whose heartbeat is older than ``CRM_JOB_STALE_AFTER`` seconds were left
+behind by a worker that died; ``claim()`` puts them back in the queue
+before looking for work, and the old worker, should it come back, can no
+longer update them.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .customers import create_customers
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# Errors kept on the job row; the counts stay exact
+MAX_STORED_ERRORS = 100
+
+DEFAULT_STALE_AFTER = 5 * 60
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def bulk_create_customers(job):
+    def progress(processed, succeeded, errors):
+        update_progress(job, processed, succeeded, len(errors), errors)
+
+    create_customers(job.payload['customers'], progress=progress)
+
+
+# kind -> handler(job); handlers report progress through update_progress()
+HANDLERS = {
+    'bulk_create_customers': bulk_create_customers,
+}
+
+
+def claimed(job):
+    """The job's row, as long as it is still running under this worker's claim."""
+    return Job.objects.filter(pk=job.pk, status=Job.RUNNING, started_at=job.started_at)
+
+
+def update_progress(job, processed, succeeded, failed, errors=()):
+    job.processed, job.succeeded, job.failed = processed, succeeded, failed
+    job.errors = list(errors[:MAX_STORED_ERRORS])
+    job.heartbeat_at = timezone.now()
+    claimed(job).update(
+        processed=processed, succeeded=succeeded, failed=failed, errors=job.errors, heartbeat_at=job.heartbeat_at,
+    )
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.CRM_JOB_WORKERS, thread_name_prefix='crm-job')
+        return _executor
+
+
+def enqueue(kind, payload, total=0):
+    """Create a queued job; it starts once the current transaction commits."""
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    job = Job.objects.create(kind=kind, payload=payload, total=total)
+    if getattr(settings, 'CRM_JOB_WORKERS', 0):
+        transaction.on_commit(lambda: _get_executor().submit(_run_in_thread, job.pk))
+    return job
+
+
+def _run_in_thread(job_id):
+    close_old_connections()
+    try:
+        run_job(job_id)
+    finally:
+        # Pool threads outlive requests, so they clean up their own connection
+        connection.close()
+
+
+def requeue_stale():
+    """Put running jobs without a recent heartbeat back in the queue; returns how many there were."""
+    stale_after = getattr(settings, 'CRM_JOB_STALE_AFTER', DEFAULT_STALE_AFTER)
+    requeued = Job.objects.filter(
+        status=Job.RUNNING, heartbeat_at__lt=timezone.now() - timedelta(seconds=stale_after),
+    ).update(status=Job.QUEUED, started_at=None, heartbeat_at=None)
+    if requeued:
+        logger.warning("Re-queued %d stale job(s)", requeued)
+    return requeued
+
+
+def claim(job_id=None):
+    """Mark a queued job (the given one, or the oldest) as running. Returns it, or None if there is none."""
+    if job_id is None:
+        requeue_stale()
+    queued = Job.objects.filter(status=Job.QUEUED)
+    candidates = [job_id] if job_id else queued.order_by('created_at').values_list('pk', flat=True)[:5]
+    for pk in candidates:
+        now = timezone.now()
+        if queued.filter(pk=pk).update(status=Job.RUNNING, started_at=now, heartbeat_at=now):
+            return Job.objects.get(pk=pk)
+    return None
+
+
+def run_job(job_id=None):
+    """Claim and run one job. Returns the finished job, or None if nothing was claimed."""
+    job = claim(job_id)
+    if job is None:
+        return None
+    try:
+        HANDLERS[job.kind](job)
+    except Exception as e:
+        logger.exception("Job %s failed", job.pk)
+        job.status = Job.FAILED
+        job.errors = (job.errors + [str(e)])[-MAX_STORED_ERRORS:]
+    else:
+        job.status = Job.SUCCEEDED
+    job.finished_at = timezone.now()
+    if not claimed(job).update(status=job.status, errors=job.errors, finished_at=job.finished_at):
+        logger.warning("Job %s was re-queued while it ran; its result is discarded", job.pk)
+    return job
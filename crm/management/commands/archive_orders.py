@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from crm.archive import archive_orders, default_cutoff
+
+
+class Command(BaseCommand):
+    help = "Move orders older than CRM_ORDER_ARCHIVE_AFTER_DAYS (or --days) into the archive tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help="Archive orders placed more than this many days ago.")
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Orders moved per transaction.")
+
+    def handle(self, *args, **options):
+        if options['days'] is not None:
+            before = timezone.now() - timedelta(days=options['days'])
+        else:
+            before = default_cutoff()
+
+        def progress(moved):
+            self.stdout.write(f"{moved} orders archived")
+
+        moved = archive_orders(before, chunk_size=options['chunk_size'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(f"Archived {moved} orders placed before {before:%Y-%m-%d %H:%M}"))
@@ -0,0 +1,82 @@
+import json
+from contextlib import ExitStack
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from crm.benchmark import (
+    CORPUS, HTTPTarget, SchemaTarget, ViewTarget, compare, local_server, run_suite, scratch_database, seed_fixture,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the GraphQL API with a fixed corpus of operations and report p50/p95/p99 latency, "
+        "throughput and SQL statements per operation."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', choices=['schema', 'view', 'server'], default='schema',
+                            help="schema: execute in-process; view: /graphql via the test client; "
+                                 "server: HTTP against --url or a local server started for the run.")
+        parser.add_argument('--url', help="GraphQL endpoint of an already running server (server target only).")
+        parser.add_argument('--concurrency', default='1,4', help="Comma-separated thread counts.")
+        parser.add_argument('--iterations', type=int, default=100, help="Executions per operation and concurrency level.")
+        parser.add_argument('--operations', help=f"Comma-separated subset of: {', '.join(CORPUS)}")
+        parser.add_argument('--existing-db', action='store_true',
+                            help="Run against the configured database instead of a seeded scratch copy. "
+                                 "Note that create_order writes real orders.")
+        parser.add_argument('--customers', type=int, default=200)
+        parser.add_argument('--products', type=int, default=50)
+        parser.add_argument('--orders', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--admission', action='store_true',
+                            help="Keep GraphQL admission control (rate limits) on for the view/server targets.")
+        parser.add_argument('--output', help="Write the report as JSON to this file.")
+        parser.add_argument('--compare', help="A previous JSON report to compare against.")
+
+    def handle(self, *args, **options):
+        levels = [int(n) for n in options['concurrency'].split(',')]
+        operations = options['operations'].split(',') if options['operations'] else None
+        unknown = set(operations or []) - set(CORPUS)
+        if unknown:
+            raise CommandError(f"Unknown operations: {', '.join(sorted(unknown))}")
+
+        with ExitStack() as stack:
+            if not options['existing_db']:
+                stack.enter_context(scratch_database())
+                seed_fixture(options['customers'], options['products'], options['orders'], seed=options['seed'])
+            if not options['admission']:
+                # The benchmark is one client sending as fast as it can, which rate limiting is there to stop
+                stack.enter_context(override_settings(GRAPHQL_ADMISSION=None))
+
+            if options['target'] == 'schema':
+                target = SchemaTarget()
+            elif options['target'] == 'view':
+                target = ViewTarget()
+            else:
+                target = HTTPTarget(options['url'] or stack.enter_context(local_server()))
+
+            report = run_suite(target, levels, options['iterations'], operations, seed=options['seed'])
+
+        self.stdout.write(f"{'operation':<28}{'conc':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ops/s':>10}{'sql':>6}{'err':>5}")
+        for row in report['results']:
+            self.stdout.write(
+                f"{row['operation']:<28}{row['concurrency']:>5}{row['p50_ms']:>10}{row['p95_ms']:>10}"
+                f"{row['p99_ms']:>10}{row['throughput_per_sec']:>10}{row['sql_queries']:>6}{row['errors']:>5}"
+            )
+
+        if options['compare']:
+            with open(options['compare']) as fh:
+                baseline = json.load(fh)
+            self.stdout.write(f"\nChange vs {options['compare']} ({baseline.get('revision')}):")
+            for row, old in compare(baseline, report):
+                self.stdout.write(
+                    f"{row['operation']:<28}{row['concurrency']:>5}  "
+                    + "  ".join(f"{key} {old[key]} -> {row[key]}" for key in ('p50_ms', 'p95_ms', 'throughput_per_sec', 'sql_queries'))
+                )
+
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump(report, fh, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
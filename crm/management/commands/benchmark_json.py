@@ -0,0 +1,28 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from crm.benchmark import serialization_benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Time executing and JSON-encoding the orders-with-products response for a large "
+        "number of orders, with each available encoder."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--output', help="Write the report as JSON to this file.")
+
+    def handle(self, *args, **options):
+        report = serialization_benchmark(options['orders'], options['repeat'])
+        self.stdout.write(f"{report['orders']} orders, {report['bytes']:,} bytes of JSON")
+        self.stdout.write(f"  execute   {report['execute_ms']:>10} ms")
+        for name, ms in report['encode_ms'].items():
+            self.stdout.write(f"  {name:<9} {ms:>10} ms")
+
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump(report, fh, indent=2)
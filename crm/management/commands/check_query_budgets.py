@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.benchmark import CORPUS, scratch_database
+from crm.query_budget import BUDGET_FILE, load_budgets, measure, over_budget, seed, write_budgets
+
+
+class Command(BaseCommand):
+    help = (
+        "Count the SQL statements of each benchmark corpus operation on a small scratch fixture "
+        "and compare them with the committed budgets (crm/query_budgets.json)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--update', action='store_true', help="Write the measured counts as the new budgets.")
+        parser.add_argument('--operations', help=f"Comma-separated subset of: {', '.join(CORPUS)}")
+
+    def handle(self, *args, **options):
+        operations = options['operations'].split(',') if options['operations'] else None
+        unknown = set(operations or []) - set(CORPUS)
+        if unknown:
+            raise CommandError(f"Unknown operations: {', '.join(sorted(unknown))}")
+
+        with scratch_database():
+            seed()
+            counts = measure(operations)
+
+        budgets = load_budgets()
+        self.stdout.write(f"{'operation':<28}{'sql':>6}{'budget':>8}")
+        for name, count in counts.items():
+            self.stdout.write(f"{name:<28}{count:>6}{budgets.get(name, '-'):>8}")
+
+        if options['update']:
+            write_budgets({**budgets, **counts})
+            self.stdout.write(self.style.SUCCESS(f"Budgets written to {BUDGET_FILE}"))
+            return
+
+        exceeded = over_budget(counts, budgets)
+        if exceeded:
+            raise CommandError(
+                "Over the SQL budget: "
+                + ", ".join(f"{name} {count} > {budget}" for name, (count, budget) in exceeded.items())
+                + ". Fix the regression, or run with --update if the new count is intended."
+            )
+        self.stdout.write(self.style.SUCCESS("All operations within their SQL budgets"))
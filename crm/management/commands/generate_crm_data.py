@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.datagen import generate
+from crm.rollups import rebuild_rollups, reconcile_product_sales
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate deterministic synthetic customers, products and orders with skewed "
+        "distributions (hot products, heavy customers, recent-leaning dates)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=1000)
+        parser.add_argument('--products', type=int, default=200)
+        parser.add_argument('--orders', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--days', type=int, default=730, help="Spread order dates over this many past days.")
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--skip-rollups', action='store_true', help="Do not rebuild the sales rollups and product counters afterwards.")
+
+    def handle(self, *args, **options):
+        def progress(label, done, total):
+            self.stdout.write(f"\r{label}: {done}/{total}", ending='')
+            if done == total:
+                self.stdout.write('')
+
+        try:
+            counts = generate(
+                options['customers'], options['products'], options['orders'],
+                seed=options['seed'], days=options['days'], batch_size=options['batch_size'], progress=progress,
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        rows = sum(v for k, v in counts.items() if k != 'seconds')
+        rate = rows / counts['seconds'] if counts['seconds'] else rows
+        self.stdout.write(
+            f"Inserted {counts['customers']} customers, {counts['products']} products, {counts['orders']} orders "
+            f"and {counts['order_products']} order lines ({rows} rows) in {counts['seconds']}s, {rate:,.0f} rows/sec"
+        )
+
+        if not options['skip_rollups']:
+            rebuild_rollups()
+            reconcile_product_sales()
+            self.stdout.write("Sales rollups and product counters rebuilt")
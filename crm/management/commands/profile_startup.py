@@ -0,0 +1,31 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from crm.startup import profile_startup
+
+
+class Command(BaseCommand):
+    help = (
+        "Start a fresh interpreter, build the GraphQL schema and report the startup time "
+        "per phase and the import time per top-level package."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=15, help="Number of packages to list.")
+        parser.add_argument('--settings-module', help="Settings to start with (default: the current ones).")
+        parser.add_argument('--json', dest='json_path', help="Also write the full report to this file.")
+
+    def handle(self, *args, **options):
+        report = profile_startup(options['settings_module'])
+
+        self.stdout.write(f"Cold start: {report['total'] * 1000:.1f}ms (including interpreter startup)")
+        for phase, seconds in report['phases'].items():
+            self.stdout.write(f"  {phase:<20}{seconds * 1000:>10.1f}ms")
+        self.stdout.write("Import time by package (self time):")
+        for package, seconds in list(report['imports'].items())[:options['top']]:
+            self.stdout.write(f"  {package:<20}{seconds * 1000:>10.1f}ms")
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as fh:
+                json.dump(report, fh, indent=2)
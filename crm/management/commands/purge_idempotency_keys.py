@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from crm.idempotency import purge_expired
+
+
+class Command(BaseCommand):
+    help = "Delete mutation idempotency keys whose CRM_IDEMPOTENCY_TTL has passed."
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Deleted {purge_expired()} expired idempotency keys")
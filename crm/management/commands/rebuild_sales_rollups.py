@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from crm.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the sales rollup tables (daily, per-product and per-customer) from the orders tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        counts = rebuild_rollups(batch_size=options['batch_size'])
+        for table, count in counts.items():
+            self.stdout.write(f"{table}: {count} rows")
+        self.stdout.write(self.style.SUCCESS("Sales rollups rebuilt"))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from crm.rollups import reconcile_product_sales
+
+
+class Command(BaseCommand):
+    help = "Recompute the units_sold and revenue counters of every product from the order lines."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        result = reconcile_product_sales(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Reconciled {result['products']} products, {result['corrected']} corrected"
+        ))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from crm.jobs import run_job
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs from the database (use with CRM_JOB_WORKERS = 0, or alongside it)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Exit when the queue is empty instead of polling.")
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds between polls of an empty queue.")
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            job = run_job()
+            if job is not None:
+                self.stdout.write(
+                    f"{job.kind} {job.pk}: {job.status}, {job.succeeded} succeeded, {job.failed} failed"
+                )
+                continue
+            if options['once']:
+                return
+            time.sleep(options['poll_interval'])
@@ -0,0 +1,108 @@
+import json
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test.utils import override_settings
+
+from crm.benchmark import scratch_database
+from crm.models import Customer, Product
+
+# SQLite's own defaults (rollback journal, synchronous=FULL, deferred BEGIN), used as the "before" run.
+BASELINE = {'SQLITE_PRAGMAS': {'journal_mode': 'delete'}, 'SQLITE_TRANSACTION_MODE': None}
+
+CREATE_ORDER = """
+mutation($customerId: ID!, $productIds: [ID]!) {
+  createOrder(input: { customerId: $customerId, productIds: $productIds }) { order { id } }
+}
+"""
+
+LIST_ORDERS = "{ orders { id totalAmount customer { name } } }"
+
+
+class Command(BaseCommand):
+    help = (
+        "Run concurrent createOrder writers and order-list readers against a scratch SQLite "
+        "file, once with SQLite defaults and once with the configured SQLITE_* settings, and report throughput."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--duration', type=float, default=5.0, help="Seconds per run.")
+        parser.add_argument('--json', dest='json_path', help="Also write the results to this file.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("sqlite_stress only runs against a SQLite default database")
+
+        from alx_backend_graphql.schema import schema
+
+        tuned = {
+            'SQLITE_PRAGMAS': getattr(settings, 'SQLITE_PRAGMAS', {}),
+            'SQLITE_TRANSACTION_MODE': getattr(settings, 'SQLITE_TRANSACTION_MODE', None),
+        }
+        results = {}
+        for label, overrides in (('before', BASELINE), ('after', tuned)):
+            with override_settings(**overrides), scratch_database():
+                results[label] = self.run_workload(schema, options)
+            self.report(label, results[label])
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as fh:
+                json.dump(results, fh, indent=2)
+
+    def run_workload(self, schema, options):
+        customers = Customer.objects.bulk_create(
+            Customer(name=f"Stress {i}", email=f"stress{i}@example.com") for i in range(20)
+        )
+        products = Product.objects.bulk_create(
+            Product(name=f"Item {i}", price=Decimal('9.99') + i, stock=100) for i in range(20)
+        )
+        connection.close()
+
+        counts = {'writes': 0, 'reads': 0, 'write_errors': 0, 'read_errors': 0}
+        lock = threading.Lock()
+        deadline = time.monotonic() + options['duration']
+
+        def worker(kind, n):
+            try:
+                while time.monotonic() < deadline:
+                    if kind == 'writes':
+                        result = schema.execute(CREATE_ORDER, variables={
+                            'customerId': str(customers[n % len(customers)].id),
+                            'productIds': [str(products[(n + k) % len(products)].id) for k in range(3)],
+                        })
+                    else:
+                        result = schema.execute(LIST_ORDERS)
+                    key = kind if not result.errors else kind[:-1] + '_errors'
+                    with lock:
+                        counts[key] += 1
+                    n += 1
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker, args=('writes', i)) for i in range(options['writers'])]
+        threads += [threading.Thread(target=worker, args=('reads', i)) for i in range(options['readers'])]
+        started = time.monotonic()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.monotonic() - started
+
+        return {
+            **counts,
+            'seconds': round(elapsed, 3),
+            'writes_per_sec': round(counts['writes'] / elapsed, 1),
+            'reads_per_sec': round(counts['reads'] / elapsed, 1),
+        }
+
+    def report(self, label, result):
+        self.stdout.write(
+            f"{label:>6}: {result['writes_per_sec']} createOrder/s, {result['reads_per_sec']} orders/s, "
+            f"{result['write_errors']} write errors, {result['read_errors']} read errors"
+        )
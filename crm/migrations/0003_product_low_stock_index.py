@@ -0,0 +1,17 @@
+# Generated by Django 4.2.23 on 2026-10-19 10:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0002_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('stock__lt', 10)), fields=['stock'], name='crm_product_low_stock_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.23 on 2026-10-19 10:49
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0003_product_low_stock_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='order_date',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.23 on 2026-10-19 11:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0005_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255)),
+                ('operation', models.CharField(max_length=64)),
+                ('fingerprint', models.CharField(max_length=64)),
+                ('response', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['expires_at'], name='crm_idempotencykey_expires_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='idempotencykey',
+            constraint=models.UniqueConstraint(fields=('key', 'operation'), name='crm_idempotencykey_key_operation_uniq'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.23 on 2026-10-19 11:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0006_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('total_amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('order_date', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['order_date'], name='crm_order_date_idx'),
+        ),
+        migrations.AddField(
+            model_name='archivedorder',
+            name='customer',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_orders', to='crm.customer'),
+        ),
+        migrations.AddField(
+            model_name='archivedorder',
+            name='products',
+            field=models.ManyToManyField(related_name='archived_orders', to='crm.product'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedorder',
+            index=models.Index(fields=['order_date'], name='crm_archivedorder_date_idx'),
+        ),
+    ]
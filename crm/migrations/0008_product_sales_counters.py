@@ -0,0 +1,50 @@
+# Generated by Django 4.2.23 on 2026-10-19 11:45
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, ExpressionWrapper, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Product = apps.get_model('crm', 'Product')
+
+    def lines(model_name):
+        through = apps.get_model('crm', model_name)._meta.get_field('products').remote_field.through
+        counts = through.objects.filter(product_id=OuterRef('pk')).order_by().values('product_id')
+        return Coalesce(Subquery(counts.annotate(n=Count('id')).values('n'), output_field=models.IntegerField()), 0)
+
+    units = lines('Order') + lines('ArchivedOrder')
+    Product.objects.update(
+        units_sold=units,
+        revenue=ExpressionWrapper(F('price') * units, output_field=models.DecimalField(max_digits=14, decimal_places=2)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0007_archived_order'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='revenue',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='units_sold',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-units_sold', 'id'], name='crm_product_units_sold_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-revenue', 'id'], name='crm_product_revenue_idx'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
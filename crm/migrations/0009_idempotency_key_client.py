@@ -0,0 +1,26 @@
+# Generated by Django 4.2.23 on 2026-10-19 11:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0008_product_sales_counters'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='idempotencykey',
+            name='crm_idempotencykey_key_operation_uniq',
+        ),
+        migrations.AddField(
+            model_name='idempotencykey',
+            name='client',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddConstraint(
+            model_name='idempotencykey',
+            constraint=models.UniqueConstraint(fields=('client', 'key', 'operation'), name='crm_idempotencykey_client_key_operation_uniq'),
+        ),
+    ]
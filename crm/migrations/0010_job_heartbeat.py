@@ -0,0 +1,26 @@
+# Generated by Django 4.2.23 on 2026-10-19 11:57
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_heartbeats(apps, schema_editor):
+    # Jobs already running count from their start, so ones orphaned before the upgrade are re-queued too
+    Job = apps.get_model('crm', 'Job')
+    Job.objects.filter(status='running', heartbeat_at__isnull=True).update(heartbeat_at=F('started_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0009_idempotency_key_client'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(fill_heartbeats, migrations.RunPython.noop),
+    ]
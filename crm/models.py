@@ -1,4 +1,53 @@
+import uuid
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+
 from django.db import models
+from django.db.models import Count, ExpressionWrapper, Max, Min, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, Least, NullIf
+from django.utils import timezone
+
+from . import identity
+
+class CustomerQuerySet(models.QuerySet):
+    def with_lifetime_value(self):
+        """
+        Annotate order count, total spent and first/last order dates in one grouped query.
+
+        Archived orders count too; they are added from correlated subqueries
+        on the archive's customer index, since a second join would multiply
+        the rows being aggregated. Each of those subqueries appears once.
+        """
+        money = models.DecimalField(max_digits=14, decimal_places=2)
+        moment = models.DateTimeField()
+        archived = ArchivedOrder.objects.filter(customer=OuterRef('pk')).order_by().values('customer')
+
+        def archived_value(aggregate, output_field):
+            return Subquery(archived.annotate(value=aggregate).values('value'), output_field=output_field)
+
+        def earliest(*values):
+            # LEAST returns NULL on SQLite when any argument is NULL, so a
+            # missing side stands in as the far end of the range instead
+            never = Value(datetime(9999, 12, 31, tzinfo=dt_timezone.utc), output_field=moment)
+            return NullIf(Least(*(Coalesce(value, never) for value in values)), never, output_field=moment)
+
+        def latest(*values):
+            never = Value(datetime(1, 1, 1, tzinfo=dt_timezone.utc), output_field=moment)
+            return NullIf(Greatest(*(Coalesce(value, never) for value in values)), never, output_field=moment)
+
+        return self.annotate(
+            orders_count=Count('order') + Coalesce(archived_value(Count('id'), models.IntegerField()), 0),
+            total_spent=ExpressionWrapper(
+                Coalesce(Sum('order__total_amount'), Value(Decimal('0')), output_field=money)
+                + Coalesce(archived_value(Sum('total_amount'), money), Value(Decimal('0')), output_field=money),
+                output_field=money,
+            ),
+            first_order_at=earliest(Min('order__order_date'), archived_value(Min('order_date'), moment)),
+            last_order_at=latest(Max('order__order_date'), archived_value(Max('order_date'), moment)),
+        )
+
+# Customers annotated together when lifetime values are read one customer at a time
+LIFETIME_VALUE_BATCH = 500
 
 class Customer(models.Model):
     name = models.CharField(max_length=255)
@@ -6,22 +55,229 @@ class Customer(models.Model):
     phone = models.CharField(max_length=20, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = CustomerQuerySet.as_manager()
+
     def __str__(self):
         return self.name
 
+    def lifetime_value(self):
+        """
+        Return the lifetime-value figures for this customer, preferring the
+        annotations added by CustomerQuerySet.with_lifetime_value().
+
+        Without them, the figures are fetched in one query for this customer
+        and every other customer the request has loaded without them (up to
+        LIFETIME_VALUE_BATCH), so customers reached through orders cost one
+        query per batch rather than one each.
+        """
+        if not hasattr(self, 'orders_count'):
+            pending = {}
+            for customer in [self, *identity.instances(Customer)]:
+                if not hasattr(customer, 'orders_count') and len(pending) < LIFETIME_VALUE_BATCH:
+                    pending.setdefault(customer.pk, []).append(customer)
+            rows = Customer.objects.with_lifetime_value().filter(pk__in=pending).values(
+                'pk', 'orders_count', 'total_spent', 'first_order_at', 'last_order_at'
+            )
+            for totals in rows:
+                for customer in pending[totals.pop('pk')]:
+                    for key, value in totals.items():
+                        setattr(customer, key, value)
+        return {
+            'orders_count': self.orders_count,
+            'total_spent': self.total_spent,
+            'first_order_at': self.first_order_at,
+            'last_order_at': self.last_order_at,
+        }
+
+# Products below this stock level are "low stock"; the partial index on
+# Product is built with the same constant, so changing it needs a migration.
+LOW_STOCK_THRESHOLD = 10
+
+class ProductQuerySet(models.QuerySet):
+    def low_stock(self, threshold=None):
+        """
+        Products with stock below ``threshold`` (default LOW_STOCK_THRESHOLD), lowest first.
+
+        Thresholds up to LOW_STOCK_THRESHOLD repeat the index predicate so the
+        planner can answer from the partial index instead of scanning the table.
+        """
+        if threshold is None:
+            threshold = LOW_STOCK_THRESHOLD
+        if threshold <= LOW_STOCK_THRESHOLD:
+            qs = self.filter(stock__lt=LOW_STOCK_THRESHOLD).filter(stock__lt=threshold)
+        else:
+            qs = self.filter(stock__lt=threshold)
+        return qs.order_by('stock', 'id')
+
 class Product(models.Model):
     name = models.CharField(max_length=255)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.PositiveIntegerField(default=0)
+    # Sales counters, incremented by CreateOrder (crm/rollups.py) and
+    # recomputed by the reconcile_product_sales command; archived orders count
+    units_sold = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0'))
+
+    objects = ProductQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['stock'],
+                condition=models.Q(stock__lt=LOW_STOCK_THRESHOLD),
+                name='crm_product_low_stock_idx',
+            ),
+            # Match the "most first, then id" orderings offered by ProductFilter
+            models.Index(fields=['-units_sold', 'id'], name='crm_product_units_sold_idx'),
+            models.Index(fields=['-revenue', 'id'], name='crm_product_revenue_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+class OrderQuerySet(models.QuerySet):
+    def with_details(self):
+        """
+        Load each order's products up front (they are shown with every order).
+
+        Customers repeat across orders, so they are attached afterwards from
+        the request's identity map (``identity.attach(orders, 'customer')``)
+        rather than joined in, which would build one instance per order.
+        """
+        return self.prefetch_related('products')
+
+
 class Order(models.Model):
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
     products = models.ManyToManyField(Product)
     total_amount = models.DecimalField(max_digits=10, decimal_places=2)
-    order_date = models.DateTimeField(auto_now_add=True)
+    order_date = models.DateTimeField(default=timezone.now)
+
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['order_date'], name='crm_order_date_idx'),
+        ]
+
+    def __str__(self):
+        # Costs a query per order unless the customer was attached or is in the identity map
+        return f"Order {self.id} - {identity.related(self, 'customer').name}"
+
+
+# Orders placed more than CRM_ORDER_ARCHIVE_AFTER_DAYS ago, moved out of the hot
+# tables by `manage.py archive_orders` (see crm/archive.py). Rows keep their
+# order id, and the same queryset methods and GraphQL type serve both tables.
+class ArchivedOrder(models.Model):
+    id = models.IntegerField(primary_key=True)
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='archived_orders')
+    products = models.ManyToManyField(Product, related_name='archived_orders')
+    total_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    order_date = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['order_date'], name='crm_archivedorder_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"Order {self.id} - {identity.related(self, 'customer').name} (archived)"
+
+
+# Sales rollups, maintained incrementally by CreateOrder (see crm/rollups.py)
+# and rebuilt from scratch with `manage.py rebuild_sales_rollups`.
+class DailySales(models.Model):
+    day = models.DateField(unique=True)
+    orders_count = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.day}: {self.revenue}"
+
+class DailyProductSales(models.Model):
+    day = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    units_sold = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'product'], name='crm_dailyproductsales_day_product_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} - {self.product_id}: {self.revenue}"
+
+class CustomerSales(models.Model):
+    customer = models.OneToOneField(Customer, on_delete=models.CASCADE, primary_key=True, related_name='sales')
+    orders_count = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-revenue'], name='crm_customersales_revenue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.customer_id}: {self.revenue}"
+
+
+# Background jobs for heavy mutations (see crm/jobs.py). The table doubles as
+# the queue: workers claim the oldest queued job with a conditional update.
+class Job(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (SUCCEEDED, 'Succeeded'), (FAILED, 'Failed')]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=64)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED)
+    payload = models.JSONField(default=dict)
+    total = models.PositiveIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+    succeeded = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Touched by the worker on every progress report; see jobs.requeue_stale()
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='crm_job_status_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.id} ({self.status})"
+
+
+# Stored results of mutations sent with an idempotencyKey (see crm/idempotency.py)
+class IdempotencyKey(models.Model):
+    # admission.client_key() of the caller; keys are only shared within a client
+    client = models.CharField(max_length=255, blank=True, default='')
+    key = models.CharField(max_length=255)
+    operation = models.CharField(max_length=64)
+    fingerprint = models.CharField(max_length=64)
+    response = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['client', 'key', 'operation'], name='crm_idempotencykey_client_key_operation_uniq',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at'], name='crm_idempotencykey_expires_idx'),
+        ]
 
     def __str__(self):
-        return f"Order {self.id} - {self.customer.name}"
+        return f"{self.operation} {self.key}"
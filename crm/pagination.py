@@ -0,0 +1,70 @@
+"""
+Bounded list fields.
+
+The plain list fields (``customers``, ``products``, ``orders``) take
+``limit`` and ``after`` arguments and return at most
+``GRAPHENE['RELAY_CONNECTION_MAX_LIMIT']`` rows, the same cap graphene
+applies to ``first``/``last`` on connection fields. ``after`` is the id of
+the last row of the previous page (a global ID of the field's type, or a
+database id); rows come in id order.
+
+Rows are read with ``QuerySet.iterator(chunk_size)`` and handed to the
+executor as a generator, so model instances are built ``CHUNK_SIZE`` at
+a time rather than all before the first one is serialized.
+"""
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from graphene_django import settings as graphene_django_settings
+from graphql import GraphQLError
+
+from .nodes import database_ids, decode
+
+CHUNK_SIZE = 500
+
+
+def max_limit():
+    # Looked up on the module: graphene-django replaces the object when GRAPHENE changes
+    return graphene_django_settings.graphene_settings.RELAY_CONNECTION_MAX_LIMIT
+
+
+def check_limit(limit, field_name):
+    """``limit`` as requested, or the maximum if it was left out; an error if it is above the maximum."""
+    maximum = max_limit()
+    if limit is None:
+        return maximum
+    if limit < 0:
+        raise GraphQLError(f"`limit` on `{field_name}` cannot be negative.")
+    if limit > maximum:
+        raise GraphQLError(
+            f"Requesting {limit} records on `{field_name}` exceeds the `limit` of {maximum} records."
+        )
+    return limit
+
+
+def page(queryset, limit, after=None, type_name=None):
+    """
+    The first ``limit`` rows of ``queryset`` with an id above ``after``, in id order.
+
+    A global ID given as ``after`` must be one of ``type_name``, so the id
+    of another type's row cannot be mistaken for a position in this list.
+    """
+    if after is not None:
+        try:
+            after_id, = database_ids([after])
+        except ValidationError:
+            raise GraphQLError(f"Invalid `after` id: {after}")
+        decoded = None if str(after).isdigit() else decode(str(after))
+        if type_name and decoded is not None and decoded[0] != type_name:
+            raise GraphQLError(f"`after` must be the id of a {type_name}, not of a {decoded[0]}")
+        queryset = queryset.filter(pk__gt=after_id)
+    return queryset.order_by('pk')[:limit]
+
+
+def chunked(rows, prepare=None, chunk_size=CHUNK_SIZE):
+    """Yield ``rows`` through, calling ``prepare(chunk)`` on every ``chunk_size`` of them first."""
+    rows = iter(rows)
+    while chunk := list(islice(rows, chunk_size)):
+        if prepare:
+            prepare(chunk)
+        yield from chunk
@@ -0,0 +1,181 @@
+"""
+On-demand profiling of single GraphQL requests.
+
+A request carrying ``X-GraphQL-Profile: <token>``, where the token matches
+``GRAPHQL_PROFILING['TOKEN']``, runs under cProfile and tracemalloc with
+its SQL statements timed. Two files are written to
+``GRAPHQL_PROFILING['DIRECTORY']``, named after the time and the
+operation:
+
+* ``<name>.prof``: the cProfile data, for ``python -m pstats`` or snakeviz;
+* ``<name>.json``: a summary with the wall time, the top functions by own
+  time, SQL count and time with the slowest statements, and the lines
+  that allocated the most memory.
+
+The response carries ``X-GraphQL-Profile: <name>``. Requests without the
+header never reach this module (the view checks for it with one dict
+lookup), and only one request per process is profiled at a time; others
+run normally meanwhile.
+"""
+import cProfile
+import hmac
+import json
+import logging
+import os
+import re
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.utils.cache import patch_cache_control
+from django.utils import timezone
+from graphene_django.views import HttpError
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'HTTP_X_GRAPHQL_PROFILE'
+
+DEFAULTS = {
+    'TOKEN': None,                # profiling is off until a token is configured
+    'DIRECTORY': 'profiles',
+    'TOP': 25,                    # functions, statements and allocation sites in the summary
+}
+
+_lock = threading.Lock()
+
+
+def get_config():
+    """The GRAPHQL_PROFILING setting over DEFAULTS, or None when profiling is off."""
+    configured = getattr(settings, 'GRAPHQL_PROFILING', None)
+    if not configured or not configured.get('TOKEN'):
+        return None
+    return {**DEFAULTS, **configured}
+
+
+def authorized(request, config):
+    return hmac.compare_digest(request.META.get(HEADER, '').encode(), str(config['TOKEN']).encode())
+
+
+def operation_name(view, request):
+    try:
+        data = view.parse_body(request)
+        query, _, name, _ = view.get_graphql_params(request, data if isinstance(data, dict) else {})
+    except HttpError:
+        return 'invalid'
+    if not name and query:
+        match = re.search(r'\b(?:query|mutation|subscription)\s+(\w+)', query)
+        name = match.group(1) if match else None
+    return re.sub(r'[^\w-]', '_', name or 'anonymous')[:64]
+
+
+class SQLTimer:
+    """Database execute wrapper recording (sql, seconds) for every statement."""
+
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.statements.append((sql, time.perf_counter() - started))
+
+
+def _top_functions(profiler, top):
+    profiler.create_stats()
+    rows = sorted(profiler.stats.items(), key=lambda item: item[1][2], reverse=True)[:top]
+    return [
+        {
+            'function': f"{filename}:{line}({name})",
+            'calls': calls,
+            'own_ms': round(own * 1000, 3),
+            'cumulative_ms': round(cumulative * 1000, 3),
+        }
+        for (filename, line, name), (_, calls, own, cumulative, _) in rows
+    ]
+
+
+def _top_allocations(snapshot, top):
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ])
+    return [
+        {'location': str(stat.traceback), 'kb': round(stat.size / 1024, 1), 'blocks': stat.count}
+        for stat in snapshot.statistics('lineno')[:top]
+    ]
+
+
+def profile(view, request, handler):
+    """Run ``handler()`` for ``request``, profiled if the request is authorized and no other profile is running."""
+    config = get_config()
+    if config is None or not authorized(request, config) or not _lock.acquire(blocking=False):
+        return handler()
+    try:
+        return _profile(view, request, handler, config)
+    finally:
+        _lock.release()
+
+
+def _profile(view, request, handler, config):
+    operation = operation_name(view, request)
+    timer = SQLTimer()
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            profiler.enable()
+            try:
+                response = handler()
+            finally:
+                profiler.disable()
+        elapsed = time.perf_counter() - started
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+
+    top = config['TOP']
+    name = f"{timezone.now():%Y%m%dT%H%M%S}-{operation}-{uuid.uuid4().hex[:6]}"
+    directory = os.fspath(config['DIRECTORY'])
+    os.makedirs(directory, exist_ok=True)
+    profiler.dump_stats(os.path.join(directory, f"{name}.prof"))
+    statements = sorted(timer.statements, key=lambda statement: statement[1], reverse=True)
+    summary = {
+        'operation': operation,
+        'status': response.status_code,
+        'wall_ms': round(elapsed * 1000, 3),
+        'sql': {
+            'count': len(statements),
+            'total_ms': round(sum(seconds for _, seconds in statements) * 1000, 3),
+            'slowest': [{'sql': sql, 'ms': round(seconds * 1000, 3)} for sql, seconds in statements[:top]],
+        },
+        'memory': {
+            'peak_kb': round(peak / 1024, 1),
+            'top_allocations': _top_allocations(snapshot, top),
+        },
+        'functions': _top_functions(profiler, top),
+    }
+    with open(os.path.join(directory, f"{name}.json"), 'w') as fh:
+        json.dump(summary, fh, indent=2)
+    logger.info(
+        "Profiled %s: %.1f ms, %d SQL statements (%.1f ms), peak %.0f KB -> %s",
+        operation, summary['wall_ms'], summary['sql']['count'], summary['sql']['total_ms'],
+        summary['memory']['peak_kb'], name,
+    )
+    response['X-GraphQL-Profile'] = name
+    # A proxy must not hand this response to someone else
+    patch_cache_control(response, no_store=True)
+    return response
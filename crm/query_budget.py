@@ -0,0 +1,78 @@
+"""
+SQL statement budgets for the benchmark corpus.
+
+Every operation in ``crm.benchmark.CORPUS`` is run against a small fixed
+fixture and its SQL statements are counted. The counts are compared with
+the budgets committed in ``query_budgets.json``. An N+1 regression makes a
+count scale with the fixture's rows, which blows well past its budget.
+
+Refresh the file after an intended change with
+``python manage.py check_query_budgets --update``.
+"""
+import json
+import random
+from pathlib import Path
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from . import identity
+from .benchmark import CORPUS, fixture_ids, seed_fixture
+
+BUDGET_FILE = Path(__file__).with_name('query_budgets.json')
+
+# Big enough that a per-row query stands out against the per-operation ones
+FIXTURE = {'customers': 20, 'products': 10, 'orders': 50, 'seed': 0}
+
+
+def seed():
+    seed_fixture(**FIXTURE)
+
+
+def measure(operations=None, seed=0):
+    """
+    Return {operation: SQL statements} for the corpus, on the current database.
+
+    Each operation runs in a transaction that is rolled back, so mutations
+    leave the fixture as it was and count the same inside or outside a test.
+    """
+    from alx_backend_graphql.schema import schema
+
+    ids = fixture_ids()
+    rng = random.Random(seed)
+    counts = {}
+    for name in operations or CORPUS:
+        document, make_variables = CORPUS[name]
+        variables = make_variables(ids, rng) if make_variables else None
+        # Each operation gets its own identity map, as each request does
+        with transaction.atomic(), identity.scope():
+            with CaptureQueriesContext(connection) as ctx:
+                result = schema.execute(document, variables=variables)
+            transaction.set_rollback(True)
+        if result.errors:
+            raise RuntimeError(f"{name} failed: {result.errors[0]}")
+        counts[name] = len(ctx.captured_queries)
+    return counts
+
+
+def load_budgets(path=BUDGET_FILE):
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return {}
+
+
+def write_budgets(counts, path=BUDGET_FILE):
+    with open(path, 'w') as fh:
+        json.dump(dict(sorted(counts.items())), fh, indent=2)
+        fh.write('\n')
+
+
+def over_budget(counts, budgets):
+    """{operation: (count, budget)} for operations above, or missing from, their budget."""
+    return {
+        name: (count, budgets.get(name))
+        for name, count in counts.items()
+        if name not in budgets or count > budgets[name]
+    }
@@ -0,0 +1,175 @@
+from django.db import models, transaction
+from django.db.models import Count, ExpressionWrapper, F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from . import identity
+from .models import ArchivedOrder, Order, DailySales, DailyProductSales, CustomerSales, Product
+
+
+def order_day(order_date):
+    """Return the calendar day an order counts towards (in the current timezone)."""
+    if timezone.is_aware(order_date):
+        return timezone.localdate(order_date)
+    return order_date.date()
+
+
+def record_order(order, products):
+    """
+    Add a freshly created order to the sales rollups and the products' sales counters.
+
+    Must run inside the transaction that creates the order so the rollups
+    commit (or roll back) together with it. Each rollup row is created
+    empty if missing and then incremented with F() expressions, so
+    concurrent orders never overwrite each other's totals.
+    """
+    day = order_day(order.order_date)
+
+    DailySales.objects.bulk_create([DailySales(day=day)], ignore_conflicts=True)
+    DailySales.objects.filter(day=day).update(
+        orders_count=F('orders_count') + 1,
+        revenue=F('revenue') + order.total_amount,
+    )
+
+    CustomerSales.objects.bulk_create([CustomerSales(customer_id=order.customer_id)], ignore_conflicts=True)
+    CustomerSales.objects.filter(customer_id=order.customer_id).update(
+        orders_count=F('orders_count') + 1,
+        revenue=F('revenue') + order.total_amount,
+    )
+
+    DailyProductSales.objects.bulk_create(
+        [DailyProductSales(day=day, product_id=p.id) for p in products],
+        ignore_conflicts=True,
+    )
+    for p in products:
+        DailyProductSales.objects.filter(day=day, product_id=p.id).update(
+            units_sold=F('units_sold') + 1,
+            revenue=F('revenue') + p.price,
+        )
+
+    # Each product appears once per order, so one UPDATE covers them all
+    Product.objects.filter(pk__in=[p.id for p in products]).update(
+        units_sold=F('units_sold') + 1,
+        revenue=F('revenue') + F('price'),
+    )
+    for p in products:
+        # The instance loaded for this request no longer has the stored counters
+        identity.discard(Product, p.id)
+
+
+def _combined(*querysets, key):
+    """Add up the ``n`` and ``total`` of aggregate rows from several tables that share ``key``."""
+    totals = {}
+    for queryset in querysets:
+        for row in queryset:
+            k = tuple(row[field] for field in key)
+            n, total = totals.get(k, (0, 0))
+            totals[k] = (n + row['n'], total + row['total'])
+    return [dict(zip(key, k), n=n, total=total) for k, (n, total) in totals.items()]
+
+
+def product_sales_expressions():
+    """(units sold, revenue) of the outer product over the order lines of both order tables."""
+    def lines(through):
+        counts = through.objects.filter(product_id=OuterRef('pk')).order_by().values('product_id')
+        return Coalesce(Subquery(counts.annotate(n=Count('id')).values('n'), output_field=models.IntegerField()), 0)
+
+    units = lines(Order.products.through) + lines(ArchivedOrder.products.through)
+    # Lines do not keep the price paid; like rebuild_rollups, revenue uses the current price
+    revenue = ExpressionWrapper(F('price') * units, output_field=models.DecimalField(max_digits=14, decimal_places=2))
+    return units, revenue
+
+
+def reconcile_product_sales(batch_size=1000, progress=None):
+    """
+    Recompute every product's units_sold and revenue from the order lines.
+
+    Products are updated ``batch_size`` at a time. Each batch locks its
+    rows first (``SELECT ... FOR UPDATE``), so orders touching them have
+    either committed before the ``UPDATE`` that counts the lines, and are
+    counted, or wait until the batch commits and increment the recomputed
+    value. Only products whose counters are off are written.
+    ``progress(done, total)`` is called after every batch. Returns
+    {'products', 'corrected'}.
+    """
+    units, revenue = product_sales_expressions()
+    ids = list(Product.objects.order_by('id').values_list('id', flat=True))
+    corrected = 0
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start:start + batch_size]
+        with transaction.atomic():
+            # Without the lock, an UPDATE waiting on an order's row lock would count lines from before that order
+            list(Product.objects.select_for_update().filter(id__in=batch).order_by('id').values_list('id', flat=True))
+            corrected += (
+                Product.objects.filter(id__in=batch)
+                .filter(~Q(units_sold=units) | ~Q(revenue=revenue))
+                .update(units_sold=units, revenue=revenue)
+            )
+        if progress:
+            progress(start + len(batch), len(ids))
+    return {'products': len(ids), 'corrected': corrected}
+
+
+def rebuild_rollups(batch_size=1000):
+    """Recompute every sales rollup from the orders and archived orders tables. Returns row counts per rollup."""
+    through = Order.products.through
+    archived_through = ArchivedOrder.products.through
+
+    with transaction.atomic():
+        DailySales.objects.all().delete()
+        DailyProductSales.objects.all().delete()
+        CustomerSales.objects.all().delete()
+
+        daily = _combined(
+            *(
+                model.objects.annotate(day=TruncDate('order_date'))
+                .values('day')
+                .annotate(n=Count('id'), total=Sum('total_amount'))
+                .order_by()
+                for model in (Order, ArchivedOrder)
+            ),
+            key=('day',),
+        )
+        DailySales.objects.bulk_create(
+            (DailySales(day=row['day'], orders_count=row['n'], revenue=row['total']) for row in daily),
+            batch_size=batch_size,
+        )
+
+        product_daily = _combined(
+            through.objects.annotate(day=TruncDate('order__order_date'))
+            .values('day', 'product_id')
+            .annotate(n=Count('id'), total=Sum('product__price'))
+            .order_by(),
+            archived_through.objects.annotate(day=TruncDate('archivedorder__order_date'))
+            .values('day', 'product_id')
+            .annotate(n=Count('id'), total=Sum('product__price'))
+            .order_by(),
+            key=('day', 'product_id'),
+        )
+        DailyProductSales.objects.bulk_create(
+            (
+                DailyProductSales(day=row['day'], product_id=row['product_id'], units_sold=row['n'], revenue=row['total'])
+                for row in product_daily
+            ),
+            batch_size=batch_size,
+        )
+
+        per_customer = _combined(
+            *(
+                model.objects.values('customer_id')
+                .annotate(n=Count('id'), total=Sum('total_amount'))
+                .order_by()
+                for model in (Order, ArchivedOrder)
+            ),
+            key=('customer_id',),
+        )
+        CustomerSales.objects.bulk_create(
+            (CustomerSales(customer_id=row['customer_id'], orders_count=row['n'], revenue=row['total']) for row in per_customer),
+            batch_size=batch_size,
+        )
+
+    return {
+        'daily_sales': DailySales.objects.count(),
+        'daily_product_sales': DailyProductSales.objects.count(),
+        'customer_sales': CustomerSales.objects.count(),
+    }
@@ -0,0 +1,81 @@
+"""
+Read/write database routing.
+
+GraphQL query operations read from the ``replica`` alias and everything
+else goes to ``default``. Once a request runs a mutation it stays on
+``default`` for the rest of the request, so it always reads its own writes.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from graphql import OperationType
+
+REPLICA_ALIAS = 'replica'
+
+# None: no GraphQL operation yet (plain Django code reads from default)
+# 'replica': inside a query operation
+# 'default': a mutation ran in this request, stay on the primary
+_read_alias = ContextVar('crm_read_alias', default=None)
+
+
+def read_alias():
+    return _read_alias.get()
+
+
+def use_replica():
+    if _read_alias.get() is None:
+        _read_alias.set(REPLICA_ALIAS)
+
+
+def pin_primary():
+    _read_alias.set('default')
+
+
+@contextmanager
+def request_scope():
+    """Start a request with no routing decision and forget it again afterwards."""
+    token = _read_alias.set(None)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+class ReadWriteRouter:
+    """Django database router: replica reads for query operations, primary for the rest."""
+
+    def __init__(self):
+        self.has_replica = REPLICA_ALIAS in settings.DATABASES
+
+    def db_for_read(self, model, **hints):
+        if self.has_replica and _read_alias.get() == REPLICA_ALIAS:
+            return REPLICA_ALIAS
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return True
+
+
+class DatabaseRoutingMiddleware:
+    """
+    Graphene middleware that picks the read database from the operation type.
+
+    Only top-level fields decide, since the state holds for the rest of the
+    request (querysets are often evaluated after the resolver has returned).
+    """
+
+    def resolve(self, next, root, info, **args):
+        if info.path.prev is None:
+            if info.operation.operation == OperationType.MUTATION:
+                pin_primary()
+            else:
+                use_replica()
+        return next(root, info, **args)
@@ -1,50 +1,156 @@
-import re
 import graphene
+from graphql import FieldNode, FragmentSpreadNode, GraphQLError
 from graphene_django import DjangoObjectType
-from .models import Customer, Product, Order
+from graphene_django.utils import bypass_get_queryset
+from .models import Customer, Product, Order, ArchivedOrder, DailySales, DailyProductSales, CustomerSales, Job
 from django.core.exceptions import ValidationError
-from django.db import transaction
 from decimal import Decimal
 from datetime import datetime
+from itertools import islice
 from django.utils import timezone
 from .filters import CustomerFilter, ProductFilter, OrderFilter
 from graphene_django.filter import DjangoFilterConnectionField
+from django.db.models import Sum
+from .rollups import record_order
+from . import archive, http_cache, identity, jobs, pagination
+from .customers import PHONE_RE, create_customers
+from .idempotency import idempotent
+from .nodes import database_ids, resolve_nodes
+
+
+def selects_any(info, names):
+    """True if the selection below the field being resolved asks for any of the fields ``names``, fragments included."""
+    selection_sets = [node.selection_set for node in info.field_nodes]
+    seen_fragments = set()
+    while selection_sets:
+        selection_set = selection_sets.pop()
+        if selection_set is None:
+            continue
+        for selection in selection_set.selections:
+            if isinstance(selection, FragmentSpreadNode):
+                name = selection.name.value
+                if name not in seen_fragments and name in info.fragments:
+                    seen_fragments.add(name)
+                    selection_sets.append(info.fragments[name].selection_set)
+                continue
+            if isinstance(selection, FieldNode) and selection.name.value in names:
+                return True
+            selection_sets.append(selection.selection_set)
+    return False
+
+
+LIFETIME_VALUE_FIELDS = ('ordersCount', 'totalSpent', 'firstOrderAt', 'lastOrderAt')
+
+
+def check_count(n, field_name):
+    """``n`` for a top-N field; an error if it is negative, as ``pagination.check_limit`` does for ``limit``."""
+    if n < 0:
+        raise GraphQLError(f"`n` on `{field_name}` cannot be negative.")
+    return n
 
-from .mutations import CreateCustomer, BulkCreateCustomers, CreateProduct, CreateOrder
 
 class CustomerType(DjangoObjectType):
+    ordersCount = graphene.Int()
+    totalSpent = graphene.Float()
+    firstOrderAt = graphene.DateTime()
+    lastOrderAt = graphene.DateTime()
+
     class Meta:
         model = Customer
         interfaces = (graphene.relay.Node,)  # Relay node for DjangoFilterConnectionField
 
+    @classmethod
+    def get_queryset(cls, queryset, info):
+        # Annotate a whole page of customers at once instead of one aggregate per customer,
+        # but only when the figures are asked for: the aggregates join every order
+        if selects_any(info, LIFETIME_VALUE_FIELDS):
+            return queryset.with_lifetime_value()
+        return queryset
+
+    def resolve_ordersCount(self, info):
+        return self.lifetime_value()['orders_count']
+
+    def resolve_totalSpent(self, info):
+        return float(self.lifetime_value()['total_spent'])
+
+    def resolve_firstOrderAt(self, info):
+        return self.lifetime_value()['first_order_at']
+
+    def resolve_lastOrderAt(self, info):
+        return self.lifetime_value()['last_order_at']
+
 class ProductType(DjangoObjectType):
-    price = graphene.Float()  # Override to use Float instead of Decimal
+    # Float instead of Decimal; the Float scalar converts the model's Decimal itself
+    price = graphene.Float()
+    revenue = graphene.Float()
     
     class Meta:
         model = Product
         interfaces = (graphene.relay.Node,)
-        
-    def resolve_price(self, info):
-        return float(self.price)
 
 class OrderType(DjangoObjectType):
-    totalAmount = graphene.Float()
-    orderDate = graphene.DateTime()
+    totalAmount = graphene.Float(source='total_amount')
+    orderDate = graphene.DateTime(source='order_date')
     products = graphene.List(ProductType)  # Override the default connection
     
     class Meta:
         model = Order
         # Remove relay interface to avoid connection issues
         # interfaces = (graphene.relay.Node,)
-        
-    def resolve_totalAmount(self, info):
-        return float(self.total_amount)
-        
-    def resolve_orderDate(self, info):
-        return self.order_date
-        
+
+    @classmethod
+    def get_queryset(cls, queryset, info):
+        # One query for the customers and one for all products, instead of one each per order
+        return queryset.with_details()
+
+    @classmethod
+    def is_type_of(cls, root, info):
+        # Archived orders have the same fields and are served as orders
+        return isinstance(root, ArchivedOrder) or super().is_type_of(root, info)
+
+    # graphene-django would otherwise refetch the customer through CustomerType.get_queryset, once per order
+    @bypass_get_queryset
+    def resolve_customer(self, info):
+        return identity.related(self, 'customer')
+
     def resolve_products(self, info):
-        return self.products.all()
+        # The same product is prefetched once per order; hand out one instance per row
+        return [identity.add(product) for product in self.products.all()]
+
+
+class JobType(DjangoObjectType):
+    progress = graphene.Float(description="Share of the items processed so far, 0 to 1.")
+    errors = graphene.List(graphene.String)
+
+    class Meta:
+        model = Job
+        fields = ('id', 'kind', 'status', 'total', 'processed', 'succeeded', 'failed',
+                  'created_at', 'started_at', 'finished_at')
+
+    def resolve_progress(self, info):
+        if self.status == Job.SUCCEEDED:
+            return 1.0
+        return self.processed / self.total if self.total else 0.0
+
+    def resolve_errors(self, info):
+        return self.errors
+
+
+# Sales analytics types (served from the rollup tables)
+class DailySalesType(graphene.ObjectType):
+    day = graphene.Date()
+    ordersCount = graphene.Int()
+    revenue = graphene.Float()
+
+class ProductSalesType(graphene.ObjectType):
+    product = graphene.Field(ProductType)
+    unitsSold = graphene.Int()
+    revenue = graphene.Float()
+
+class CustomerSalesType(graphene.ObjectType):
+    customer = graphene.Field(CustomerType)
+    ordersCount = graphene.Int()
+    revenue = graphene.Float()
 
 
 # Define input types
@@ -73,15 +179,17 @@ class CreateOrderInput(graphene.InputObjectType):
 class CreateCustomer(graphene.Mutation):
     class Arguments:
         input = CreateCustomerInput(required=True)
+        idempotency_key = graphene.String()
 
     customer = graphene.Field(CustomerType)
     message = graphene.String()
 
+    @idempotent
     def mutate(self, info, input):
         if Customer.objects.filter(email=input.email).exists():
             raise ValidationError("Email already exists")
 
-        if input.phone and not re.match(r'^(\+\d{10,15}|\d{3}-\d{3}-\d{4})$', input.phone):
+        if input.phone and not PHONE_RE.match(input.phone):
             raise ValidationError("Invalid phone number format")
 
         customer = Customer.objects.create(
@@ -89,6 +197,7 @@ class CreateCustomer(graphene.Mutation):
             email=input.email,
             phone=input.phone
         )
+        identity.add(customer)
         return CreateCustomer(customer=customer, message="Customer created successfully")
 
 
@@ -96,38 +205,25 @@ class CreateCustomer(graphene.Mutation):
 class BulkCreateCustomers(graphene.Mutation):
     class Arguments:
         input = graphene.List(graphene.NonNull(CustomerInput), required=True)
+        # Large payloads: queue a background job and return it instead of waiting
+        run_async = graphene.Boolean(name="async", default_value=False)
+        idempotency_key = graphene.String()
 
     customers = graphene.List(CustomerType)
     errors = graphene.List(graphene.String)
-
-    def mutate(self, info, input):
-        created_customers = []
-        errors = []
-
-        # Process each customer individually to support partial success
-        for i, data in enumerate(input):
-            try:
-                # Check for duplicate email
-                if Customer.objects.filter(email=data.email).exists():
-                    errors.append(f"Customer {i+1}: Email already exists: {data.email}")
-                    continue
-
-                # Validate phone format
-                if data.phone and not re.match(r'^(\+\d{10,15}|\d{3}-\d{3}-\d{4})$', data.phone):
-                    errors.append(f"Customer {i+1}: Invalid phone format: {data.phone}")
-                    continue
-
-                # Create customer
-                customer = Customer.objects.create(
-                    name=data.name,
-                    email=data.email,
-                    phone=data.phone
-                )
-                created_customers.append(customer)
-
-            except Exception as e:
-                errors.append(f"Customer {i+1}: {str(e)}")
-
+    job = graphene.Field(lambda: JobType)
+
+    @idempotent
+    def mutate(self, info, input, run_async=False):
+        rows = [{'name': data.name, 'email': data.email, 'phone': data.phone} for data in input]
+        if run_async:
+            job = jobs.enqueue('bulk_create_customers', {'customers': rows}, total=len(rows))
+            return BulkCreateCustomers(customers=[], errors=[], job=job)
+
+        # Invalid customers are reported in errors; the rest are still created
+        created_customers, errors = create_customers(rows)
+        for customer in created_customers:
+            identity.add(customer)
         return BulkCreateCustomers(customers=created_customers, errors=errors)
 
 
@@ -135,9 +231,11 @@ class BulkCreateCustomers(graphene.Mutation):
 class CreateProduct(graphene.Mutation):
     class Arguments:
         input = CreateProductInput(required=True)
+        idempotency_key = graphene.String()
 
     product = graphene.Field(ProductType)
 
+    @idempotent
     def mutate(self, info, input):
         if Decimal(input.price) <= 0:
             raise ValidationError("Price must be positive")
@@ -149,6 +247,7 @@ class CreateProduct(graphene.Mutation):
             price=input.price,
             stock=input.stock if input.stock is not None else 0
         )
+        identity.add(product)
         return CreateProduct(product=product)
 
 
@@ -156,46 +255,37 @@ class CreateProduct(graphene.Mutation):
 class CreateOrder(graphene.Mutation):
     class Arguments:
         input = CreateOrderInput(required=True)
+        # Retries with the same key return the first result instead of creating another order
+        idempotency_key = graphene.String()
 
     order = graphene.Field(OrderType)
 
+    @idempotent
+    @identity.atomic()
     def mutate(self, info, input):
-        # Helper function to extract database ID from Node ID
-        def get_database_id(node_id):
-            try:
-                # Try to decode as Node ID first
-                from graphql_relay import from_global_id
-                _, db_id = from_global_id(node_id)
-                return int(db_id)
-            except:
-                # If that fails, assume it's already a database ID
-                try:
-                    return int(node_id)
-                except ValueError:
-                    raise ValidationError(f"Invalid ID format: {node_id}")
-        
-        # Validate customer ID
+        # Validate customer ID (a global ID or a plain database ID)
         try:
-            customer_db_id = get_database_id(input.customerId)
-            customer = Customer.objects.get(id=customer_db_id)
-        except Customer.DoesNotExist:
-            raise ValidationError("Invalid customer ID")
+            customer_db_id, = database_ids([input.customerId])
         except Exception as e:
             raise ValidationError(f"Invalid customer ID format: {str(e)}")
+        customer = identity.load(Customer, [customer_db_id]).get(customer_db_id)
+        if customer is None:
+            raise ValidationError("Invalid customer ID")
 
         # Validate product IDs
         if not input.productIds:
             raise ValidationError("At least one product must be selected")
         
         try:
-            product_db_ids = [get_database_id(pid) for pid in input.productIds]
+            product_db_ids = database_ids(input.productIds)
         except Exception as e:
             raise ValidationError(f"Invalid product ID format: {str(e)}")
             
-        products = Product.objects.filter(id__in=product_db_ids)
-        if not products.exists():
+        # Products this request has already loaded are not fetched again
+        products = list(identity.load(Product, product_db_ids).values())
+        if not products:
             raise ValidationError("No valid products found")
-        if products.count() != len(input.productIds):
+        if len(products) != len(input.productIds):
             raise ValidationError("Some product IDs are invalid")
 
         # Calculate total amount accurately
@@ -208,6 +298,8 @@ class CreateOrder(graphene.Mutation):
             order_date=input.orderDate or timezone.now()
         )
         order.products.set(products)
+        record_order(order, products)
+        identity.add(order)
 
         return CreateOrder(order=order)
 
@@ -219,19 +311,111 @@ class Query(graphene.ObjectType):
     # Remove all_orders from connection field since OrderType doesn't have relay interface
     # all_orders = DjangoFilterConnectionField(OrderType, filterset_class=OrderFilter)
 
-    # Keep your old simple lists as well if you want
-    customers = graphene.List(CustomerType)
-    products = graphene.List(ProductType)
-    orders = graphene.List(OrderType)
-
-    def resolve_customers(self, info):
-        return Customer.objects.all()
-
-    def resolve_products(self, info):
-        return Product.objects.all()
-
-    def resolve_orders(self, info):
-        return Order.objects.all()
+    # Keep your old simple lists as well if you want. Pages of at most
+    # RELAY_CONNECTION_MAX_LIMIT rows, in id order (see crm/pagination.py)
+    customers = graphene.List(CustomerType, limit=graphene.Int(), after=graphene.ID())
+    products = graphene.List(ProductType, limit=graphene.Int(), after=graphene.ID())
+    # Recent orders by default; a range starting before the archive cutoff includes archived ones
+    orders = graphene.List(
+        OrderType,
+        date_from=graphene.DateTime(name="from"),
+        date_to=graphene.DateTime(name="to"),
+        limit=graphene.Int(),
+        after=graphene.ID(),
+    )
+    low_stock_products = graphene.List(ProductType, threshold=graphene.Int())
+    job = graphene.Field(JobType, id=graphene.ID(required=True))
+    node = graphene.relay.Node.Field()
+    # One IN query per type for the whole list, results in the order of ids
+    nodes = graphene.List(graphene.relay.Node, ids=graphene.List(graphene.NonNull(graphene.ID), required=True))
+    # Sales analytics, read from the rollup tables instead of scanning orders
+    sales_by_day = graphene.List(
+        DailySalesType,
+        date_from=graphene.Date(name="from"),
+        date_to=graphene.Date(name="to"),
+    )
+    top_products = graphene.List(
+        ProductSalesType,
+        n=graphene.Int(default_value=10),
+        date_from=graphene.Date(name="from"),
+        date_to=graphene.Date(name="to"),
+    )
+    top_customers = graphene.List(CustomerSalesType, n=graphene.Int(default_value=10))
+
+    def resolve_customers(self, info, limit=None, after=None):
+        limit = pagination.check_limit(limit, info.field_name)
+        customers = CustomerType.get_queryset(Customer.objects.all(), info)
+        return pagination.page(customers, limit, after, CustomerType._meta.name).iterator(chunk_size=pagination.CHUNK_SIZE)
+
+    def resolve_products(self, info, limit=None, after=None):
+        limit = pagination.check_limit(limit, info.field_name)
+        products = pagination.page(Product.objects.all(), limit, after, ProductType._meta.name)
+        return products.iterator(chunk_size=pagination.CHUNK_SIZE)
+
+    def resolve_low_stock_products(self, info, threshold=None):
+        return Product.objects.low_stock(threshold)
+
+    def resolve_nodes(self, info, ids):
+        return resolve_nodes(info, ids)
+
+    def resolve_job(self, info, id):
+        # Clients poll this field, so no cached copy may answer for it
+        http_cache.no_store(info.context)
+        # Progress is written by the worker; read it from the primary, not a lagging replica
+        return Job.objects.using('default').filter(pk=id).first()
+
+    def resolve_orders(self, info, date_from=None, date_to=None, limit=None, after=None):
+        limit = pagination.check_limit(limit, info.field_name)
+        querysets = [
+            pagination.page(OrderType.get_queryset(qs, info), limit, after, OrderType._meta.name)
+            for qs in archive.order_querysets(date_from, date_to)
+        ]
+        orders = islice(archive.merge_by_id(querysets, chunk_size=pagination.CHUNK_SIZE), limit)
+        # Per chunk, one query for the customers the request has not loaded yet, one instance per customer
+        return pagination.chunked(orders, lambda chunk: identity.attach(chunk, 'customer'))
+
+    def resolve_sales_by_day(self, info, date_from=None, date_to=None):
+        qs = DailySales.objects.order_by('day')
+        if date_from:
+            qs = qs.filter(day__gte=date_from)
+        if date_to:
+            qs = qs.filter(day__lte=date_to)
+        return [
+            DailySalesType(day=row.day, ordersCount=row.orders_count, revenue=float(row.revenue))
+            for row in qs
+        ]
+
+    def resolve_top_products(self, info, n=10, date_from=None, date_to=None):
+        n = check_count(n, info.field_name)
+        if not date_from and not date_to:
+            # All-time totals are kept on the products themselves, behind an index
+            return [
+                ProductSalesType(product=identity.add(p), unitsSold=p.units_sold, revenue=float(p.revenue))
+                for p in Product.objects.filter(units_sold__gt=0).order_by('-revenue', 'id')[:n]
+            ]
+        qs = DailyProductSales.objects.all()
+        if date_from:
+            qs = qs.filter(day__gte=date_from)
+        if date_to:
+            qs = qs.filter(day__lte=date_to)
+        rows = list(
+            qs.values('product_id')
+            .annotate(units=Sum('units_sold'), total=Sum('revenue'))
+            .order_by('-total', 'product_id')[:n]
+        )
+        products = identity.load(Product, [row['product_id'] for row in rows])
+        return [
+            ProductSalesType(product=products[row['product_id']], unitsSold=row['units'], revenue=float(row['total']))
+            for row in rows
+        ]
+
+    def resolve_top_customers(self, info, n=10):
+        n = check_count(n, info.field_name)
+        qs = CustomerSales.objects.select_related('customer').order_by('-revenue', 'customer_id')[:n]
+        return [
+            CustomerSalesType(customer=row.customer, ordersCount=row.orders_count, revenue=float(row.revenue))
+            for row in qs
+        ]
 
 # Mutation
 class Mutation(graphene.ObjectType):
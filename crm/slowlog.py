@@ -0,0 +1,236 @@
+"""
+Slow-operation log for the GraphQL endpoint.
+
+Every request is observed cheaply: its SQL statements are timed by a
+database execute wrapper and, through ``ResolverTimingMiddleware``, the
+resolvers of object and list fields are timed per ``Type.field``. When an
+operation takes ``THRESHOLD_MS`` or longer, one JSON line is appended to
+``FILE`` (rotated at ``MAX_BYTES``, keeping ``BACKUPS`` old files) with:
+
+* the operation name, a hash of the normalised document (so the same query
+  sent with different whitespace or variables groups together) and the
+  shape of the variables (their types, never their values);
+* the wall time and response status;
+* every SQL statement with its duration and database alias (placeholders
+  only; parameters are not logged);
+* the resolver timings, slowest first;
+* the query plan of the ``EXPLAIN`` slowest ``SELECT`` statements
+  (``EXPLAIN QUERY PLAN`` on SQLite), taken after the response is built
+  and only for slow operations.
+
+Resolver times cover the resolver call itself: for list fields that hand
+the executor a queryset or generator, the rows are fetched afterwards and
+show up under SQL instead.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+from logging.handlers import RotatingFileHandler
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.utils import timezone
+from graphene_django.views import HttpError
+from graphql import GraphQLError, OperationDefinitionNode, get_named_type, is_leaf_type, parse, print_ast
+
+DEFAULTS = {
+    'THRESHOLD_MS': 500,          # operations at least this slow are logged
+    'FILE': 'slow_operations.jsonl',
+    'MAX_BYTES': 10 * 1024 * 1024,
+    'BACKUPS': 5,
+    'EXPLAIN': 3,                 # slowest SELECT statements whose plan is captured
+    'MAX_STATEMENTS': 1000,       # statements kept per operation; the rest are only counted
+    'TOP_RESOLVERS': 25,
+}
+
+# Written to by this module only; the handler is (re)attached from the settings
+logger = logging.getLogger('crm.slow_operations')
+logger.propagate = False
+
+_timings = ContextVar('crm_resolver_timings', default=None)
+_handler_lock = threading.Lock()
+
+
+def get_config():
+    """The GRAPHQL_SLOW_LOG setting over DEFAULTS, or None when the log is off."""
+    configured = getattr(settings, 'GRAPHQL_SLOW_LOG', None)
+    if configured is None:
+        return None
+    return {**DEFAULTS, **configured}
+
+
+class ResolverTimingMiddleware:
+    """
+    Graphene middleware adding up the time spent in each resolver.
+
+    Scalar fields are passed straight through, as are all fields outside
+    an observed request.
+    """
+
+    def resolve(self, next, root, info, **args):
+        timings = _timings.get()
+        if timings is None or is_leaf_type(get_named_type(info.return_type)):
+            return next(root, info, **args)
+        started = time.perf_counter()
+        try:
+            return next(root, info, **args)
+        finally:
+            key = f"{info.parent_type.name}.{info.field_name}"
+            calls, seconds = timings.get(key, (0, 0.0))
+            timings[key] = (calls + 1, seconds + time.perf_counter() - started)
+
+
+class StatementRecorder:
+    """Database execute wrapper recording (alias, sql, params, seconds) for the first ``limit`` statements."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.statements = []
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.seconds += elapsed
+            if len(self.statements) < self.limit:
+                self.statements.append((context['connection'].alias, sql, None if many else params, elapsed))
+
+
+def observe(view, request, handler):
+    """Run ``handler()`` for ``request`` and log the operation if it turns out to be slow."""
+    config = get_config()
+    if config is None:
+        return handler()
+    recorder = StatementRecorder(config['MAX_STATEMENTS'])
+    timings = {}
+    token = _timings.set(timings)
+    started = time.perf_counter()
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = handler()
+    finally:
+        _timings.reset(token)
+    elapsed = time.perf_counter() - started
+    if elapsed * 1000 >= config['THRESHOLD_MS']:
+        record(config, entry(view, request, response, elapsed, recorder, timings, config))
+    return response
+
+
+def variable_shape(value):
+    """``value`` with every scalar replaced by its type name; lists by their length and first item's shape."""
+    if isinstance(value, dict):
+        return {key: variable_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return {'length': len(value), 'items': variable_shape(value[0]) if value else None}
+    return 'null' if value is None else type(value).__name__
+
+
+def describe_operation(view, request):
+    """(operation name, normalised document hash, variable shape) for the request, as far as it can be read."""
+    try:
+        data = view.parse_body(request)
+        query, variables, name, _ = view.get_graphql_params(request, data if isinstance(data, dict) else {})
+    except HttpError:
+        return None, None, None
+    document_hash = None
+    if query:
+        try:
+            document = parse(query)
+        except GraphQLError:
+            pass
+        else:
+            document_hash = hashlib.sha256(print_ast(document).encode()).hexdigest()[:16]
+            if not name:
+                names = [d.name.value for d in document.definitions
+                         if isinstance(d, OperationDefinitionNode) and d.name]
+                name = names[0] if len(names) == 1 else None
+    return name, document_hash, variable_shape(variables or {})
+
+
+def explain(alias, sql, params):
+    """The query plan of one statement as a list of lines, or an error message."""
+    connection = connections[alias]
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            # SQLite puts node ids before the detail; PostgreSQL returns one text column
+            return [str(row[-1]) for row in cursor.fetchall()]
+    except DatabaseError as error:
+        return [f"EXPLAIN failed: {error}"]
+
+
+def entry(view, request, response, elapsed, recorder, timings, config):
+    name, document_hash, shape = describe_operation(view, request)
+    statements = recorder.statements
+    slowest = []
+    seen = set()
+    for alias, sql, params, seconds in sorted(statements, key=lambda statement: statement[3], reverse=True):
+        if len(slowest) >= config['EXPLAIN']:
+            break
+        if sql in seen or params is None or not sql.lstrip().upper().startswith('SELECT'):
+            continue
+        seen.add(sql)
+        slowest.append({'sql': sql, 'ms': round(seconds * 1000, 3), 'plan': explain(alias, sql, params)})
+    resolvers = sorted(timings.items(), key=lambda item: item[1][1], reverse=True)[:config['TOP_RESOLVERS']]
+    return {
+        'timestamp': timezone.now().isoformat(),
+        'operation': name or 'anonymous',
+        'document_hash': document_hash,
+        'variables': shape,
+        'status': response.status_code,
+        'duration_ms': round(elapsed * 1000, 3),
+        'sql': {
+            'count': recorder.count,
+            'total_ms': round(recorder.seconds * 1000, 3),
+            'statements': [
+                {'alias': alias, 'sql': sql, 'ms': round(seconds * 1000, 3)}
+                for alias, sql, _, seconds in statements
+            ],
+            'truncated': recorder.count > len(statements),
+        },
+        'plans': slowest,
+        'resolvers': [
+            {'field': field, 'calls': calls, 'ms': round(seconds * 1000, 3)}
+            for field, (calls, seconds) in resolvers
+        ],
+    }
+
+
+def _handler(config):
+    """The rotating file handler for the configured file, replacing the previous one if the settings changed."""
+    path = os.path.abspath(os.fspath(config['FILE']))
+    with _handler_lock:
+        # Handlers attached by logging configuration are left alone
+        for handler in list(logger.handlers):
+            if not isinstance(handler, RotatingFileHandler):
+                continue
+            if handler.baseFilename == path and handler.maxBytes == config['MAX_BYTES'] \
+                    and handler.backupCount == config['BACKUPS']:
+                return handler
+            logger.removeHandler(handler)
+            handler.close()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handler = RotatingFileHandler(path, maxBytes=config['MAX_BYTES'], backupCount=config['BACKUPS'],
+                                      encoding='utf-8', delay=True)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        return handler
+
+
+def record(config, data):
+    _handler(config)
+    logger.info(json.dumps(data, default=str))
@@ -0,0 +1,41 @@
+from django.conf import settings
+
+
+def apply_pragmas(sender, connection, **kwargs):
+    """
+    connection_created handler: tune every new SQLite connection from settings.
+
+    busy_timeout is applied first so that switching journal_mode waits for
+    other connections instead of failing with "database is locked".
+    """
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = dict(getattr(settings, 'SQLITE_PRAGMAS', {}))
+    busy_timeout = pragmas.pop('busy_timeout', None)
+    with connection.cursor() as cursor:
+        if busy_timeout is not None:
+            cursor.execute(f"PRAGMA busy_timeout = {int(busy_timeout)}")
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+
+    # In-memory (test) databases use shared-cache table locks, where an
+    # up-front write lock only makes mirrored connections collide.
+    transaction_mode = getattr(settings, 'SQLITE_TRANSACTION_MODE', None)
+    if transaction_mode and not connection.is_in_memory_db():
+        use_transaction_mode(connection, transaction_mode)
+
+
+def use_transaction_mode(connection, mode):
+    """
+    Open atomic blocks with "BEGIN <mode>" (e.g. IMMEDIATE) instead of a deferred BEGIN.
+
+    A deferred transaction that reads and then writes has to upgrade its
+    lock, and SQLite fails that upgrade straight away with "database is
+    locked" rather than waiting out busy_timeout. Taking the write lock at
+    BEGIN makes concurrent writers queue on busy_timeout instead. Django 5.1+
+    offers the same through OPTIONS["transaction_mode"].
+    """
+    def start_transaction_under_autocommit():
+        connection.cursor().execute(f"BEGIN {mode}")
+
+    connection._start_transaction_under_autocommit = start_transaction_under_autocommit
@@ -0,0 +1,121 @@
+"""
+Startup instrumentation and schema preloading.
+
+``preload_schema()`` imports and builds the canonical GraphQL schema and
+warms graphql-core, recording how long each step took in ``TIMINGS``. The
+WSGI/ASGI modules call it when ``GRAPHQL_PRELOAD_SCHEMA`` is set. Under a
+pre-forking server that loads the app in the master (``gunicorn --preload``)
+the workers then inherit the built schema instead of each building their
+own on their first request.
+
+``profile_startup()`` measures a cold start in a fresh interpreter: the
+import/build phases plus ``-X importtime`` totals per top-level package.
+"""
+import gc
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# phase -> seconds, filled in by preload_schema()
+TIMINGS = {}
+
+# Run by profile_startup() in a child interpreter; prints the phase timings as JSON
+PROFILE_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import django
+django.setup()
+from crm.startup import TIMINGS, preload_schema
+TIMINGS['django_setup'] = time.perf_counter() - started
+preload_schema(freeze=False)
+json.dump(TIMINGS, sys.stdout)
+"""
+
+
+@contextmanager
+def timed(phase):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        TIMINGS[phase] = time.perf_counter() - started
+
+
+def preload_schema(freeze=True):
+    """
+    Import and build the GraphQL schema now rather than on the first request.
+
+    Database connections opened on the way are closed so forked children do
+    not share them. With ``freeze`` the objects created so far are moved out
+    of the garbage collector's reach (``gc.freeze()``), so collections in the
+    workers don't write to, and un-share, the inherited pages.
+    """
+    from graphene_django.settings import graphene_settings
+
+    with timed('import_types'):
+        import crm.schema  # noqa: F401  (object types and filtersets)
+    with timed('build_schema'):
+        schema = graphene_settings.SCHEMA
+        # graphene-django creates the filter argument types here, when the schema first asks for the fields
+        schema.graphql_schema
+    with timed('first_execution'):
+        result = schema.execute('{ __typename }')
+    if result.errors:
+        raise result.errors[0]
+
+    connections.close_all()
+    if freeze:
+        gc.freeze()
+    logger.info("GraphQL schema preloaded in %s", ", ".join(f"{k} {v * 1000:.1f}ms" for k, v in TIMINGS.items()))
+    return schema
+
+
+def preload_if_enabled():
+    """Called at the end of the WSGI/ASGI modules."""
+    from django.conf import settings
+
+    if getattr(settings, 'GRAPHQL_PRELOAD_SCHEMA', False):
+        preload_schema()
+
+
+def parse_importtime(stderr):
+    """Sum ``-X importtime`` self times per top-level package, in seconds."""
+    totals = defaultdict(float)
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        if self_us.strip().isdigit():
+            totals[name.strip().split('.')[0]] += int(self_us) / 1e6
+    return dict(sorted(totals.items(), key=lambda item: -item[1]))
+
+
+def profile_startup(settings_module=None):
+    """
+    Cold-start a fresh interpreter, preload the schema and report where the time went.
+
+    Returns {'total': seconds, 'phases': {phase: seconds}, 'imports': {package: seconds}}.
+    """
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': settings_module or os.environ['DJANGO_SETTINGS_MODULE']}
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROFILE_SCRIPT],
+        capture_output=True, text=True, env=env, check=False,
+    )
+    total = time.perf_counter() - started
+    if proc.returncode:
+        raise RuntimeError(f"Startup profile failed:\n{proc.stderr[-2000:]}")
+    return {
+        'total': total,
+        'phases': json.loads(proc.stdout.strip().splitlines()[-1]),
+        'imports': parse_importtime(proc.stderr),
+    }
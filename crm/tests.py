@@ -1,3 +1,1148 @@
-from django.test import TestCase
+import csv
+import gzip
+import hashlib
+import json
+import logging
+import logging.handlers
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import django_filters
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from graphql_relay import to_global_id
+
+from alx_backend_graphql.schema import schema
+
+from . import admission, encoders, http_cache, identity, introspection, jobs, profiling, slowlog, tracing
+from .archive import archive_orders, default_cutoff
+from .datagen import generate
+from .export import export, pyarrow
+from .filters import OrderFilter, ProductFilter, RelationFilterSet, semi_join
+from .query_budget import load_budgets, measure, over_budget, seed as seed_budget_fixture
+from .models import Customer, Product, Order, ArchivedOrder, DailySales, DailyProductSales, CustomerSales, Job, IdempotencyKey
+from .routers import DatabaseRoutingMiddleware, ReadWriteRouter, read_alias, request_scope
+from .sqlite import use_transaction_mode
+from .startup import TIMINGS, parse_importtime, preload_schema
+
+
+def execute(query, variables=None, context=None):
+    result = schema.execute(query, variables=variables, context_value=context)
+    assert result.errors is None, result.errors
+    return result.data
+
+
+CREATE_ORDER = """
+mutation($customerId: ID!, $productIds: [ID]!) {
+  createOrder(input: { customerId: $customerId, productIds: $productIds }) {
+    order { id totalAmount }
+  }
+}
+"""
+
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        self.alice = Customer.objects.create(name="Alice", email="alice@example.com")
+        self.bob = Customer.objects.create(name="Bob", email="bob@example.com")
+        self.laptop = Product.objects.create(name="Laptop", price=Decimal("1000.00"), stock=5)
+        self.mouse = Product.objects.create(name="Mouse", price=Decimal("25.50"), stock=50)
+
+    def create_order(self, customer, products):
+        return execute(CREATE_ORDER, {
+            "customerId": str(customer.id),
+            "productIds": [str(p.id) for p in products],
+        })
+
+    def create_orders(self):
+        self.create_order(self.alice, [self.laptop, self.mouse])
+        self.create_order(self.bob, [self.mouse])
+        self.create_order(self.bob, [self.mouse])
+
+    def test_create_order_updates_rollups(self):
+        self.create_orders()
+        today = timezone.localdate()
+
+        data = execute("""query($day: Date) { salesByDay(from: $day, to: $day) { day ordersCount revenue } }""", {"day": str(today)})
+        self.assertEqual(data["salesByDay"], [{"day": str(today), "ordersCount": 3, "revenue": 1076.5}])
+
+        data = execute("""{ topProducts(n: 1) { product { name } unitsSold revenue } }""")
+        self.assertEqual(data["topProducts"], [{"product": {"name": "Laptop"}, "unitsSold": 1, "revenue": 1000.0}])
+
+        data = execute("""query($day: Date) { topProducts(n: 5, from: $day) { product { name } } }""", {"day": str(today + timedelta(days=1))})
+        self.assertEqual(data["topProducts"], [])
+
+        data = execute("""{ topCustomers(n: 2) { customer { name } ordersCount revenue } }""")
+        self.assertEqual(data["topCustomers"], [
+            {"customer": {"name": "Alice"}, "ordersCount": 1, "revenue": 1025.5},
+            {"customer": {"name": "Bob"}, "ordersCount": 2, "revenue": 51.0},
+        ])
+
+    def test_negative_counts_are_rejected(self):
+        for field in ("topProducts", "topCustomers"):
+            result = schema.execute(f"{{ {field}(n: -1) {{ revenue }} }}")
+            self.assertEqual(result.errors[0].message, f"`n` on `{field}` cannot be negative.")
+
+    def test_rebuild_matches_incremental_rollups(self):
+        self.create_orders()
+
+        def snapshot():
+            return (
+                list(DailySales.objects.order_by("day").values_list("day", "orders_count", "revenue")),
+                list(DailyProductSales.objects.order_by("day", "product_id").values_list("day", "product_id", "units_sold", "revenue")),
+                list(CustomerSales.objects.order_by("customer_id").values_list("customer_id", "orders_count", "revenue")),
+            )
+
+        incremental = snapshot()
+        DailySales.objects.update(revenue=0)
+        call_command("rebuild_sales_rollups", stdout=StringIO())
+        self.assertEqual(snapshot(), incremental)
+
+    def test_create_order_increments_product_counters(self):
+        self.create_orders()
+        self.assertEqual(
+            list(Product.objects.order_by("id").values_list("name", "units_sold", "revenue")),
+            [("Laptop", 1, Decimal("1000.00")), ("Mouse", 3, Decimal("76.50"))],
+        )
+
+    def test_reconcile_corrects_drifted_counters(self):
+        self.create_orders()
+        counters = list(Product.objects.order_by("id").values_list("units_sold", "revenue"))
+        Product.objects.filter(pk=self.mouse.pk).update(units_sold=99, revenue=0)
+        archive_orders(timezone.now() + timedelta(seconds=1))  # archived sales still count
+        out = StringIO()
+        call_command("reconcile_product_sales", stdout=out)
+        self.assertIn("Reconciled 2 products, 1 corrected", out.getvalue())
+        self.assertEqual(list(Product.objects.order_by("id").values_list("units_sold", "revenue")), counters)
+
+    def test_products_can_be_ordered_by_sales(self):
+        self.create_orders()
+        data = execute("""{ allProducts(orderBy: "-unitsSold") { edges { node { name unitsSold revenue } } } }""")
+        self.assertEqual(
+            [edge["node"] for edge in data["allProducts"]["edges"]],
+            [{"name": "Mouse", "unitsSold": 3, "revenue": 76.5}, {"name": "Laptop", "unitsSold": 1, "revenue": 1000.0}],
+        )
+        products = ProductFilter({"order_by": "-units_sold"}, queryset=Product.objects.all()).qs
+        sql, params = products[:10].query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            plan = " ".join(str(row[-1]) for row in cursor.fetchall())
+        self.assertIn("crm_product_units_sold_idx", plan)
+
+
+class CustomerLifetimeValueTests(TestCase):
+    def setUp(self):
+        self.alice = Customer.objects.create(name="Alice", email="alice@example.com")
+        self.bob = Customer.objects.create(name="Bob", email="bob@example.com")
+        laptop = Product.objects.create(name="Laptop", price=Decimal("1000.00"), stock=5)
+        mouse = Product.objects.create(name="Mouse", price=Decimal("25.50"), stock=50)
+        for products in ([laptop, mouse], [mouse]):
+            execute(CREATE_ORDER, {"customerId": str(self.alice.id), "productIds": [str(p.id) for p in products]})
+
+    def test_customer_page_is_annotated_in_one_query(self):
+        query = "{ customers { name ordersCount totalSpent firstOrderAt lastOrderAt } }"
+        with self.assertNumQueries(1):
+            data = execute(query)
+        alice, bob = sorted(data["customers"], key=lambda c: c["name"])
+        self.assertEqual((alice["ordersCount"], alice["totalSpent"]), (2, 1051.0))
+        self.assertLessEqual(alice["firstOrderAt"], alice["lastOrderAt"])
+        self.assertEqual(bob, {"name": "Bob", "ordersCount": 0, "totalSpent": 0.0, "firstOrderAt": None, "lastOrderAt": None})
+
+    def test_connection_and_nested_customers(self):
+        data = execute("{ allCustomers(name: \"Ali\") { edges { node { ordersCount totalSpent } } } }")
+        self.assertEqual(data["allCustomers"]["edges"], [{"node": {"ordersCount": 2, "totalSpent": 1051.0}}])
+
+        # Customers reached through orders are annotated together, not one aggregate each
+        Order.objects.create(customer=self.bob, total_amount=Decimal("1.00"))
+        with identity.scope(), CaptureQueriesContext(connection) as queries:
+            data = execute("{ orders { customer { name ordersCount } } }")
+        self.assertEqual(
+            [order["customer"] for order in data["orders"]],
+            [{"name": "Alice", "ordersCount": 2}] * 2 + [{"name": "Bob", "ordersCount": 1}],
+        )
+        self.assertEqual(sum("GROUP BY" in query["sql"] for query in queries.captured_queries), 1)
+
+    def test_customers_are_only_annotated_when_asked_for(self):
+        for query in ("{ customers { name } }", "{ allCustomers { edges { node { name } } } }"):
+            with CaptureQueriesContext(connection) as queries:
+                execute(query)
+            self.assertFalse(any("GROUP BY" in q["sql"] for q in queries.captured_queries), query)
+        with CaptureQueriesContext(connection) as queries:
+            execute("{ customers { ...figures } } fragment figures on CustomerType { totalSpent }")
+        self.assertTrue(any("GROUP BY" in q["sql"] for q in queries.captured_queries))
+
+
+class LowStockTests(TestCase):
+    def setUp(self):
+        for name, stock in [("Cable", 2), ("Mouse", 7), ("Monitor", 12), ("Laptop", 0)]:
+            Product.objects.create(name=name, price=Decimal("10.00"), stock=stock)
+
+    def test_low_stock_products_query(self):
+        data = execute("{ lowStockProducts { name stock } }")
+        self.assertEqual([p["name"] for p in data["lowStockProducts"]], ["Laptop", "Cable", "Mouse"])
+        data = execute("{ lowStockProducts(threshold: 5) { name } }")
+        self.assertEqual([p["name"] for p in data["lowStockProducts"]], ["Laptop", "Cable"])
+        data = execute("{ lowStockProducts(threshold: 20) { name } }")
+        self.assertEqual(len(data["lowStockProducts"]), 4)
+
+    def test_low_stock_filter_argument(self):
+        data = execute("{ allProducts(lowStock: true) { edges { node { name } } } }")
+        self.assertEqual([e["node"]["name"] for e in data["allProducts"]["edges"]], ["Laptop", "Cable", "Mouse"])
+        data = execute("{ allProducts(lowStock: false) { edges { node { name } } } }")
+        self.assertEqual([e["node"]["name"] for e in data["allProducts"]["edges"]], ["Monitor"])
+
+    def test_low_stock_uses_partial_index(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("query plan check is SQLite specific")
+        for threshold in (None, 5):
+            sql, params = Product.objects.low_stock(threshold).values("id", "stock").query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+                plan = " ".join(row[-1] for row in cursor.fetchall())
+            self.assertIn("crm_product_low_stock_idx", plan)
+
+
+class SQLiteTuningTests(TestCase):
+    def test_pragmas_applied_to_new_connections(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("SQLite only")
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], settings.SQLITE_PRAGMAS["busy_timeout"])
+            cursor.execute("PRAGMA cache_size")
+            self.assertEqual(cursor.fetchone()[0], settings.SQLITE_PRAGMAS["cache_size"])
+            cursor.execute("PRAGMA temp_store")
+            self.assertEqual(cursor.fetchone()[0], 2)  # MEMORY
+
+    def test_transaction_mode_overrides_deferred_begin(self):
+        fake = mock.Mock()
+        use_transaction_mode(fake, "IMMEDIATE")
+        fake._start_transaction_under_autocommit()
+        fake.cursor.return_value.execute.assert_called_once_with("BEGIN IMMEDIATE")
+
+
+class ReadWriteRoutingTests(TransactionTestCase):
+    # Includes "replica" (a test mirror of default) when CRM_REPLICA_DB is set. No
+    # wrapping transactions: they would hold SQLite table locks across the two aliases.
+    databases = "__all__"
+
+    def execute_routed(self, query, variables=None):
+        result = schema.execute(query, variables=variables, middleware=[DatabaseRoutingMiddleware()])
+        self.assertIsNone(result.errors)
+        return read_alias()
+
+    def test_queries_read_from_replica_until_a_mutation(self):
+        with request_scope():
+            self.assertIsNone(read_alias())
+            self.assertEqual(self.execute_routed("{ customers { id } }"), "replica")
+            mutation = """mutation { createCustomer(input: { name: "Ann", email: "ann@example.com" }) { customer { id } } }"""
+            self.assertEqual(self.execute_routed(mutation), "default")
+            # Read-your-writes: later operations in the same request stay on the primary
+            self.assertEqual(self.execute_routed("{ customers { id } }"), "default")
+        self.assertIsNone(read_alias())
+
+    def test_router_only_uses_a_configured_replica(self):
+        with request_scope():
+            self.execute_routed("{ products { id } }")
+            with self.settings(DATABASES={"default": {}, "replica": {}}):
+                router = ReadWriteRouter()
+            self.assertEqual(router.db_for_read(Customer), "replica")
+            self.assertEqual(router.db_for_write(Customer), "default")
+            with self.settings(DATABASES={"default": {}}):
+                router = ReadWriteRouter()
+            self.assertEqual(router.db_for_read(Customer), "default")
+
+    def test_graphql_view_resets_routing_per_request(self):
+        response = self.client.post("/graphql", {"query": "{ customers { id } }"}, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(read_alias())
+
+
+class DataGenerationTests(TestCase):
+    def snapshot(self):
+        return (
+            list(Customer.objects.order_by("id").values_list("id", "name", "email", "phone")),
+            list(Product.objects.order_by("id").values_list("id", "name", "price", "stock")),
+            list(Order.objects.order_by("id").values_list("id", "customer_id", "total_amount")),
+            list(Order.products.through.objects.order_by("order_id", "product_id").values_list("order_id", "product_id")),
+        )
+
+    def test_same_seed_generates_same_rows(self):
+        counts = generate(50, 20, 300, seed=7, batch_size=64)
+        self.assertEqual((counts["customers"], counts["products"], counts["orders"]), (50, 20, 300))
+        self.assertEqual(Order.products.through.objects.count(), counts["order_products"])
+        first = self.snapshot()
+        order = Order.objects.prefetch_related("products").get(pk=1)
+        self.assertEqual(order.total_amount, sum(p.price for p in order.products.all()))
+
+        Order.objects.all().delete()
+        Customer.objects.all().delete()
+        Product.objects.all().delete()
+        generate(50, 20, 300, seed=7, batch_size=64)
+        self.assertEqual(self.snapshot(), first)
+        # New rows made through the ORM continue after the generated ids
+        self.assertEqual(Customer.objects.create(name="Next", email="next@example.com").pk, 51)
+
+    def test_command_reports_rate_and_rebuilds_rollups(self):
+        out = StringIO()
+        call_command("generate_crm_data", customers=20, products=10, orders=100, stdout=out)
+        self.assertIn("rows/sec", out.getvalue())
+        self.assertEqual(sum(DailySales.objects.values_list("orders_count", flat=True)), 100)
+
+
+class QueryBudgetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_budget_fixture()
+
+    def test_corpus_stays_within_sql_budgets(self):
+        exceeded = over_budget(measure(), load_budgets())
+        self.assertFalse(
+            exceeded,
+            f"Over the SQL budget (count, budget): {exceeded}. If intended, run "
+            "`python manage.py check_query_budgets --update` and commit crm/query_budgets.json.",
+        )
+
+    def test_order_customers_and_products_are_loaded_up_front(self):
+        with self.assertNumQueries(3):
+            data = execute("{ orders { customer { name } products { name } } }")
+        self.assertEqual(len(data["orders"]), 50)
+        with self.assertNumQueries(3):
+            orders = identity.attach(list(Order.objects.with_details()), "customer")
+            labels = [str(order) for order in orders]
+        self.assertEqual(len(labels), 50)
+
+
+class StartupTests(TestCase):
+    def test_legacy_schema_modules_reexport_the_canonical_schema(self):
+        import schema as root_schema
+        from graphql_crm import schema as graphql_crm_schema
+        from alx_backend_graphql_crm import schema as nested_schema
+
+        for module in (root_schema, graphql_crm_schema, nested_schema):
+            self.assertIs(module.schema, schema)
+
+    def test_preload_builds_schema_and_records_phases(self):
+        with mock.patch("crm.startup.connections"), mock.patch("crm.startup.gc") as gc:
+            self.assertIs(preload_schema(), schema)
+        gc.freeze.assert_called_once()
+        self.assertLessEqual({"import_types", "build_schema", "first_execution"}, set(TIMINGS))
+
+    def test_parse_importtime_sums_self_time_per_package(self):
+        stderr = (
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       300 |        300 |   graphql.language\n"
+            "import time:       200 |        500 | graphql\n"
+            "import time:      1000 |       1000 | django\n"
+        )
+        self.assertEqual(parse_importtime(stderr), {"django": 0.001, "graphql": 0.0005})
+
+
+class IntrospectionCacheTests(TestCase):
+    QUERY = "query IntrospectionQuery { __schema { queryType { name } types { name } } }"
+
+    def setUp(self):
+        introspection.cache.clear()
+
+    def post(self, query, **headers):
+        return self.client.post("/graphql", {"query": query}, content_type="application/json", **headers)
+
+    def test_introspection_is_served_from_memory_with_etag(self):
+        first = self.post(self.QUERY)
+        self.assertEqual(first.status_code, 200)
+        self.assertIn("ETag", first)
+
+        with mock.patch("graphene_django.views.GraphQLView.execute_graphql_request") as execute_request:
+            # Same document, different formatting
+            second = self.post(self.QUERY.replace(" ", "  "))
+            not_modified = self.post(self.QUERY, HTTP_IF_NONE_MATCH=first["ETag"])
+        execute_request.assert_not_called()
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified["ETag"], first["ETag"])
+
+    def test_only_introspection_operations_are_cached(self):
+        response = self.post("{ __typename customers { id } }")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("ETag", response)
+        self.assertFalse(introspection.cache.entries)
+
+
+class AdmissionControlTests(TestCase):
+    def setUp(self):
+        admission.buckets.clear()
+
+    def post(self, query, **headers):
+        return self.client.post("/graphql", {"query": query}, content_type="application/json", **headers)
+
+    def test_operation_cost_follows_page_sizes(self):
+        graphql_schema = schema.graphql_schema
+        self.assertEqual(admission.operation_cost(graphql_schema, "{ customers { id name } }"), 20)
+        # 5 x (page slot + edge + node)
+        page = "query($n: Int) { allCustomers(first: $n) { edges { node { name } } } }"
+        self.assertEqual(admission.operation_cost(graphql_schema, page, {"n": 5}), 15)
+        # Nested lists multiply
+        self.assertEqual(admission.operation_cost(graphql_schema, "{ orders { customer { name } products { name } } }"), 440)
+
+    def test_fragment_cycles_are_left_to_validation(self):
+        response = self.post("query { customers { ...F } } fragment F on CustomerType { id ...F }")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Cannot spread fragment 'F' within itself", response.json()["errors"][0]["message"])
+        # Fragments spread more than once still count every time
+        twice = "{ customers { ...F } again: customers { ...F } } fragment F on CustomerType { id }"
+        self.assertEqual(admission.operation_cost(schema.graphql_schema, twice), 40)
+
+    @override_settings(GRAPHQL_ADMISSION={"RATE": 1, "BURST": 50})
+    def test_token_bucket_returns_429_with_retry_after(self):
+        for _ in range(2):
+            response = self.post("{ customers { id } }")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response["X-GraphQL-Cost"], "20")
+        limited = self.post("{ customers { id } }")
+        self.assertEqual(limited.status_code, 429)
+        self.assertEqual(limited["Retry-After"], "10")
+        self.assertEqual(limited.json()["errors"][0]["extensions"]["code"], "RATE_LIMITED")
+        # An unknown API key does not get a bucket of its own
+        self.assertEqual(self.post("{ customers { id } }", HTTP_X_API_KEY="made-up").status_code, 429)
+        # Buckets are per client
+        with override_settings(GRAPHQL_ADMISSION={"RATE": 1, "BURST": 50, "API_KEYS": ["batch-job"]}):
+            self.assertEqual(self.post("{ customers { id } }", HTTP_X_API_KEY="batch-job").status_code, 200)
+
+    @override_settings(GRAPHQL_ADMISSION={"RATE": 0.001, "BURST": 102, "INTROSPECTION_COST": 100})
+    def test_introspection_is_charged_in_full_unless_cached(self):
+        query = "query ($name: String!) { __type(name: $name) { name } }"
+
+        def post(name):
+            return self.client.post("/graphql", {"query": query, "variables": {"name": name}}, content_type="application/json")
+
+        responses = [post("Query") for _ in range(3)]
+        self.assertEqual([r.status_code for r in responses], [200, 200, 200])
+        self.assertEqual([r["X-GraphQL-Cost"] for r in responses], ["100", "1", "1"])
+        # Other variables make a new cache entry, so the operation runs again and costs its full price
+        uncached = post("Mutation")
+        self.assertEqual(uncached.status_code, 429)
+        self.assertEqual(uncached.json()["errors"][0]["extensions"]["cost"], 100)
+
+    @override_settings(GRAPHQL_ADMISSION={"EXPENSIVE_COST": 100, "MAX_CONCURRENT_EXPENSIVE": 1, "MAX_QUEUED": 0})
+    def test_expensive_operations_are_turned_away_when_slots_are_taken(self):
+        with admission.gate.slot(1, 0, 0) as acquired:
+            self.assertTrue(acquired)
+            self.assertEqual(self.post("{ customers { id } }").status_code, 200)
+            self.assertEqual(self.post("{ orders { id products { id } } }").status_code, 429)
+        self.assertEqual(self.post("{ orders { id products { id } } }").status_code, 200)
+
+
+BULK_CREATE = """
+mutation($input: [CustomerInput!]!, $async: Boolean) {
+  bulkCreateCustomers(input: $input, async: $async) {
+    customers { email }
+    errors
+    job { id status }
+  }
+}
+"""
+
+JOB = "query($id: ID!) { job(id: $id) { status total processed succeeded failed progress errors } }"
+
+
+class BackgroundJobTests(TestCase):
+    PAYLOAD = [
+        {"name": "Ann", "email": "ann@example.com", "phone": "+12345678901"},
+        {"name": "Bob", "email": "bob@example.com", "phone": "bad phone"},
+        {"name": "Ann again", "email": "ann@example.com"},
+        {"name": "Cy", "email": "cy@example.com"},
+    ]
+
+    def test_sync_bulk_create_reports_invalid_rows(self):
+        data = execute(BULK_CREATE, {"input": self.PAYLOAD})["bulkCreateCustomers"]
+        self.assertEqual([c["email"] for c in data["customers"]], ["ann@example.com", "cy@example.com"])
+        self.assertEqual(data["errors"], [
+            "Customer 2: Invalid phone format: bad phone",
+            "Customer 3: Email already exists: ann@example.com",
+        ])
+        self.assertIsNone(data["job"])
+
+    @override_settings(CRM_JOB_WORKERS=0)
+    def test_async_bulk_create_returns_job_and_reports_progress(self):
+        data = execute(BULK_CREATE, {"input": self.PAYLOAD, "async": True})["bulkCreateCustomers"]
+        self.assertEqual(data["customers"], [])
+        self.assertEqual(data["job"]["status"], "QUEUED")
+        self.assertFalse(Customer.objects.exists())
+
+        job = execute(JOB, {"id": data["job"]["id"]})["job"]
+        self.assertEqual((job["total"], job["processed"], job["progress"]), (4, 0, 0.0))
+
+        self.assertIsNotNone(jobs.run_job())
+        self.assertIsNone(jobs.run_job())
+        job = execute(JOB, {"id": data["job"]["id"]})["job"]
+        self.assertEqual(job["status"], "SUCCEEDED")
+        self.assertEqual((job["processed"], job["succeeded"], job["failed"], job["progress"]), (4, 2, 2, 1.0))
+        self.assertEqual(len(job["errors"]), 2)
+        self.assertEqual(Customer.objects.count(), 2)
+
+    @override_settings(CRM_JOB_WORKERS=0, CRM_JOB_STALE_AFTER=60)
+    def test_stale_running_job_is_requeued(self):
+        data = execute(BULK_CREATE, {"input": self.PAYLOAD, "async": True})["bulkCreateCustomers"]
+        orphan = jobs.claim()
+        self.assertIsNone(jobs.run_job())
+        # The worker died without a heartbeat for longer than CRM_JOB_STALE_AFTER
+        Job.objects.filter(pk=orphan.pk).update(heartbeat_at=timezone.now() - timedelta(seconds=61))
+        self.assertEqual(jobs.run_job().status, Job.SUCCEEDED)
+        self.assertEqual(Customer.objects.count(), 2)
+
+        # Should the old worker come back, its updates are ignored
+        jobs.update_progress(orphan, 0, 0, 0)
+        self.assertEqual(execute(JOB, {"id": data["job"]["id"]})["job"]["processed"], 4)
+
+
+class BackgroundJobThreadTests(TransactionTestCase):
+    @override_settings(CRM_JOB_WORKERS=1)
+    def test_job_runs_in_thread_pool_after_commit(self):
+        data = execute(BULK_CREATE, {"input": [{"name": "Dee", "email": "dee@example.com"}], "async": True})
+        job_id = data["bulkCreateCustomers"]["job"]["id"]
+        for _ in range(100):
+            job = Job.objects.get(pk=job_id)
+            if job.status == Job.SUCCEEDED:
+                break
+            time.sleep(0.05)
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        self.assertTrue(Customer.objects.filter(email="dee@example.com").exists())
+
+
+IDEMPOTENT_ORDER = """
+mutation($customerId: ID!, $productIds: [ID]!, $key: String) {
+  createOrder(input: { customerId: $customerId, productIds: $productIds }, idempotencyKey: $key) {
+    order { id totalAmount }
+  }
+}
+"""
+
+
+class IdempotencyKeyTests(TestCase):
+    def setUp(self):
+        self.customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        self.product = Product.objects.create(name="Laptop", price=Decimal("1000.00"), stock=5)
+        self.variables = {"customerId": str(self.customer.id), "productIds": [str(self.product.id)], "key": "retry-1"}
+
+    def test_replay_returns_stored_result_without_executing(self):
+        first = execute(IDEMPOTENT_ORDER, self.variables)
+        # The key lookup plus reading the stored order back
+        with self.assertNumQueries(2):
+            second = execute(IDEMPOTENT_ORDER, self.variables)
+        self.assertEqual(second, first)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(DailySales.objects.get().orders_count, 1)
+
+    def test_key_reused_with_other_arguments_is_rejected(self):
+        execute(IDEMPOTENT_ORDER, self.variables)
+        other = Product.objects.create(name="Mouse", price=Decimal("25.00"), stock=5)
+        result = schema.execute(IDEMPOTENT_ORDER, variables={**self.variables, "productIds": [str(other.id)]})
+        self.assertIn("already used with different arguments", str(result.errors[0]))
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_expired_key_runs_the_mutation_again(self):
+        execute(IDEMPOTENT_ORDER, self.variables)
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        execute(IDEMPOTENT_ORDER, self.variables)
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+
+    def test_keys_belong_to_the_client_that_sent_them(self):
+        first = RequestFactory().post("/graphql", REMOTE_ADDR="10.0.0.1")
+        second = RequestFactory().post("/graphql", REMOTE_ADDR="10.0.0.2")
+        mine = execute(IDEMPOTENT_ORDER, self.variables, context=first)
+        theirs = execute(IDEMPOTENT_ORDER, self.variables, context=second)
+        self.assertNotEqual(theirs, mine)
+        self.assertEqual(execute(IDEMPOTENT_ORDER, self.variables, context=first), mine)
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_replay_of_a_deleted_row_is_a_clean_error(self):
+        execute(IDEMPOTENT_ORDER, self.variables)
+        Order.objects.all().delete()
+        result = schema.execute(IDEMPOTENT_ORDER, variables=self.variables)
+        self.assertIn("have since been deleted", str(result.errors[0]))
+
+    def test_bulk_create_replays_customers_and_errors(self):
+        variables = {"input": [{"name": "Ann", "email": "ann@example.com"}, {"name": "Al", "email": "alice@example.com"}]}
+        query = BULK_CREATE.replace("async: $async)", "async: $async, idempotencyKey: \"bulk-1\")")
+        first = execute(query, variables)
+        self.assertEqual(execute(query, variables), first)
+        self.assertEqual(len(first["bulkCreateCustomers"]["errors"]), 1)
+        self.assertEqual(Customer.objects.count(), 2)
+
+
+class JSONEncoderTests(TestCase):
+    DATA = {"data": {"b": [1, 2.5, None], "a": Decimal("10.50"), "at": timezone.datetime(2024, 1, 2, 3, 4, 5)}}
+
+    def setUp(self):
+        admission.buckets.clear()
+
+    def test_encoders_agree(self):
+        expected = {"data": {"b": [1, 2.5, None], "a": 10.5, "at": "2024-01-02T03:04:05"}}
+        for encode in (encoders.stdlib_encode, encoders.orjson_encode):
+            with self.subTest(encode.__name__):
+                if encode is encoders.orjson_encode and encoders.orjson is None:
+                    self.skipTest("orjson is not installed")
+                self.assertEqual(json.loads(encode(self.DATA)), expected)
+                self.assertEqual(json.loads(encode(self.DATA, pretty=True)), expected)
+
+    def test_view_uses_configured_encoder(self):
+        with mock.patch("crm.encoders.stdlib_encode", return_value='{"data":{}}') as encode:
+            with override_settings(GRAPHQL_JSON_ENCODER="crm.encoders.stdlib_encode"):
+                encoders._load.cache_clear()
+                response = self.client.post("/graphql", {"query": "{ products { price } }"}, content_type="application/json")
+        encoders._load.cache_clear()
+        self.assertEqual(response.content, b'{"data":{}}')
+        encode.assert_called_once_with({"data": {"products": []}}, pretty=False)
+
+
+class HTTPCacheTests(TestCase):
+    QUERY = "{ products { id name } }"
+
+    def setUp(self):
+        admission.buckets.clear()
+        http_cache.persisted_queries.clear()
+        for i in range(30):
+            Product.objects.create(name=f"Product {i}", price=Decimal("1.00"), stock=i)
+
+    def get(self, params, **headers):
+        return self.client.get("/graphql", params, HTTP_ACCEPT="application/json", **headers)
+
+    def test_get_query_has_etag_and_honours_if_none_match(self):
+        response = self.get({"query": self.QUERY})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("max-age=", response["Cache-Control"])
+        self.assertIn("private", response["Cache-Control"])
+        self.assertIn("X-Api-Key", response["Vary"])
+        not_modified = self.get({"query": self.QUERY}, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b"")
+
+        Product.objects.filter(pk=Product.objects.first().pk).update(name="Renamed")
+        changed = self.get({"query": self.QUERY}, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], response["ETag"])
+
+    def test_polled_fields_are_not_cached(self):
+        job = Job.objects.create(kind="bulk_create_customers")
+        response = self.get({"query": f'{{ job(id: "{job.pk}") {{ status }} }}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("no-store", response["Cache-Control"])
+        self.assertNotIn("max-age", response["Cache-Control"])
+
+    def test_mutations_are_not_allowed_over_get(self):
+        response = self.get({"query": 'mutation { createProduct(input: {name: "X", price: 1}) { product { id } } }'})
+        self.assertEqual(response.status_code, 405)
+        self.assertFalse(Product.objects.filter(name="X").exists())
+
+    def test_persisted_query_round_trip(self):
+        sha = hashlib.sha256(self.QUERY.encode()).hexdigest()
+        extensions = json.dumps({"persistedQuery": {"version": 1, "sha256Hash": sha}})
+
+        missing = self.get({"extensions": extensions})
+        self.assertEqual(missing.json()["errors"][0]["extensions"]["code"], "PERSISTED_QUERY_NOT_FOUND")
+        registered = self.get({"query": self.QUERY, "extensions": extensions})
+        self.assertEqual(len(registered.json()["data"]["products"]), 30)
+        by_hash = self.get({"extensions": extensions})
+        self.assertEqual(by_hash.content, registered.content)
+
+        wrong = json.dumps({"persistedQuery": {"version": 1, "sha256Hash": "0" * 64}})
+        self.assertEqual(self.get({"query": self.QUERY, "extensions": wrong}).status_code, 400)
+
+    @override_settings(GRAPHQL_HTTP_CACHE={"COMPRESS_MIN_SIZE": 200})
+    def test_large_responses_are_compressed(self):
+        plain = self.get({"query": self.QUERY})
+        compressed = self.get({"query": self.QUERY}, HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(compressed["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        self.assertNotEqual(compressed["ETag"], plain["ETag"])
+        self.assertIn("Accept-Encoding", compressed["Vary"])
+
+        small = self.get({"query": "{ __typename }"}, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertFalse(small.has_header("Content-Encoding"))
+
+
+class NodesTests(TestCase):
+    def test_nodes_batches_per_type_and_keeps_input_order(self):
+        customers = [Customer.objects.create(name=f"C{i}", email=f"c{i}@example.com") for i in range(3)]
+        products = [Product.objects.create(name=f"P{i}", price=Decimal("2.00"), stock=1) for i in range(3)]
+        ids = [
+            to_global_id("ProductType", products[2].pk),
+            to_global_id("CustomerType", customers[0].pk),
+            to_global_id("CustomerType", 999),
+            "not a global id",
+            to_global_id("ProductType", products[0].pk),
+            to_global_id("CustomerType", customers[0].pk),
+        ]
+        query = """query ($ids: [ID!]!) {
+            nodes(ids: $ids) { id ... on CustomerType { name } ... on ProductType { name } }
+        }"""
+        with self.assertNumQueries(2):
+            result = schema.execute(query, variables={"ids": ids})
+        self.assertIsNone(result.errors)
+        names = [node and node["name"] for node in result.data["nodes"]]
+        self.assertEqual(names, ["P2", "C0", None, None, "P0", "C0"])
+
+    def test_create_order_accepts_global_and_database_ids(self):
+        customer = Customer.objects.create(name="Ann", email="ann@example.com")
+        first = Product.objects.create(name="A", price=Decimal("1.50"), stock=1)
+        second = Product.objects.create(name="B", price=Decimal("2.50"), stock=1)
+        result = schema.execute(
+            "mutation ($c: ID!, $p: [ID]!) { createOrder(input: {customerId: $c, productIds: $p}) { order { totalAmount } } }",
+            variables={"c": to_global_id("CustomerType", customer.pk), "p": [str(first.pk), to_global_id("ProductType", second.pk)]},
+        )
+        self.assertIsNone(result.errors)
+        self.assertEqual(result.data["createOrder"]["order"]["totalAmount"], 4.0)
+
+
+class IdentityMapTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.create(name="Ann", email="ann@example.com")
+        cls.product = Product.objects.create(name="Pen", price=Decimal("2.00"), stock=5)
+        for _ in range(3):
+            order = Order.objects.create(customer=cls.customer, total_amount=Decimal("2.00"))
+            order.products.add(cls.product)
+
+    def test_each_row_is_one_instance_per_request(self):
+        with identity.scope():
+            orders = identity.attach(list(Order.objects.with_details()), "customer")
+            self.assertEqual(len({id(order.customer) for order in orders}), 1)
+            with self.assertNumQueries(0):
+                self.assertIs(identity.load(Customer, [self.customer.pk])[self.customer.pk], orders[0].customer)
+                # An order loaded on its own finds its customer in the map
+                self.assertEqual(str(Order(id=99, customer_id=self.customer.pk)), "Order 99 - Ann")
+        self.assertIsNone(identity.get(Customer, self.customer.pk))
+
+    def test_loaders_skip_rows_the_request_already_has(self):
+        with identity.scope():
+            identity.add(Customer.objects.get(pk=self.customer.pk))
+            with self.assertNumQueries(2):
+                data = execute("{ orders { customer { name } products { name } } }")
+        self.assertEqual({order["customer"]["name"] for order in data["orders"]}, {"Ann"})
+
+    def test_mutations_register_what_they_create(self):
+        with identity.scope():
+            data = execute('mutation { createProduct(input: {name: "Ink", price: 3}) { product { id } } }')
+            product = Product.objects.get(name="Ink")
+            self.assertIsNotNone(identity.get(Product, product.pk))
+            with self.assertNumQueries(0):
+                identity.load(Product, [product.pk])
+        self.assertTrue(data["createProduct"]["product"]["id"])
+
+    def test_rolled_back_mutations_leave_the_map_as_it_was(self):
+        with identity.scope():
+            before = identity.load(Product, [self.product.pk])[self.product.pk]
+            variables = {"customerId": str(self.customer.pk), "productIds": [str(self.product.pk)], "key": "k"}
+            with mock.patch("crm.idempotency.IdempotencyKey.objects.create", side_effect=RuntimeError("boom")):
+                result = schema.execute(IDEMPOTENT_ORDER, variables=variables)
+            self.assertIn("boom", str(result.errors[0]))
+            self.assertEqual(Order.objects.count(), 3)
+            self.assertEqual(identity.instances(Order), [])
+            self.assertIs(identity.get(Product, self.product.pk), before)
+
+
+class OrderArchiveTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.create(name="Ann", email="ann@example.com")
+        cls.pen = Product.objects.create(name="Pen", price=Decimal("2.00"), stock=5)
+        cls.ink = Product.objects.create(name="Ink", price=Decimal("3.00"), stock=5)
+        now = timezone.now()
+        for days, products in [(800, [cls.pen]), (500, [cls.pen, cls.ink]), (3, [cls.ink])]:
+            order = Order.objects.create(
+                customer=cls.customer,
+                total_amount=sum(p.price for p in products),
+                order_date=now - timedelta(days=days),
+            )
+            order.products.set(products)
+        call_command("rebuild_sales_rollups", stdout=StringIO())
+
+    def test_old_orders_move_with_their_products(self):
+        ids = list(Order.objects.order_by("id").values_list("id", flat=True))
+        self.assertEqual(archive_orders(default_cutoff(), chunk_size=1), 2)
+        self.assertEqual(list(Order.objects.values_list("id", flat=True)), ids[2:])
+        archived = ArchivedOrder.objects.get(id=ids[1])
+        self.assertEqual({p.name for p in archived.products.all()}, {"Pen", "Ink"})
+        self.assertFalse(Order.products.through.objects.filter(order_id__in=ids[:2]).exists())
+
+    def test_orders_query_reads_the_archive_only_when_the_range_reaches_it(self):
+        before = execute("{ orders { id totalAmount products { name } } }")["orders"]
+        lifetime = execute("{ customers { ordersCount totalSpent firstOrderAt lastOrderAt } }")
+        rollups = list(DailySales.objects.order_by("day").values_list("day", "orders_count", "revenue"))
+        archive_orders(default_cutoff())
+
+        self.assertEqual(len(execute("{ orders { id } }")["orders"]), 1)
+        since = (timezone.now() - timedelta(days=1000)).isoformat()
+        with self.assertNumQueries(6):
+            # The archive check, orders and products from each table, then the customers
+            everything = execute("query ($from: DateTime) { orders(from: $from) { id totalAmount products { name } } }",
+                                 variables={"from": since})["orders"]
+        self.assertEqual(everything, before)
+        self.assertEqual(execute("{ customers { ordersCount totalSpent firstOrderAt lastOrderAt } }"), lifetime)
+
+        call_command("rebuild_sales_rollups", stdout=StringIO())
+        self.assertEqual(list(DailySales.objects.order_by("day").values_list("day", "orders_count", "revenue")), rollups)
+
+    def test_ranges_ending_in_the_archive_read_it(self):
+        archive_orders(default_cutoff())
+        query = "query ($from: DateTime, $to: DateTime) { orders(from: $from, to: $to) { id totalAmount } }"
+        now = timezone.now()
+        until = execute(query, {"to": (now - timedelta(days=400)).isoformat()})["orders"]
+        self.assertEqual([o["totalAmount"] for o in until], [2.0, 5.0])
+        between = execute(query, {"from": (now - timedelta(days=600)).isoformat(),
+                                  "to": (now - timedelta(days=400)).isoformat()})["orders"]
+        self.assertEqual([o["totalAmount"] for o in between], [5.0])
+        # A range after the newest archived order: the archive check, then the hot table only
+        with self.assertNumQueries(4):
+            recent = execute(query, {"from": (now - timedelta(days=30)).isoformat()})["orders"]
+        self.assertEqual([o["totalAmount"] for o in recent], [3.0])
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        generate(customers=20, products=5, orders=60, seed=1)
+        archive_orders(timezone.now() - timedelta(days=365))
+
+    def read(self, path):
+        with gzip.open(path, "rt", newline="") as fh:
+            return list(csv.reader(fh))
+
+    def test_tables_are_streamed_to_gzipped_csv(self):
+        reported = []
+        with tempfile.TemporaryDirectory() as directory:
+            results = export(directory, chunk_size=7, workers=1, progress=lambda table, rows: reported.append(table))
+            orders = self.read(results["orders"]["files"][0])
+            items = self.read(results["order_items"]["files"][0])
+            customers = self.read(results["customers"]["files"][0])
+
+        archived = ArchivedOrder.objects.count()
+        self.assertTrue(archived)
+        self.assertEqual(orders[0], ["id", "customer_id", "total_amount", "order_date", "archived"])
+        self.assertEqual(len(orders) - 1, 60)
+        self.assertEqual(sum(row[4] == "True" for row in orders[1:]), archived)
+        self.assertEqual(
+            len(items) - 1,
+            Order.products.through.objects.count() + ArchivedOrder.products.through.objects.count(),
+        )
+        self.assertEqual(len(customers) - 1, 20)
+        self.assertEqual(results["orders"]["rows"], 60)
+        # A report per chunk of at most 7 rows
+        self.assertGreaterEqual(reported.count("orders"), 60 // 7)
+
+    @skipUnless(pyarrow, "pyarrow is not installed")
+    def test_tables_are_written_to_parquet(self):
+        with tempfile.TemporaryDirectory() as directory:
+            results = export(directory, tables=["orders", "customers"], formats=("parquet",), chunk_size=7, workers=1)
+            orders = pyarrow.parquet.read_table(results["orders"]["files"][0])
+            customers = pyarrow.parquet.read_table(results["customers"]["files"][0])
+        self.assertEqual(orders.column_names, ["id", "customer_id", "total_amount", "order_date", "archived"])
+        self.assertEqual(orders.num_rows, 60)
+        self.assertEqual(sum(orders.column("archived").to_pylist()), ArchivedOrder.objects.count())
+        self.assertEqual(customers.num_rows, 20)
+
+    def test_parquet_needs_pyarrow(self):
+        with tempfile.TemporaryDirectory() as directory, mock.patch("crm.export.pyarrow", None):
+            with self.assertRaises(CommandError):
+                call_command("export_crm", directory, "--format", "parquet", stdout=StringIO())
+
+
+class ListPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        generate(customers=12, products=5, orders=30, seed=2)
+
+    def test_pages_follow_ids_with_limit_and_after(self):
+        first = execute("{ customers(limit: 5) { id name } }")["customers"]
+        self.assertEqual(len(first), 5)
+        second = execute("query ($after: ID) { customers(limit: 5, after: $after) { id } }",
+                         variables={"after": first[-1]["id"]})["customers"]
+        everything = execute("{ customers { id } }")["customers"]
+        self.assertEqual([c["id"] for c in first + second], [c["id"] for c in everything[:10]])
+
+        orders = execute("{ orders(limit: 4, after: 10) { id } }")["orders"]
+        self.assertEqual([int(o["id"]) for o in orders], [11, 12, 13, 14])
+
+    def test_after_must_be_an_id_of_the_listed_type(self):
+        product_id = execute("{ products(limit: 1) { id } }")["products"][0]["id"]
+        result = schema.execute("query ($after: ID) { customers(after: $after) { id } }", variables={"after": product_id})
+        self.assertIn("must be the id of a CustomerType, not of a ProductType", result.errors[0].message)
+
+    @override_settings(GRAPHENE={**settings.GRAPHENE, "RELAY_CONNECTION_MAX_LIMIT": 8})
+    def test_lists_are_capped_by_the_connection_limit(self):
+        self.assertEqual(len(execute("{ orders { id } }")["orders"]), 8)
+        self.assertEqual(len(execute("{ products { id } }")["products"]), 5)
+        result = schema.execute("{ orders(limit: 9) { id } }")
+        self.assertIn("exceeds the `limit` of 8", result.errors[0].message)
+
+
+class ProfilingTests(TestCase):
+    QUERY = "query RecentOrders { orders { id customer { name } } }"
+
+    def setUp(self):
+        admission.buckets.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings_override = override_settings(GRAPHQL_PROFILING={"TOKEN": "s3cret", "DIRECTORY": self.directory})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        generate(customers=3, products=2, orders=5, seed=3)
+
+    def post(self, **headers):
+        return self.client.post("/graphql", {"query": self.QUERY}, content_type="application/json", **headers)
+
+    def test_authorized_request_writes_profile_and_summary(self):
+        response = self.post(HTTP_X_GRAPHQL_PROFILE="s3cret")
+        self.assertEqual(response.status_code, 200)
+        name = response["X-GraphQL-Profile"]
+        self.assertIn("-RecentOrders-", name)
+        with open(os.path.join(self.directory, f"{name}.json")) as fh:
+            summary = json.load(fh)
+        self.assertEqual(summary["operation"], "RecentOrders")
+        self.assertEqual(summary["sql"]["count"], 3)
+        self.assertTrue(summary["functions"])
+        self.assertTrue(os.path.exists(os.path.join(self.directory, f"{name}.prof")))
+
+    def test_requests_without_a_valid_token_are_not_profiled(self):
+        self.assertFalse(self.post(HTTP_X_GRAPHQL_PROFILE="guess").has_header("X-GraphQL-Profile"))
+        with mock.patch.object(profiling, "profile") as profile:
+            self.assertEqual(self.post().status_code, 200)
+        profile.assert_not_called()
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+class SlowLogTests(TestCase):
+    QUERY = """
+    query ByName($name: String, $first: Int) {
+      allCustomers(name: $name, first: $first) { edges { node { id name } } }
+    }
+    """
+
+    def setUp(self):
+        admission.buckets.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "logs", "slow.jsonl")
+        generate(customers=3, products=2, orders=5, seed=4)
+
+    def post(self, threshold_ms, variables=None):
+        with override_settings(GRAPHQL_SLOW_LOG={"THRESHOLD_MS": threshold_ms, "FILE": self.path}):
+            return self.client.post(
+                "/graphql", {"query": self.QUERY, "variables": variables or {}}, content_type="application/json",
+            )
+
+    def entries(self):
+        with open(self.path) as fh:
+            return [json.loads(line) for line in fh]
+
+    def test_slow_operation_is_logged_with_sql_plans_and_resolvers(self):
+        self.assertEqual(self.post(0, {"name": "a", "first": 2}).status_code, 200)
+        entry, = self.entries()
+        self.assertEqual(entry["operation"], "ByName")
+        self.assertEqual(entry["variables"], {"name": "str", "first": "int"})
+        self.assertEqual(entry["sql"]["count"], len(entry["sql"]["statements"]))
+        self.assertTrue(entry["sql"]["statements"])
+        self.assertNotIn("'a'", json.dumps(entry["sql"]))
+        self.assertTrue(entry["plans"])
+        self.assertTrue(all(plan["plan"] for plan in entry["plans"]))
+        self.assertIn("Query.allCustomers", [resolver["field"] for resolver in entry["resolvers"]])
+
+    def test_document_hash_ignores_formatting(self):
+        self.post(0)
+        self.QUERY = " ".join(self.QUERY.split())
+        self.post(0)
+        first, second = self.entries()
+        self.assertEqual(first["document_hash"], second["document_hash"])
+
+    def test_fast_operations_are_not_logged(self):
+        self.assertEqual(self.post(60000).status_code, 200)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_other_handlers_are_kept_when_the_file_changes(self):
+        other = logging.NullHandler()
+        slowlog.logger.addHandler(other)
+        self.addCleanup(slowlog.logger.removeHandler, other)
+        self.post(0)
+        self.path = self.path.replace("slow.jsonl", "moved.jsonl")
+        self.post(0)
+        self.assertEqual(len(self.entries()), 1)
+        self.assertIn(other, slowlog.logger.handlers)
+        rotating = [h for h in slowlog.logger.handlers if isinstance(h, logging.handlers.RotatingFileHandler)]
+        self.assertEqual([h.baseFilename for h in rotating], [self.path])
+
+    def test_profiled_requests_are_logged_too(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(
+            GRAPHQL_PROFILING={"TOKEN": "s3cret", "DIRECTORY": directory},
+            GRAPHQL_SLOW_LOG={"THRESHOLD_MS": 0, "FILE": self.path},
+        ):
+            response = self.client.post(
+                "/graphql", {"query": self.QUERY}, content_type="application/json", HTTP_X_GRAPHQL_PROFILE="s3cret",
+            )
+        self.assertIn("X-GraphQL-Profile", response)
+        self.assertEqual(len(self.entries()), 1)
+
+    def test_variable_shape_hides_values(self):
+        self.assertEqual(
+            slowlog.variable_shape({"ids": ["1", "2"], "filter": {"min": 1.5, "name": None}, "empty": []}),
+            {"ids": {"length": 2, "items": "str"}, "filter": {"min": "float", "name": "null"},
+             "empty": {"length": 0, "items": None}},
+        )
+
+
+class TracingTests(TestCase):
+    QUERY = "query Nested { orders { id customer { name } products { name } } }"
+
+    def setUp(self):
+        admission.buckets.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "traces.jsonl")
+        generate(customers=3, products=2, orders=5, seed=5)
+
+    def post(self, **config):
+        with override_settings(GRAPHQL_TRACING={"EXPORTER": "file", "FILE": self.path, **config}):
+            response = self.client.post("/graphql", {"query": self.QUERY}, content_type="application/json")
+        tracing.exporter.flush()
+        return response
+
+    def spans(self):
+        with open(self.path) as fh:
+            trace, = [json.loads(line) for line in fh]
+        return trace["resourceSpans"][0]["scopeSpans"][0]["spans"]
+
+    def test_trace_links_request_phases_resolvers_loads_and_sql(self):
+        self.assertEqual(self.post().status_code, 200)
+        spans = self.spans()
+        by_id = {span["spanId"]: span for span in spans}
+        parent = {span["name"]: by_id.get(span.get("parentSpanId"), {}).get("name") for span in spans}
+        self.assertEqual(len({span["traceId"] for span in spans}), 1)
+        self.assertEqual(parent["POST /graphql"], None)
+        for phase in ("graphql.parse", "graphql.validate", "graphql.execute"):
+            self.assertEqual(parent[phase], "POST /graphql")
+        self.assertEqual(parent["resolve Query.orders"], "graphql.execute")
+        self.assertEqual(parent["resolve OrderType.customer"], "resolve Query.orders")
+        # Customers are loaded a chunk at a time while the executor iterates over the orders
+        self.assertEqual(parent["load Customer"], "graphql.execute")
+        load = next(span for span in spans if span["name"] == "load Customer")
+        self.assertTrue(any(span.get("parentSpanId") == load["spanId"] for span in spans))
+        sql = [span for span in spans if span["name"] == "sql SELECT"]
+        self.assertEqual(len(sql), 3)
+        for span in spans:
+            self.assertLessEqual(int(span["startTimeUnixNano"]), int(span["endTimeUnixNano"]))
+
+    def test_span_limit_bounds_the_trace(self):
+        traces = []
+        with mock.patch.object(tracing.exporter, "submit", side_effect=lambda config, trace: traces.append(trace)):
+            self.assertEqual(self.post(MAX_SPANS=6).status_code, 200)
+        trace, = traces
+        self.assertEqual(len(trace.spans), 6)
+        self.assertTrue(trace.dropped)
+        self.assertEqual(trace.root.attributes["crm.spans.dropped"], trace.dropped)
+        kept = {id(span) for span in trace.spans}
+        self.assertTrue(all(id(span) in kept for _, span in trace.resolvers.values()))
+
+    def test_unsampled_and_untraced_requests_export_nothing(self):
+        self.assertEqual(self.post(SAMPLE_RATE=0).status_code, 200)
+        with override_settings(GRAPHQL_TRACING=None):
+            self.client.post("/graphql", {"query": self.QUERY}, content_type="application/json")
+        tracing.exporter.flush()
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_otlp_exporter_posts_to_collector(self):
+        received = []
+
+        class Collector(BaseHTTPRequestHandler):
+            def do_POST(self):
+                received.append((self.path, json.loads(self.rfile.read(int(self.headers["Content-Length"])))))
+                self.send_response(200)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        server = HTTPServer(("127.0.0.1", 0), Collector)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.post(EXPORTER="otlp", ENDPOINT=f"http://127.0.0.1:{server.server_port}/v1/traces")
+        (path, body), = received
+        self.assertEqual(path, "/v1/traces")
+        resource = body["resourceSpans"][0]["resource"]
+        self.assertEqual(resource["attributes"][0]["value"]["stringValue"], "crm")
+
+
+class RelationFilterTests(TestCase):
+    def setUp(self):
+        generate(customers=50, products=20, orders=2000, seed=6)
+        self.product = Product.objects.order_by("id").first()
+        self.term = self.product.name[:2]
+
+    def filtered(self, **data):
+        return OrderFilter(data, queryset=Order.objects.all()).qs
+
+    def assertSemiJoin(self, queryset, *tables):
+        """The many-valued relation is only read in a subquery: no join on it and no DISTINCT in the outer query."""
+        sql = str(queryset.query)
+        outer, condition = sql.split(" WHERE ", 1)
+        self.assertNotIn("DISTINCT", sql)
+        for table in tables:
+            self.assertNotIn(f'"{table}"', outer)
+            self.assertIn(f'FROM "{table}"', condition)
+
+    def test_product_name_matches_each_order_once(self):
+        joined = Order.objects.filter(products__name__icontains=self.term)
+        expected = set(joined.values_list("id", flat=True))
+        self.assertGreater(joined.count(), len(expected))  # the join repeats orders with several matches
+        orders = self.filtered(product_name=self.term)
+        self.assertEqual(orders.count(), len(expected))
+        self.assertEqual(sorted(orders.values_list("id", flat=True)), sorted(expected))
+        self.assertSemiJoin(orders, "crm_order_products")
+        # Other filters still join as before, next to the subquery
+        self.assertSemiJoin(self.filtered(product_name=self.term, customer_name="a"), "crm_order_products")
+
+    def test_product_id_accepts_global_and_database_ids(self):
+        expected = sorted(self.product.order_set.values_list("id", flat=True))
+        for value in (str(self.product.pk), to_global_id("ProductType", self.product.pk)):
+            self.assertEqual(sorted(self.filtered(product_id=value).values_list("id", flat=True)), expected)
+            self.assertSemiJoin(self.filtered(product_id=value), "crm_order_products")
+        self.assertFalse(OrderFilter({"product_id": "nope"}, queryset=Order.objects.all()).is_valid())
+
+    def test_exists_form_matches_the_in_form(self):
+        for vendor in ("sqlite", "postgresql"):
+            condition = semi_join(Order, "products__name", "icontains", self.term, vendor)
+            self.assertSemiJoin(Order.objects.filter(condition), "crm_order_products")
+            self.assertEqual(
+                Order.objects.filter(condition).count(),
+                Order.objects.filter(products__name__icontains=self.term).distinct().count(),
+            )
+
+    def test_reverse_foreign_keys_are_filtered_the_same_way(self):
+        class CustomerOrderFilter(RelationFilterSet):
+            big_order = django_filters.NumberFilter(field_name="order__total_amount", lookup_expr="gte")
+            no_big_order = django_filters.NumberFilter(field_name="order__total_amount", lookup_expr="gte",
+                                                       exclude=True)
+
+            class Meta:
+                model = Customer
+                fields = ["big_order", "no_big_order"]
+
+        expected = set(Customer.objects.filter(order__total_amount__gte=300).values_list("id", flat=True))
+        self.assertTrue(0 < len(expected) < Customer.objects.count())
+        found = CustomerOrderFilter({"big_order": 300}, queryset=Customer.objects.all()).qs
+        self.assertEqual(sorted(found.values_list("id", flat=True)), sorted(expected))
+        self.assertSemiJoin(found, "crm_order")
+        others = CustomerOrderFilter({"no_big_order": 300}, queryset=Customer.objects.all()).qs
+        self.assertEqual(others.count(), Customer.objects.count() - len(expected))
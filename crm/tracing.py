@@ -0,0 +1,323 @@
+"""
+Span-based tracing of GraphQL requests.
+
+With ``GRAPHQL_TRACING['EXPORTER']`` set, a sampled request produces one
+trace:
+
+* ``POST /graphql``: the whole request, as seen by CRMGraphQLView;
+* ``graphql.parse``, ``graphql.validate`` and ``graphql.execute``: the
+  phases of graphene-django's execution, one after the other;
+* ``resolve <Type>.<field>``: every object and list resolver, under the
+  resolver of the enclosing field (scalar fields are not traced);
+* ``load <Model>``: each batch fetched through the identity map
+  (crm/identity.py), the CRM's equivalent of a DataLoader batch;
+* ``sql <VERB>``: each SQL statement, under whatever span was open when
+  it ran.
+
+Finished traces are exported in OTLP/JSON form by a background thread,
+either appended as one line per trace to ``FILE`` (``'file'``) or POSTed
+to an OTLP/HTTP collector at ``ENDPOINT`` (``'otlp'``). Outside a traced
+request ``span()`` and the hooks cost one context variable lookup.
+"""
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from graphql import ASTValidationRule, ExecutionContext, get_named_type, is_leaf_type, specified_rules
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'EXPORTER': None,             # 'file' or 'otlp'; tracing is off until one is configured
+    'FILE': 'traces.jsonl',
+    'ENDPOINT': 'http://localhost:4318/v1/traces',
+    'SERVICE_NAME': 'crm',
+    'SAMPLE_RATE': 1.0,           # share of requests traced
+    'MAX_SPANS': 5000,            # spans kept per trace; the rest are only counted
+}
+
+# OTLP span kinds
+INTERNAL, SERVER, CLIENT = 1, 2, 3
+
+_current = ContextVar('crm_trace', default=None)
+
+
+def get_config():
+    """The GRAPHQL_TRACING setting over DEFAULTS, or None when tracing is off."""
+    configured = getattr(settings, 'GRAPHQL_TRACING', None)
+    if not configured or not configured.get('EXPORTER'):
+        return None
+    return {**DEFAULTS, **configured}
+
+
+class Span:
+    __slots__ = ('span_id', 'parent_id', 'name', 'kind', 'start', 'end', 'attributes')
+
+    def __init__(self, name, parent_id, kind, attributes):
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes
+        self.start = time.time_ns()
+        self.end = None
+
+
+class Trace:
+    """The spans of one request."""
+
+    def __init__(self, max_spans):
+        self.trace_id = os.urandom(16).hex()
+        self.max_spans = max_spans
+        self.spans = []
+        self.dropped = 0
+        self.root = None
+        self.phase = None
+        # id(path) -> (path, span) for traced resolvers, to find the parent of nested fields
+        self.resolvers = {}
+
+    def start(self, name, parent=None, kind=INTERNAL, attributes=None):
+        span = Span(name, parent.span_id if parent else None, kind, attributes or {})
+        if len(self.spans) < self.max_spans:
+            self.spans.append(span)
+        else:
+            self.dropped += 1
+        return span
+
+    @staticmethod
+    def finish(span):
+        span.end = time.time_ns()
+
+    def resolver_parent(self, path):
+        path = path.prev
+        while path is not None:
+            entry = self.resolvers.get(id(path))
+            if entry is not None and entry[0] is path:
+                return entry[1]
+            path = path.prev
+        return None
+
+
+def active():
+    return _current.get() is not None
+
+
+@contextmanager
+def span(name, kind=INTERNAL, **attributes):
+    """A child span of the current one, current itself until the block ends; nothing outside a trace."""
+    current = _current.get()
+    if current is None:
+        yield None
+        return
+    trace, parent = current
+    child = trace.start(name, parent, kind, attributes)
+    token = _current.set((trace, child))
+    try:
+        yield child
+    finally:
+        _current.reset(token)
+        trace.finish(child)
+
+
+@contextmanager
+def phases(first, **attributes):
+    """Open phase ``first`` under the request span; ``next_phase()`` moves on to the next one."""
+    current = _current.get()
+    if current is None:
+        yield
+        return
+    token = _current.set(current)
+    next_phase(first, **attributes)
+    try:
+        yield
+    finally:
+        trace = current[0]
+        if trace.phase is not None:
+            trace.finish(trace.phase)
+            trace.phase = None
+        _current.reset(token)
+
+
+def next_phase(name, **attributes):
+    """End the open phase span and start ``name`` in its place, as the current span."""
+    current = _current.get()
+    if current is None:
+        return None
+    trace = current[0]
+    if trace.phase is not None:
+        trace.finish(trace.phase)
+    trace.phase = trace.start(name, trace.root, attributes=attributes)
+    _current.set((trace, trace.phase))
+    return trace.phase
+
+
+class PhaseValidationRule(ASTValidationRule):
+    """Marks the start of validation; first in ``VALIDATION_RULES``, it checks nothing."""
+
+    def __init__(self, context):
+        super().__init__(context)
+        next_phase('graphql.validate')
+
+
+VALIDATION_RULES = (PhaseValidationRule, *specified_rules)
+
+
+class TracingExecutionContext(ExecutionContext):
+    def execute_operation(self, operation, root_value):
+        next_phase('graphql.execute', **{'graphql.operation.type': operation.operation.value})
+        return super().execute_operation(operation, root_value)
+
+
+class TracingMiddleware:
+    """Graphene middleware giving each object and list resolver a span."""
+
+    def resolve(self, next, root, info, **args):
+        current = _current.get()
+        if current is None or is_leaf_type(get_named_type(info.return_type)):
+            return next(root, info, **args)
+        trace, parent = current
+        resolver = trace.start(
+            f"resolve {info.parent_type.name}.{info.field_name}",
+            trace.resolver_parent(info.path) or parent,
+            attributes={'graphql.field.path': '.'.join(str(key) for key in info.path.as_list())},
+        )
+        if not trace.dropped:
+            # Once spans are dropped, so are those of nested fields; nothing needs to find this one
+            trace.resolvers[id(info.path)] = (info.path, resolver)
+        token = _current.set((trace, resolver))
+        try:
+            return next(root, info, **args)
+        finally:
+            _current.reset(token)
+            trace.finish(resolver)
+
+
+class SQLSpans:
+    """Database execute wrapper giving each statement a span."""
+
+    def __call__(self, execute, sql, params, many, context):
+        connection = context['connection']
+        verb = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else 'SQL'
+        with span(f"sql {verb}", CLIENT, **{
+            'db.system': connection.vendor, 'db.name': connection.alias, 'db.statement': sql,
+        }):
+            return execute(sql, params, many, context)
+
+
+def traced(request, handler):
+    """Run ``handler()`` for ``request`` inside a new trace, if tracing is on and the request is sampled."""
+    config = get_config()
+    if config is None or _current.get() is not None or random.random() >= config['SAMPLE_RATE']:
+        return handler()
+    trace = Trace(config['MAX_SPANS'])
+    trace.root = trace.start(f"{request.method} {request.path}", kind=SERVER, attributes={
+        'http.request.method': request.method, 'url.path': request.path,
+    })
+    token = _current.set((trace, trace.root))
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(SQLSpans()))
+            response = handler()
+        trace.root.attributes['http.response.status_code'] = response.status_code
+        return response
+    finally:
+        _current.reset(token)
+        trace.finish(trace.root)
+        if trace.dropped:
+            trace.root.attributes['crm.spans.dropped'] = trace.dropped
+        exporter.submit(config, trace)
+
+
+def _value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def to_otlp(trace, service_name):
+    """The trace as an OTLP/JSON ExportTraceServiceRequest."""
+    spans = []
+    for s in trace.spans:
+        entry = {
+            'traceId': trace.trace_id,
+            'spanId': s.span_id,
+            'name': s.name,
+            'kind': s.kind,
+            'startTimeUnixNano': str(s.start),
+            'endTimeUnixNano': str(s.end or s.start),
+            'attributes': [{'key': key, 'value': _value(value)} for key, value in s.attributes.items()],
+        }
+        if s.parent_id:
+            entry['parentSpanId'] = s.parent_id
+        spans.append(entry)
+    return {'resourceSpans': [{
+        'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': service_name}}]},
+        'scopeSpans': [{'scope': {'name': __name__}, 'spans': spans}],
+    }]}
+
+
+class Exporter:
+    """Exports finished traces from a background thread, so requests never wait on the file or collector."""
+
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=1000)
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def submit(self, config, trace):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='crm-trace-exporter', daemon=True)
+                self.thread.start()
+        try:
+            self.queue.put_nowait((config, trace))
+        except queue.Full:
+            logger.warning("Trace export queue is full, dropping trace %s", trace.trace_id)
+
+    def flush(self):
+        """Wait until every submitted trace has been exported."""
+        self.queue.join()
+
+    def run(self):
+        while True:
+            config, trace = self.queue.get()
+            try:
+                export(config, trace)
+            except Exception:
+                logger.exception("Exporting trace %s failed", trace.trace_id)
+            finally:
+                self.queue.task_done()
+
+
+exporter = Exporter()
+
+
+def export(config, trace):
+    body = json.dumps(to_otlp(trace, config['SERVICE_NAME']), separators=(',', ':'))
+    if config['EXPORTER'] == 'file':
+        path = os.fspath(config['FILE'])
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'a', encoding='utf-8') as fh:
+            fh.write(body + '\n')
+    elif config['EXPORTER'] == 'otlp':
+        request = urllib.request.Request(
+            config['ENDPOINT'], data=body.encode(), headers={'Content-Type': 'application/json'}, method='POST',
+        )
+        with urllib.request.urlopen(request, timeout=5):
+            pass
+    else:
+        raise ValueError(f"Unknown trace exporter: {config['EXPORTER']!r}")
@@ -1,7 +1,7 @@
 from django.urls import path
-from graphene_django.views import GraphQLView
+from .views import CRMGraphQLView
 from django.views.decorators.csrf import csrf_exempt
 
 urlpatterns = [
-    path("graphql", csrf_exempt(GraphQLView.as_view(graphiql=True))),
+    path("graphql", csrf_exempt(CRMGraphQLView.as_view(graphiql=True))),
 ]
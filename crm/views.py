@@ -1,3 +1,59 @@
-from django.shortcuts import render
+from functools import partial
 
-# Create your views here.
+from graphene_django.views import GraphQLView
+
+from . import admission, encoders, http_cache, identity, introspection, profiling, slowlog, tracing
+from .routers import request_scope
+
+
+class CRMGraphQLView(GraphQLView):
+    """
+    GraphQLView with the CRM's per-request behaviour: database routing, an
+    identity map for model instances, cached introspection, admission
+    control, a pluggable JSON encoder, HTTP caching (persisted queries,
+    ETags and compression), on-demand profiling, the slow-operation log and
+    tracing.
+    """
+
+    # Both only mark where a phase starts for tracing (see crm/tracing.py)
+    validation_rules = tracing.VALIDATION_RULES
+    execution_context_class = tracing.TracingExecutionContext
+
+    def dispatch(self, request, *args, **kwargs):
+        # Routing state and loaded rows must not leak into the next request served by this thread
+        with request_scope(), identity.scope():
+            respond = partial(self.respond, request, *args, **kwargs)
+            observed = partial(tracing.traced, request, partial(slowlog.observe, self, request, respond))
+            if profiling.HEADER in request.META:
+                # Profiled requests are still traced and slow-logged; the profile includes that bookkeeping
+                return profiling.profile(self, request, observed)
+            return observed()
+
+    def respond(self, request, *args, **kwargs):
+        # Introspection is charged in full when it runs, and MIN_COST when it comes from the cache
+        response = introspection.cached_response(self, request, partial(admission.admit, self, request))
+        if response is None:
+            response = admission.admit(self, request, partial(super().dispatch, request, *args, **kwargs))
+        return http_cache.finalize(request, response)
+
+    def get_graphql_params(self, request, data):
+        query, variables, operation_name, id = super().get_graphql_params(request, data)
+        return http_cache.resolve_query(request, data, query), variables, operation_name, id
+
+    def execute_graphql_request(self, request, data, query, variables, operation_name, show_graphiql=False):
+        with tracing.phases('graphql.parse', **{'graphql.operation.name': operation_name or ''}):
+            result = super().execute_graphql_request(request, data, query, variables, operation_name, show_graphiql)
+        if result is not None and result.errors:
+            # Keeps the response out of HTTP caches
+            setattr(request, http_cache.ERRORS_ATTRIBUTE, True)
+        return result
+
+    @staticmethod
+    def format_error(error):
+        if isinstance(error, http_cache.PersistedQueryError):
+            return {'message': error.message, 'extensions': {'code': error.code}}
+        return GraphQLView.format_error(error)
+
+    def json_encode(self, request, d, pretty=False):
+        pretty = bool(self.pretty or pretty or request.GET.get('pretty'))
+        return encoders.encode(d, pretty=pretty)
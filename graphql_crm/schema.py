@@ -1,4 +1,2 @@
-import graphene
-from crm.schema import Query, Mutation
-
-schema = graphene.Schema(query=Query, mutation=Mutation)
+# Kept for old imports; the one schema lives in alx_backend_graphql/schema.py
+from alx_backend_graphql.schema import Query, Mutation, schema  # noqa: F401